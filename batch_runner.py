@@ -0,0 +1,153 @@
+"""
+並列バッチシミュレーター
+シード列を固定サイズのチャンクに分けてプロセスプールで実行し、集計結果をマージする
+
+各ランは generate_floor_tree の seed で乱数が決まり、チャンク分割もワーカー数に
+依存しないため、--workers をいくつにしても同じ集計結果になる
+
+使い方:
+    python batch_runner.py --runs 20000 --workers 8
+    python batch_runner.py --runs 5000 --sweep-upgrade max_hp_bonus
+    python batch_runner.py --runs 5000 --sweep-cards
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import battle_engine
+import floor_tree
+import game_data
+import simulator
+from simulator import SimulationStats
+
+# 1タスクあたりのラン数（結果の決定性のためワーカー数とは独立に固定）
+DEFAULT_CHUNK_SIZE = 250
+
+
+def _run_chunk(task: Tuple[int, int, str, Optional[Dict], Optional[List[str]], Optional[floor_tree.MapSpec]]) -> SimulationStats:
+    """ワーカープロセスで1チャンク分のランを実行"""
+    start, stop, bot_name, save_data, extra_cards, map_spec = task
+    return simulator.simulate(range(start, stop), bot_name, save_data, extra_cards, map_spec)
+
+
+def run_batch(seeds: range, bot_name: str = "greedy", save_data: Optional[Dict] = None,
+              extra_cards: Optional[List[str]] = None, workers: Optional[int] = None,
+              chunk_size: int = DEFAULT_CHUNK_SIZE,
+              map_spec: Optional[floor_tree.MapSpec] = None) -> SimulationStats:
+    """
+    シード範囲のランを並列実行して集計
+
+    Args:
+        seeds: 実行するシードの範囲（step=1）
+        bot_name: 使用するボット
+        save_data: 永続データ（アップグレードレベル）
+        extra_cards: 初期デッキに追加するカード名
+        workers: プロセス数（None で CPU 数、1 でプロセスを使わず直列実行）
+        chunk_size: 1タスクあたりのラン数
+        map_spec: マップ仕様（None なら従来の10階層）
+    """
+    tasks = [
+        (start, min(start + chunk_size, seeds.stop), bot_name, save_data, extra_cards, map_spec)
+        for start in range(seeds.start, seeds.stop, chunk_size)
+    ]
+    workers = workers or os.cpu_count() or 1
+
+    stats = SimulationStats()
+    if workers == 1 or len(tasks) == 1:
+        for task in tasks:
+            stats.merge(_run_chunk(task))
+        return stats
+
+    # map は投入順に結果を返すので、マージ順もワーカー数によらない
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        for chunk_stats in executor.map(_run_chunk, tasks):
+            stats.merge(chunk_stats)
+    return stats
+
+# ===== パラメータスイープ =====
+
+def sweep_upgrade(key: str, seeds: range, bot_name: str = "greedy",
+                  base_save: Optional[Dict] = None, workers: Optional[int] = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  map_spec: Optional[floor_tree.MapSpec] = None) -> List[Tuple[int, SimulationStats]]:
+    """アップグレード1種類のレベルを 0〜最大まで変えて比較（workers 以降は run_batch と同じ）"""
+    results = []
+    for level in range(game_data.UPGRADE_COSTS[key]["max_level"] + 1):
+        save_data = dict(base_save or game_data.DEFAULT_UPGRADES)
+        save_data[key] = level
+        results.append((level, run_batch(seeds, bot_name, save_data, workers=workers,
+                                         chunk_size=chunk_size, map_spec=map_spec)))
+    return results
+
+
+def sweep_cards(seeds: range, bot_name: str = "greedy", save_data: Optional[Dict] = None,
+                workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                map_spec: Optional[floor_tree.MapSpec] = None) -> List[Tuple[str, SimulationStats]]:
+    """カードプールの各カードを初期デッキに1枚追加した場合を比較（先頭は追加なし。workers 以降は run_batch と同じ）"""
+    results = [("（追加なし）", run_batch(seeds, bot_name, save_data, workers=workers,
+                                    chunk_size=chunk_size, map_spec=map_spec))]
+    for name in battle_engine.CARD_NAMES:
+        stats = run_batch(seeds, bot_name, save_data, extra_cards=[name], workers=workers,
+                          chunk_size=chunk_size, map_spec=map_spec)
+        results.append((name, stats))
+    return results
+
+
+def format_sweep(title: str, results: List[Tuple[object, SimulationStats]]) -> str:
+    """スイープ結果を表にする"""
+    lines = [f"【{title}】", f"  {'条件':<12} {'勝率':>7} {'平均到達階層':>10}"]
+    for label, stats in results:
+        win_rate = stats.wins / stats.runs if stats.runs else 0
+        mean_floor = sum(f * c for f, c in stats.floor_counts.items()) / stats.runs if stats.runs else 0
+        lines.append(f"  {str(label):<12} {win_rate:>8.1%} {mean_floor:>12.2f}")
+    return "\n".join(lines)
+
+# ===== コマンドライン =====
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="デッキ構築RPGの並列バランスシミュレーター")
+    parser.add_argument("--runs", type=int, default=10000, help="条件ごとのラン数")
+    parser.add_argument("--seed", type=int, default=0, help="最初のシード")
+    parser.add_argument("--bot", choices=sorted(simulator.BOTS), default="greedy", help="使用するボット")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定: CPU数）")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="1タスクあたりのラン数")
+    parser.add_argument("--upgrade", action="append", default=[], metavar="KEY=LEVEL",
+                        help="永続アップグレードのレベル（複数指定可）")
+    parser.add_argument("--depth", type=int, default=None, help="マップの階層数（既定: 10）")
+    parser.add_argument("--dag", action="store_true", help="隣り合うパスが合流するマップ（深いマップ向け）")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--sweep-upgrade", choices=sorted(game_data.UPGRADE_COSTS),
+                       help="指定アップグレードのレベルを変えて比較")
+    group.add_argument("--sweep-cards", action="store_true", help="初期デッキへのカード追加を比較")
+    args = parser.parse_args(argv)
+
+    save_data = simulator.parse_upgrades(args.upgrade)
+    map_spec = simulator.parse_map_spec(args.depth, args.dag)
+    seeds = range(args.seed, args.seed + args.runs)
+    started = time.perf_counter()
+
+    if args.sweep_upgrade:
+        results = sweep_upgrade(args.sweep_upgrade, seeds, args.bot, save_data, args.workers,
+                                args.chunk_size, map_spec)
+        print(format_sweep(f"{args.sweep_upgrade} のレベル別", results))
+        total_runs = args.runs * len(results)
+    elif args.sweep_cards:
+        results = sweep_cards(seeds, args.bot, save_data, args.workers, args.chunk_size, map_spec)
+        print(format_sweep("初期デッキに追加したカード別", results))
+        total_runs = args.runs * len(results)
+    else:
+        stats = run_batch(seeds, args.bot, save_data, workers=args.workers, chunk_size=args.chunk_size,
+                          map_spec=map_spec)
+        print(stats.format_report())
+        total_runs = args.runs
+
+    elapsed = time.perf_counter() - started
+    print("")
+    print(f"所要時間: {elapsed:.2f}秒 ({total_runs / max(elapsed, 1e-9):.0f} ラン/秒)")
+
+
+if __name__ == "__main__":
+    main()
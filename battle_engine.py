@@ -0,0 +1,1121 @@
+"""
+戦闘エンジン（Streamlit非依存）
+カード・敵・元素反応のルールと戦闘状態を管理する
+UIは BattleState を保持してここの関数を呼び出すだけにする
+"""
+
+import bisect
+import itertools
+import random
+from collections import deque
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+# ===== 定数定義 =====
+
+ELEMENT_NONE = "無"
+ELEMENT_FIRE = "炎"
+ELEMENT_WATER = "水"
+ELEMENT_NATURE = "草"
+
+CARD_ATTACK = "攻撃"
+CARD_DEFEND = "防御"
+CARD_BUFF = "バフ"
+CARD_DEBUFF = "デバフ"
+CARD_DRAW = "ドロー"
+
+# 休憩所バフ（戦闘中ずっと有効）を表す持続ターン
+BUFF_WHOLE_BATTLE = 999
+
+# 基本の手札枚数
+BASE_HAND_SIZE = 5
+
+# ===== カードデータベース =====
+# カードの定義は読み込み時に1回だけ作る不変のカタログ（名前 → 読み取り専用の辞書）。
+# デッキ・手札・ショップが持つのは Card（定義への参照と固有ID）だけで、定義の辞書は共有する
+
+_CARD_TABLE = [
+    # 攻撃カード（高コストほどコスト効率良く）
+    {"name": "基本攻撃", "type": CARD_ATTACK, "cost": 1, "element": ELEMENT_NONE, "damage": 10, "description": "ダメージ10"},
+    {"name": "火球", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_FIRE, "damage": 22, "description": "ダメージ22 + 炎付与"},
+    {"name": "水鉄砲", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_WATER, "damage": 22, "description": "ダメージ22 + 水付与"},
+    {"name": "草の鞭", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_NATURE, "damage": 22, "description": "ダメージ22 + 草付与"},
+    {"name": "メテオ", "type": CARD_ATTACK, "cost": 3, "element": ELEMENT_FIRE, "damage": 40, "description": "ダメージ40 + 炎付与"},
+    {"name": "大洪水", "type": CARD_ATTACK, "cost": 3, "element": ELEMENT_WATER, "damage": 40, "description": "ダメージ40 + 水付与"},
+    {"name": "森の怒り", "type": CARD_ATTACK, "cost": 3, "element": ELEMENT_NATURE, "damage": 40, "description": "ダメージ40 + 草付与"},
+    {"name": "烈火斬", "type": CARD_ATTACK, "cost": 4, "element": ELEMENT_FIRE, "damage": 60, "description": "ダメージ60 + 炎付与"},
+
+    # 防御カード（バランス調整）
+    {"name": "基本防御", "type": CARD_DEFEND, "cost": 1, "element": ELEMENT_NONE, "shield": 8, "description": "シールド8獲得"},
+    {"name": "鉄壁", "type": CARD_DEFEND, "cost": 2, "element": ELEMENT_NONE, "shield": 20, "description": "シールド20獲得"},
+    {"name": "完全防御", "type": CARD_DEFEND, "cost": 3, "element": ELEMENT_NONE, "shield": 38, "description": "シールド38獲得"},
+
+    # バフカード（効果を抑えて持続を長く）
+    {"name": "闘志", "type": CARD_BUFF, "cost": 1, "element": ELEMENT_NONE, "buff_value": 0.15, "buff_duration": 2, "description": "攻撃力+15% 2ターン"},
+    {"name": "集中", "type": CARD_BUFF, "cost": 2, "element": ELEMENT_NONE, "buff_value": 0.3, "buff_duration": 3, "description": "攻撃力+30% 3ターン"},
+    {"name": "覚醒", "type": CARD_BUFF, "cost": 3, "element": ELEMENT_NONE, "buff_value": 0.6, "buff_duration": 2, "description": "攻撃力+60% 2ターン"},
+
+    # ドローカード（コスト調整）
+    {"name": "占い", "type": CARD_DRAW, "cost": 1, "element": ELEMENT_NONE, "draw_count": 1, "description": "カード1枚ドロー"},
+    {"name": "策略", "type": CARD_DRAW, "cost": 2, "element": ELEMENT_NONE, "draw_count": 2, "description": "カード2枚ドロー"},
+    {"name": "大量ドロー", "type": CARD_DRAW, "cost": 3, "element": ELEMENT_NONE, "draw_count": 3, "description": "カード3枚ドロー"},
+
+    # デバフカード（敵を弱体化）
+    {"name": "威圧", "type": CARD_DEBUFF, "cost": 1, "element": ELEMENT_NONE, "debuff_type": "weaken", "debuff_value": 0.25, "debuff_duration": 2, "description": "敵の攻撃力-25% 2ターン"},
+    {"name": "束縛", "type": CARD_DEBUFF, "cost": 2, "element": ELEMENT_NONE, "debuff_type": "stun", "debuff_value": 1, "debuff_duration": 1, "description": "敵を1ターン行動不能にする"},
+    {"name": "毒霧", "type": CARD_DEBUFF, "cost": 2, "element": ELEMENT_NATURE, "debuff_type": "poison", "debuff_value": 8, "debuff_duration": 4, "description": "毒: 4ターン間毎ターン8ダメージ + 草付与"},
+    {"name": "呪縛", "type": CARD_DEBUFF, "cost": 3, "element": ELEMENT_NONE, "debuff_type": "weaken", "debuff_value": 0.5, "debuff_duration": 3, "description": "敵の攻撃力-50% 3ターン"},
+    {"name": "氷結", "type": CARD_DEBUFF, "cost": 2, "element": ELEMENT_WATER, "debuff_type": "freeze", "debuff_value": 0.3, "debuff_duration": 2, "description": "敵の攻撃力-30% 2ターン + 水付与"},
+
+    # 複合カード
+    {"name": "連撃", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_NONE, "damage": 15, "draw_count": 1, "description": "ダメージ15 + カード1枚ドロー"},
+    {"name": "防壁術", "type": CARD_DEFEND, "cost": 1, "element": ELEMENT_NONE, "shield": 12, "buff_value": 0.1, "buff_duration": 1, "description": "シールド12 + 攻撃+10% 1ターン"},
+    {"name": "魔力強化", "type": CARD_BUFF, "cost": 2, "element": ELEMENT_NONE, "buff_value": 0.25, "buff_duration": 2, "draw_count": 1, "description": "攻撃+25% 2ターン + ドロー1枚"},
+    {"name": "急速成長", "type": CARD_DRAW, "cost": 2, "element": ELEMENT_NATURE, "draw_count": 2, "damage": 10, "description": "カード2枚ドロー + ダメージ10"},
+]
+
+CARD_CATALOG: Mapping[str, Mapping[str, Any]] = MappingProxyType(
+    {definition["name"]: MappingProxyType(definition) for definition in _CARD_TABLE}
+)
+CARD_NAMES: Tuple[str, ...] = tuple(CARD_CATALOG)
+
+# 初期デッキの構成（カード名 × 枚数）
+STARTER_DECK: Tuple[Tuple[str, int], ...] = (
+    ("基本攻撃", 3),
+    # 元素攻撃カード
+    ("火球", 1),
+    ("水鉄砲", 1),
+    ("草の鞭", 1),
+    ("基本防御", 2),
+    ("占い", 2),
+)
+
+_instance_ids = itertools.count(1)
+
+
+class Card(Mapping):
+    """
+    カードの実体（カタログの定義への参照 + 固有ID）
+
+    辞書と同じように card["name"] / card.get("damage", 0) で読める。
+    錬金術などで強化した値だけを overrides に持ち、定義は書き換えない
+    """
+
+    __slots__ = ("definition", "instance_id", "overrides", "_ops")
+
+    def __init__(self, definition: Mapping[str, Any], instance_id: Optional[int] = None,
+                 overrides: Optional[Dict[str, Any]] = None):
+        self.definition = definition
+        self.instance_id = next(_instance_ids) if instance_id is None else instance_id
+        self.overrides = overrides
+        self._ops = None
+
+    @property
+    def name(self) -> str:
+        return self.definition["name"]
+
+    @property
+    def ops(self) -> Tuple[tuple, ...]:
+        """効果命令の列（強化されていなければカタログのコンパイル結果を共有）"""
+        if self.overrides is None:
+            return CARD_OPS[self.name]
+        if self._ops is None:
+            self._ops = compile_card(self)
+        return self._ops
+
+    def __getitem__(self, key: str) -> Any:
+        if self.overrides is not None and key in self.overrides:
+            return self.overrides[key]
+        return self.definition[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.definition
+        if self.overrides is not None:
+            yield from (key for key in self.overrides if key not in self.definition)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __eq__(self, other) -> bool:
+        # 同じ名前のカードでも別の実体は区別する
+        return self is other
+
+    def __hash__(self) -> int:
+        return hash(self.instance_id)
+
+    def __repr__(self) -> str:
+        return f"Card({self.name!r}, id={self.instance_id})"
+
+    def __reduce__(self):
+        # 定義は名前で引き直す（MappingProxyType は pickle できない）
+        return (_restore_card, (self.name, self.instance_id, self.overrides))
+
+    def upgrade(self, key: str, value: Any):
+        """この実体だけ数値を書き換える（定義や同じ名前の他のカードには影響しない）"""
+        if self.overrides is None:
+            self.overrides = {}
+        self.overrides[key] = value
+        self._ops = None
+
+
+def _restore_card(name: str, instance_id: int, overrides: Optional[Dict[str, Any]]) -> Card:
+    return Card(CARD_CATALOG[name], instance_id, overrides)
+
+
+def create_card(name: str) -> Card:
+    """カタログのカードを1枚作成"""
+    return Card(CARD_CATALOG[name])
+
+
+def create_basic_cards() -> List[Card]:
+    """基本カードセット（カタログの全カードを1枚ずつ）を作成"""
+    return [Card(definition) for definition in CARD_CATALOG.values()]
+
+def create_starter_deck() -> List[Card]:
+    """初期デッキを作成"""
+    return [create_card(name) for name, count in STARTER_DECK for _ in range(count)]
+
+# ===== 元素反応システム =====
+# 元素は小さな整数コードに変換し、(付着中の元素, 新しい元素) の表を引くだけで反応が決まる。
+# 表もログの文字列も読み込み時に1回だけ作る
+
+# 元素コード（敵の「付着なし」とカードの「無属性」はどちらも 0）
+ELEMENT_CODES: Dict[Optional[str], int] = {
+    None: 0,
+    ELEMENT_NONE: 0,
+    ELEMENT_FIRE: 1,
+    ELEMENT_WATER: 2,
+    ELEMENT_NATURE: 3,
+}
+ELEMENT_COUNT = 4
+
+
+@dataclass(frozen=True)
+class Reaction:
+    """元素反応"""
+    name: str      # 反応名（ダメージ表示にも使う）
+    bonus: int     # 追加ダメージ
+    type: str      # "burn" / "vaporize" / "bloom"
+    label: str     # 効果の説明
+    message: str = ""  # ログの文（省略時は名前と説明から作る）
+
+    def __post_init__(self):
+        if not self.message:
+            object.__setattr__(self, "message", f"⚡元素反応 {self.name}！ {self.label}")
+
+
+# 反応する元素の組み合わせ（順序は問わない）
+REACTIONS: Tuple[Tuple[str, str, Reaction], ...] = (
+    (ELEMENT_FIRE, ELEMENT_NATURE, Reaction("🔥燃焼", 12, "burn", "持続ダメージ発動！")),
+    (ELEMENT_FIRE, ELEMENT_WATER, Reaction("💧蒸発", 30, "vaporize", "大ダメージ！")),
+    (ELEMENT_WATER, ELEMENT_NATURE, Reaction("🌿成長", 25, "bloom", "自然の力！")),
+)
+
+
+def _build_reaction_table() -> Tuple[Tuple[Optional[Reaction], ...], ...]:
+    table = [[None] * ELEMENT_COUNT for _ in range(ELEMENT_COUNT)]
+    for first, second, reaction in REACTIONS:
+        a, b = ELEMENT_CODES[first], ELEMENT_CODES[second]
+        table[a][b] = table[b][a] = reaction
+    return tuple(tuple(row) for row in table)
+
+
+# REACTION_TABLE[付着中の元素コード][新しい元素コード] → Reaction（反応しなければ None）
+REACTION_TABLE = _build_reaction_table()
+
+
+def check_element_reaction(current_element: Optional[str], new_element: str) -> Optional[Reaction]:
+    """元素反応をチェック（反応しなければ None）"""
+    return REACTION_TABLE[ELEMENT_CODES[current_element]][ELEMENT_CODES[new_element]]
+
+# ===== 敵データ =====
+
+def create_enemy_data(name: str, difficulty: int) -> dict:
+    """敵データを作成（改善版：10%削弱）"""
+    # ゲームバランス調整：敵を約10%削弱
+    hp_base = (45 + difficulty * 12) * 0.9  # 10%削弱
+    attack_base = (6 + difficulty * 1.2) * 0.9  # 10%削弱
+
+    return {
+        "name": name,
+        "max_hp": int(hp_base),
+        "hp": int(hp_base),
+        "attack": int(attack_base),
+        "shield": 0,
+        "element": None,
+        "element_duration": 0,
+        "burn": 0,
+        "burn_duration": 0,
+        "next_action": "attack",
+        # デバフフィールド
+        "debuff_weaken": 0,
+        "debuff_weaken_duration": 0,
+        "stunned": False,
+        "poison": 0,
+        "poison_duration": 0,
+    }
+
+def get_action_description(action: str) -> tuple[str, str]:
+    """行動の説明とアイコンを取得"""
+    descriptions = {
+        "attack": ("通常攻撃", "⚔️"),
+        "big_attack": ("強攻撃 (1.5倍)", "💥"),
+        "defend": ("防御態勢 (ダメージ半減)", "🛡️"),
+    }
+    return descriptions.get(action, ("不明", "❓"))
+
+# ===== 敵AI（行動方針の表） =====
+# 敵の行動は「状況 → (行動, 累積重み)」の表で決める。状況は敵HP・シールド・プレイヤーの状態の区分で、
+# 毎ターンの決定は区分を求めて randrange + bisect で1回引くだけ（リストを作らない）
+
+ENEMY_ACTIONS = ("attack", "big_attack", "defend")
+
+# 状況の区分（enemy_situation で決める）
+(SITUATION_DYING,                # 敵HP 25%未満
+ SITUATION_LOW_HP,               # 敵HP 50%未満・シールド10未満
+ SITUATION_LOW_HP_SHIELDED,      # 敵HP 50%未満・シールドあり
+ SITUATION_MID_HP_PLAYER_BUFFED, # 敵HP 75%未満・プレイヤーがバフ中
+ SITUATION_MID_HP,               # 敵HP 75%未満
+ SITUATION_HIGH_HP_PLAYER_HEALTHY,  # 敵HP 75%以上・プレイヤーHP 70%超
+ SITUATION_HIGH_HP_PLAYER_HURT,     # 敵HP 75%以上・プレイヤーHP 70%以下
+ ) = range(7)
+SITUATION_COUNT = 7
+
+
+@dataclass(frozen=True)
+class EnemyPolicy:
+    """敵の行動方針（状況ごとの行動と累積重み。make_enemy_policy で作る）"""
+    name: str
+    actions: Tuple[Tuple[str, ...], ...]       # [状況] → 行動
+    cum_weights: Tuple[Tuple[int, ...], ...]   # [状況] → 行動の累積重み
+    totals: Tuple[int, ...]                    # [状況] → 重みの合計
+
+    def choose(self, situation: int, rng: random.Random) -> str:
+        """状況に応じて行動を1つ選ぶ"""
+        roll = rng.randrange(self.totals[situation])
+        return self.actions[situation][bisect.bisect_right(self.cum_weights[situation], roll)]
+
+
+def make_enemy_policy(name: str, weights: Sequence[Sequence[Tuple[str, int]]]) -> EnemyPolicy:
+    """
+    状況ごとの [(行動, 整数の重み), ...] から行動方針を作る
+
+    Args:
+        name: 方針の名前
+        weights: SITUATION_* の順に並べた各状況の重み
+    """
+    if len(weights) != SITUATION_COUNT:
+        raise ValueError(f"状況は{SITUATION_COUNT}区分必要です: {len(weights)}")
+    actions, cum_weights = [], []
+    for row in weights:
+        row = [(action, weight) for action, weight in row if weight > 0]
+        if not row or any(action not in ENEMY_ACTIONS for action, _ in row):
+            raise ValueError(f"不正な行動の重み: {row}")
+        actions.append(tuple(action for action, _ in row))
+        cum_weights.append(tuple(itertools.accumulate(weight for _, weight in row)))
+    return EnemyPolicy(name, tuple(actions), tuple(cum_weights), tuple(c[-1] for c in cum_weights))
+
+
+# 標準の方針（瀕死なら防御優先、HPに余裕があるほど攻撃的）
+DEFAULT_ENEMY_POLICY = make_enemy_policy("標準", (
+    (("defend", 6), ("big_attack", 2), ("attack", 2)),  # 瀕死：防御優先で生き延びる
+    (("defend", 5), ("big_attack", 3), ("attack", 2)),  # 低HP・シールドなし：防御寄り
+    (("big_attack", 4), ("attack", 4), ("defend", 2)),  # 低HP・シールドあり：反撃
+    (("defend", 4), ("big_attack", 4), ("attack", 2)),  # 中HP・プレイヤーがバフ中：守りを固める
+    (("big_attack", 4), ("attack", 5), ("defend", 1)),  # 中HP：バランスの取れた攻撃
+    (("big_attack", 5), ("attack", 4), ("defend", 1)),  # 高HP・プレイヤーHP多い：大攻撃で圧力
+    (("big_attack", 6), ("attack", 3), ("defend", 1)),  # 高HP・プレイヤーHP少ない：強気で攻撃
+))
+
+# 敵ごとの方針（種族ごとの性格を付ける場合はここを差し替える。未登録の敵は標準）
+ENEMY_POLICIES: Dict[str, EnemyPolicy] = {
+    "スライム": DEFAULT_ENEMY_POLICY,
+    "ゴブリン": DEFAULT_ENEMY_POLICY,
+    "オーク": DEFAULT_ENEMY_POLICY,
+    "ドラゴン": DEFAULT_ENEMY_POLICY,
+    "魔法使い": DEFAULT_ENEMY_POLICY,
+}
+
+# ===== 戦闘ログ =====
+# ログは文字列ではなく (種類, 対象, 量, 元素, 追加情報) のイベントとして固定長のリングバッファに溜める。
+# 文字列にするのは表示するとき（format_log）だけなので、画面のないシミュレーションでは整形しない
+
+BATTLE_LOG_SIZE = 200  # 保持するイベント数（古いものから捨てる）
+
+ACTOR_PLAYER = "player"
+ACTOR_ENEMY = "enemy"
+
+LOG_BATTLE_START = "battle_start"        # 追加情報: (戦闘番号, 敵の名前)
+LOG_RESHUFFLE = "reshuffle"
+LOG_CARD_PLAYED = "card_played"          # 量: コスト, 追加情報: (カード名,)
+LOG_NO_ENERGY = "no_energy"              # 量: 必要コスト, 追加情報: (残りエネルギー,)
+LOG_ELEMENT_APPLIED = "element_applied"
+LOG_ELEMENT_BLOCKED = "element_blocked"  # 反応直後で付着しなかった
+LOG_DAMAGE_BUFFED = "damage_buffed"      # 量: 強化後, 追加情報: (強化前,)
+LOG_REACTION = "reaction"                # 量: 反応ボーナス, 追加情報: (Reaction,)
+LOG_BURN_APPLIED = "burn_applied"        # 量: 毎ターンのダメージ, 追加情報: (ターン数,)
+LOG_HEAL = "heal"                        # 追加情報: (現在HP, 最大HP)
+LOG_SHIELD_BLOCK = "shield_block"        # 量: 防いだ量, 追加情報: (残りダメージ,)
+LOG_SHIELD_FULL_BLOCK = "shield_full_block"  # 量: 防いだ量, 追加情報: (残りシールド,)
+LOG_DAMAGE = "damage"                    # 追加情報: (残りHP, 最大HP[, 基本, 反応ボーナス, シールドで防いだ量])
+LOG_SHIELD_GAIN = "shield_gain"          # 追加情報: (現在のシールド,)
+LOG_BUFF = "buff"                        # 量: %, 追加情報: (ターン数, 合計% または None=追加効果)
+LOG_DRAW = "draw"                        # 追加情報: (手札の枚数, 追加効果か)
+LOG_WEAKEN = "weaken"                    # 量: %, 追加情報: (ターン数,)
+LOG_STUN = "stun"
+LOG_POISON = "poison"                    # 追加情報: (ターン数,)
+LOG_FREEZE = "freeze"                    # 量: %, 追加情報: (ターン数,)
+LOG_ENEMY_TURN = "enemy_turn"
+LOG_POISON_DAMAGE = "poison_damage"      # 追加情報: (残りターン,)
+LOG_BURN_DAMAGE = "burn_damage"          # 追加情報: (残りターン,)
+LOG_STUNNED = "stunned"
+LOG_ENEMY_ACTION = "enemy_action"        # 追加情報: (行動[, 現在のシールド])
+LOG_WEAKENED_ATTACK = "weakened_attack"  # 量: 弱体化後, 追加情報: (%, 弱体化前)
+LOG_WEAKEN_EXPIRED = "weaken_expired"
+LOG_DISCARD = "discard"
+
+
+class LogEvent(NamedTuple):
+    """戦闘ログの1件（表示用の文字列は format_log_event で作る）"""
+    kind: str
+    actor: str = ""
+    amount: int = 0
+    element: Optional[str] = None
+    extra: tuple = ()
+
+
+class BattleLog:
+    """
+    固定長の戦闘ログ（collections.deque のリングバッファ）
+
+    長い戦闘でもメモリは BATTLE_LOG_SIZE 件で頭打ちになる。
+    position は追加した総数なので、「ここから後のログ」は position を覚えておいて since で取る
+    """
+
+    __slots__ = ("events", "count")
+
+    def __init__(self, size: int = BATTLE_LOG_SIZE):
+        self.events: Deque[LogEvent] = deque(maxlen=size)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def __iter__(self) -> Iterator[LogEvent]:
+        return iter(self.events)
+
+    def add(self, kind: str, actor: str = "", amount: int = 0, element: Optional[str] = None, *extra):
+        self.events.append(LogEvent(kind, actor, amount, element, extra))
+        self.count += 1
+
+    @property
+    def position(self) -> int:
+        """これまでに追加したイベントの総数"""
+        return self.count
+
+    def since(self, position: int) -> List[LogEvent]:
+        """position 以降に追加されたイベント（バッファから溢れた分は含まない）"""
+        new = self.count - position
+        if new <= 0:
+            return []
+        return list(itertools.islice(self.events, max(len(self.events) - new, 0), None))
+
+    def latest(self, n: int) -> List[LogEvent]:
+        """最新の n 件"""
+        return list(itertools.islice(self.events, max(len(self.events) - n, 0), None))
+
+    def clear(self):
+        self.events.clear()
+        self.count = 0
+
+
+def _format_damage(e: LogEvent) -> str:
+    if e.actor == ACTOR_PLAYER:
+        return f"💔 {e.amount}ダメージを受けた！ (残りHP: {e.extra[0]}/{e.extra[1]})"
+    hp, max_hp, base, bonus, blocked = e.extra
+    if bonus > 0:
+        return f"⚔️ {e.amount}ダメージ！ (基本{base} + 反応{bonus} - シールド{blocked}) → 残りHP: {hp}/{max_hp}"
+    return f"⚔️ {e.amount}ダメージ！ → 残りHP: {hp}/{max_hp}"
+
+
+def _format_enemy_action(e: LogEvent) -> str:
+    action = e.extra[0]
+    desc, icon = get_action_description(action)
+    if action == "defend":
+        return f"{icon} 敵は{desc}を取った！ シールド+{e.amount} (現在: {e.extra[1]})"
+    return f"{icon} 敵の{desc}！"
+
+
+def _format_buff(e: LogEvent) -> str:
+    duration, total = e.extra
+    if total is None:
+        return f"💪 さらに攻撃力+{e.amount}% {duration}ターン！"
+    return f"💪 攻撃力+{e.amount}% {duration}ターン！（現在: +{total}%）"
+
+
+def _shield_owner(e: LogEvent) -> str:
+    return "敵のシールド" if e.actor == ACTOR_ENEMY else "シールド"
+
+
+LOG_FORMATS: Dict[str, Callable[[LogEvent], str]] = {
+    LOG_BATTLE_START: lambda e: f"⚔️ 第{e.extra[0]}戦: {e.extra[1]}との戦闘開始！",
+    LOG_RESHUFFLE: lambda e: "🔄 捨て札をシャッフルしてデッキに戻しました",
+    LOG_CARD_PLAYED: lambda e: f"🎴 {e.extra[0]} を使用！（コスト{e.amount}）",
+    LOG_NO_ENERGY: lambda e: f"❌ エネルギー不足！（必要: {e.amount}, 残り: {e.extra[0]}）",
+    LOG_ELEMENT_APPLIED: lambda e: f"{ELEMENT_LOG_ICONS.get(e.element, '✨')} 敵に{e.element}を付与！",
+    LOG_ELEMENT_BLOCKED: lambda e: f"⏳ 反応直後のため{e.element}は付着しなかった",
+    LOG_DAMAGE_BUFFED: lambda e: f"💪 バフ効果で{e.extra[0]} → {e.amount}ダメージに強化！",
+    LOG_REACTION: lambda e: e.extra[0].message,
+    LOG_BURN_APPLIED: lambda e: f"🔥 燃焼付与！ {e.extra[0]}ターンの間、毎ターン{e.amount}ダメージ",
+    LOG_HEAL: lambda e: f"🌿 HP回復！ +{e.amount} (現在: {e.extra[0]}/{e.extra[1]})",
+    LOG_SHIELD_BLOCK: lambda e: f"🛡️ {_shield_owner(e)}で{e.amount}ダメージを防いだ！ (残り{e.extra[0]}ダメージ)",
+    LOG_SHIELD_FULL_BLOCK: lambda e: f"🛡️ {_shield_owner(e)}で{e.amount}ダメージを完全に防いだ！ (残りシールド: {e.extra[0]})",
+    LOG_DAMAGE: _format_damage,
+    LOG_SHIELD_GAIN: lambda e: f"🛡️ シールド{e.amount}獲得！（現在: {e.extra[0]}）",
+    LOG_BUFF: _format_buff,
+    LOG_DRAW: lambda e: f"📥 カード{e.amount}枚{'追加ドロー' if e.extra[1] else 'ドロー'}！（手札: {e.extra[0]}枚）",
+    LOG_WEAKEN: lambda e: f"💀 敵に弱体化付与！ 攻撃力-{e.amount}% {e.extra[0]}ターン",
+    LOG_STUN: lambda e: "💀 敵をスタン！ 次のターン行動不能",
+    LOG_POISON: lambda e: f"☠️ 毒付与！ {e.extra[0]}ターン間毎ターン{e.amount}ダメージ",
+    LOG_FREEZE: lambda e: f"❄️ 氷結付与！ 攻撃力-{e.amount}% {e.extra[0]}ターン",
+    LOG_ENEMY_TURN: lambda e: "--- 👾 敵のターン ---",
+    LOG_POISON_DAMAGE: lambda e: f"☠️ 毒ダメージ！ {e.amount}ダメージ (残り{e.extra[0]}ターン)",
+    LOG_BURN_DAMAGE: lambda e: f"🔥 燃焼ダメージ！ {e.amount}ダメージ (残り{e.extra[0]}ターン)",
+    LOG_STUNNED: lambda e: "💫 敵はスタン中！ 行動できない",
+    LOG_ENEMY_ACTION: _format_enemy_action,
+    LOG_WEAKENED_ATTACK: lambda e: f"⬇️ 弱体化中 (-{e.extra[0]}%): {e.extra[1]} → {e.amount}",
+    LOG_WEAKEN_EXPIRED: lambda e: "✅ 敵の弱体化が解除された",
+    LOG_DISCARD: lambda e: f"🗑️ {e.amount}枚のカードを破棄",
+}
+
+
+def format_log_event(event: LogEvent) -> str:
+    """ログイベントを表示用の文字列にする"""
+    return LOG_FORMATS[event.kind](event)
+
+
+def format_log(events: Iterable[LogEvent]) -> List[str]:
+    """ログイベントの並びを表示用の文字列のリストにする"""
+    return [format_log_event(e) for e in events]
+
+# ===== 戦闘状態 =====
+
+class DrawPile:
+    """
+    山札（シャッフル済みのリスト + 次に引く位置）
+
+    引くのは位置を進めるだけで O(1)（先頭からの pop(0) はしない）。
+    山札の作り直しは持っているリストを使い回してその場でシャッフルする
+    """
+
+    __slots__ = ("cards", "cursor")
+
+    def __init__(self, cards: Optional[List[Card]] = None):
+        self.cards: List[Card] = cards if cards is not None else []
+        self.cursor = 0
+
+    def __len__(self) -> int:
+        return len(self.cards) - self.cursor
+
+    def __iter__(self) -> Iterator[Card]:
+        return itertools.islice(self.cards, self.cursor, None)
+
+    def draw(self) -> Card:
+        """1枚引く（空なら IndexError）"""
+        card = self.cards[self.cursor]
+        self.cursor += 1
+        return card
+
+    def refill(self, cards: List[Card], rng: random.Random):
+        """cards の内容で山札を作り直してシャッフル（cards 自体は変更しない）"""
+        self.cards[:] = cards
+        self.cursor = 0
+        rng.shuffle(self.cards)
+
+    def swap_in(self, cards: List[Card], rng: random.Random) -> List[Card]:
+        """
+        cards のリストをそのまま山札にしてシャッフルし、使い終わった山札のリストを空にして返す
+        （捨て札を戻す時にコピーせずリストを入れ替える）
+        """
+        used = self.cards
+        del used[:]
+        self.cards = cards
+        self.cursor = 0
+        rng.shuffle(cards)
+        return used
+
+
+@dataclass
+class BattleState:
+    """1ランを通したプレイヤーと現在の敵の戦闘状態"""
+    player_hp: int
+    player_max_hp: int
+    max_energy: int
+    energy: int = 0
+    shield: int = 0
+    attack_buff: float = 0
+    attack_buff_duration: int = 0
+    element_reaction_cooldown: int = 0  # 元素反応直後の付着不可ターン
+    draw_bonus: int = 0                 # アップグレードによるドロー枚数ボーナス
+    # 乱数ストリーム（セッション間で共有しないよう戦闘状態ごとに持つ）
+    deck_rng: random.Random = field(default_factory=random.Random)    # 山札のシャッフル
+    enemy_rng: random.Random = field(default_factory=random.Random)   # 敵の行動決定
+    deck: DrawPile = field(default_factory=DrawPile)     # 山札
+    hand: List[Card] = field(default_factory=list)       # 手札
+    discard: List[Card] = field(default_factory=list)    # 捨て札
+    enemy: Optional[dict] = None
+    battle_log: BattleLog = field(default_factory=BattleLog)
+    # UI向けの演出情報（表示したらUI側でクリアする）
+    damage_effect: Optional[dict] = None
+    energy_effect: Optional[dict] = None
+    screen_shake: bool = False
+    screen_flash: Optional[str] = None
+
+    @property
+    def enemy_defeated(self) -> bool:
+        """敵を倒したか"""
+        return self.enemy is not None and self.enemy["hp"] <= 0
+
+    @property
+    def player_defeated(self) -> bool:
+        """プレイヤーが倒れたか"""
+        return self.player_hp <= 0
+
+# ===== ゲームロジック =====
+
+def draw_cards(state: BattleState, count: int):
+    """カードをドローする"""
+    for _ in range(count):
+        if len(state.deck) == 0:
+            # デッキが空なら捨て札をシャッフルして戻す
+            if len(state.discard) == 0:
+                break
+            # 捨て札のリストを山札と入れ替える（空になった山札のリストが次の捨て札になる）
+            state.discard = state.deck.swap_in(state.discard, state.deck_rng)
+            state.battle_log.add(LOG_RESHUFFLE)
+
+        state.hand.append(state.deck.draw())
+
+# ===== カード効果 =====
+# カードは1回だけ効果命令のタプル列 (命令, 引数...) にコンパイルし、play_card はそれを順に実行する。
+# 命令の並びはカードの種類ごとに CARD_TYPE_OPS で決め、各命令はカードの値から OP_BUILDERS が作る
+# （値がない命令は飛ばす）。新しい種類のカードは表に足すだけで play_card は変えなくてよい
+
+OP_DAMAGE = "damage"                # (OP_DAMAGE, 基本ダメージ, 元素)  元素反応・シールド込みで敵にダメージ
+OP_SHIELD = "shield"                # (OP_SHIELD, シールド量)
+OP_BUFF = "buff"                    # (OP_BUFF, 攻撃力倍率, ターン数, 追加効果か)
+OP_DEBUFF = "debuff"                # (OP_DEBUFF, 種類, 値, ターン数)
+OP_DRAW = "draw"                    # (OP_DRAW, 枚数, 追加効果か)
+OP_APPLY_ELEMENT = "apply_element"  # (OP_APPLY_ELEMENT, 元素)  反応なしで敵に元素を付与
+OP_EXTRA_DAMAGE = "extra_damage"    # (OP_EXTRA_DAMAGE, 基本ダメージ, 元素)  複合ダメージ（反応はボーナスのみ）
+
+# カードの種類ごとの命令の並び（2番目以降は「追加効果」としてログを出す）
+CARD_TYPE_OPS: Dict[str, Tuple[str, ...]] = {
+    CARD_ATTACK: (OP_DAMAGE, OP_DRAW),
+    CARD_DEFEND: (OP_SHIELD, OP_BUFF),
+    CARD_BUFF: (OP_BUFF, OP_DRAW),
+    CARD_DEBUFF: (OP_DEBUFF, OP_APPLY_ELEMENT),
+    CARD_DRAW: (OP_DRAW, OP_EXTRA_DAMAGE),
+}
+
+# 命令ごとに (カード, 追加効果か) から命令を作る。対象の値がなければ None
+OP_BUILDERS: Dict[str, Callable[[Mapping[str, Any], bool], Optional[tuple]]] = {
+    OP_DAMAGE: lambda card, extra: (
+        (OP_DAMAGE, card["damage"], card.get("element", ELEMENT_NONE)) if card.get("damage") else None),
+    OP_SHIELD: lambda card, extra: (OP_SHIELD, card.get("shield", 0)),
+    OP_BUFF: lambda card, extra: (
+        (OP_BUFF, card["buff_value"], card.get("buff_duration", 1), extra) if card.get("buff_value") else None),
+    OP_DEBUFF: lambda card, extra: (
+        (OP_DEBUFF, card["debuff_type"], card.get("debuff_value", 0), card.get("debuff_duration", 1))
+        if card.get("debuff_type") else None),
+    OP_DRAW: lambda card, extra: (OP_DRAW, card["draw_count"], extra) if card.get("draw_count") else None,
+    OP_APPLY_ELEMENT: lambda card, extra: (
+        (OP_APPLY_ELEMENT, card["element"]) if card.get("element", ELEMENT_NONE) != ELEMENT_NONE else None),
+    OP_EXTRA_DAMAGE: lambda card, extra: (
+        (OP_EXTRA_DAMAGE, card["damage"], card.get("element", ELEMENT_NONE)) if card.get("damage") else None),
+}
+
+# ダメージ表示の色（元素ごと）
+DAMAGE_COLORS = {
+    ELEMENT_FIRE: "#ff4444",      # 炎: 赤
+    ELEMENT_WATER: "#4488ff",     # 水: 青
+    ELEMENT_NATURE: "#44ff44",    # 草: 緑
+    ELEMENT_NONE: "#ff6b6b",      # 無: ピンク
+}
+
+# 元素付与のログのアイコン
+ELEMENT_LOG_ICONS = {
+    ELEMENT_FIRE: "🔥",
+    ELEMENT_WATER: "💧",
+    ELEMENT_NATURE: "🌿",
+}
+
+
+def compile_card(card: Mapping[str, Any]) -> Tuple[tuple, ...]:
+    """カードを効果命令のタプル列にコンパイル"""
+    ops = []
+    for op_name in CARD_TYPE_OPS.get(card.get("type"), ()):
+        op = OP_BUILDERS[op_name](card, bool(ops))
+        if op is not None:
+            ops.append(op)
+    return tuple(ops)
+
+
+def _attach_element(state: BattleState, element: str):
+    """敵に元素を付与（反応直後のクールダウン中は付かない）"""
+    enemy = state.enemy
+    if state.element_reaction_cooldown == 0:
+        enemy["element"] = element
+        enemy["element_duration"] = 2
+        state.battle_log.add(LOG_ELEMENT_APPLIED, ACTOR_ENEMY, 0, element)
+    else:
+        state.battle_log.add(LOG_ELEMENT_BLOCKED, ACTOR_ENEMY, 0, element)
+
+
+def _op_damage(state: BattleState, base_damage: int, element: str):
+    """ダメージ（バフ → 元素反応 → シールド → HP の順に解決）"""
+    enemy = state.enemy
+    total_damage = base_damage
+    if state.attack_buff_duration > 0:
+        total_damage = int(total_damage * (1 + state.attack_buff))
+        state.battle_log.add(LOG_DAMAGE_BUFFED, ACTOR_PLAYER, total_damage, element, base_damage)
+
+    # 元素反応チェック
+    reaction = REACTION_TABLE[ELEMENT_CODES[enemy["element"]]][ELEMENT_CODES[element]]
+
+    reaction_bonus = 0
+    if reaction is not None:
+        state.battle_log.add(LOG_REACTION, ACTOR_ENEMY, reaction.bonus, element, reaction)
+        reaction_bonus = reaction.bonus
+        total_damage += reaction.bonus
+
+        # 燃焼反応の場合、持続ダメージを設定
+        if reaction.type == "burn":
+            enemy["burn"] = 10  # 毎ターン10ダメージ
+            enemy["burn_duration"] = 3  # 3ターン持続
+            state.battle_log.add(LOG_BURN_APPLIED, ACTOR_ENEMY, enemy["burn"], ELEMENT_FIRE, enemy["burn_duration"])
+
+        # 成長反応の場合、HP回復
+        if reaction.type == "bloom":
+            heal_amount = int(state.player_max_hp * 0.12)  # 最大HPの12%
+            state.player_hp = min(state.player_max_hp, state.player_hp + heal_amount)
+            state.battle_log.add(LOG_HEAL, ACTOR_PLAYER, heal_amount, None, state.player_hp, state.player_max_hp)
+
+        # 元素反応が起きたら元素をリセット＆クールダウン設定
+        enemy["element"] = None
+        enemy["element_duration"] = 0
+        state.element_reaction_cooldown = 1  # 1ターン元素付着不可
+    elif element != ELEMENT_NONE:
+        # 元素反応が起きなかった場合のみ新しい元素を付与
+        _attach_element(state, element)
+
+    # ダメージ適用（シールドを考慮）
+    remaining_damage = total_damage
+    shield_blocked = 0
+
+    if enemy["shield"] > 0:
+        if enemy["shield"] >= total_damage:
+            # シールドで全て防げる
+            shield_blocked = total_damage
+            enemy["shield"] -= total_damage
+            remaining_damage = 0
+            state.battle_log.add(LOG_SHIELD_FULL_BLOCK, ACTOR_ENEMY, shield_blocked, None, enemy["shield"])
+        else:
+            # シールドを貫通
+            shield_blocked = enemy["shield"]
+            remaining_damage = total_damage - enemy["shield"]
+            state.battle_log.add(LOG_SHIELD_BLOCK, ACTOR_ENEMY, shield_blocked, None, remaining_damage)
+            enemy["shield"] = 0
+
+    # HPにダメージ
+    enemy["hp"] = max(0, enemy["hp"] - remaining_damage)
+
+    # ダメージエフェクト（元素反応時は反応名を添える）
+    state.damage_effect = {
+        "type": "enemy",
+        "amount": total_damage,
+        "color": DAMAGE_COLORS.get(element, "#ff6b6b"),
+        "reaction": reaction.name if reaction is not None else ""
+    }
+    state.screen_shake = True
+
+    # 詳細なダメージログ（全てシールドで防いだ場合は表示済み）
+    if remaining_damage > 0:
+        state.battle_log.add(LOG_DAMAGE, ACTOR_ENEMY, remaining_damage, element,
+                             enemy["hp"], enemy["max_hp"], base_damage, reaction_bonus, shield_blocked)
+
+
+def _op_extra_damage(state: BattleState, base_damage: int, element: str):
+    """
+    ドローカードの複合ダメージ（急速成長など）
+    元素反応はボーナスダメージと元素のリセットだけで、燃焼・成長の追加効果やダメージ演出はない
+    """
+    enemy = state.enemy
+    total_damage = base_damage
+    if state.attack_buff_duration > 0:
+        total_damage = int(total_damage * (1 + state.attack_buff))
+
+    reaction = REACTION_TABLE[ELEMENT_CODES[enemy["element"]]][ELEMENT_CODES[element]]
+    if reaction is not None:
+        state.battle_log.add(LOG_REACTION, ACTOR_ENEMY, reaction.bonus, element, reaction)
+        total_damage += reaction.bonus
+        enemy["element"] = None
+        enemy["element_duration"] = 0
+        state.element_reaction_cooldown = 1
+    elif element != ELEMENT_NONE and state.element_reaction_cooldown == 0:
+        enemy["element"] = element
+        enemy["element_duration"] = 2
+
+    # シールドで防いだ分は記録しない
+    shield_blocked = min(enemy["shield"], total_damage)
+    enemy["shield"] -= shield_blocked
+    remaining_damage = total_damage - shield_blocked
+    enemy["hp"] = max(0, enemy["hp"] - remaining_damage)
+    if remaining_damage > 0:
+        state.battle_log.add(LOG_DAMAGE, ACTOR_ENEMY, remaining_damage, element,
+                             enemy["hp"], enemy["max_hp"], base_damage, 0, shield_blocked)
+
+
+def _op_shield(state: BattleState, amount: int):
+    state.shield += amount
+    state.battle_log.add(LOG_SHIELD_GAIN, ACTOR_PLAYER, amount, None, state.shield)
+
+
+def _op_buff(state: BattleState, value: float, duration: int, extra: bool):
+    # バフは既存より強ければ上書きし、残りターンも延長（最大値を採用）
+    state.attack_buff = max(state.attack_buff, value)
+    state.attack_buff_duration = max(state.attack_buff_duration, duration)
+    state.battle_log.add(LOG_BUFF, ACTOR_PLAYER, int(value*100), None,
+                         duration, None if extra else int(state.attack_buff*100))
+
+
+def _op_draw(state: BattleState, count: int, extra: bool):
+    draw_cards(state, count)
+    state.battle_log.add(LOG_DRAW, ACTOR_PLAYER, count, None, len(state.hand), extra)
+
+
+def _weaken_enemy(enemy: dict, value: float, duration: int):
+    """敵の攻撃力を一時的に下げる（既存より強い弱体化のみ適用）"""
+    enemy["debuff_weaken"] = max(enemy.get("debuff_weaken", 0), value)
+    enemy["debuff_weaken_duration"] = max(enemy.get("debuff_weaken_duration", 0), duration)
+
+
+def _debuff_weaken(state: BattleState, value: float, duration: int):
+    _weaken_enemy(state.enemy, value, duration)
+    state.battle_log.add(LOG_WEAKEN, ACTOR_ENEMY, int(value*100), None, duration)
+
+
+def _debuff_stun(state: BattleState, value: float, duration: int):
+    # スタン: 次のターン行動不能
+    state.enemy["stunned"] = True
+    state.battle_log.add(LOG_STUN, ACTOR_ENEMY)
+
+
+def _debuff_poison(state: BattleState, value: float, duration: int):
+    # 毒: 毎ターンダメージ（燃焼とは別管理）
+    state.enemy["poison"] = value
+    state.enemy["poison_duration"] = duration
+    state.battle_log.add(LOG_POISON, ACTOR_ENEMY, value, None, duration)
+
+
+def _debuff_freeze(state: BattleState, value: float, duration: int):
+    # 氷結: 弱体化と同じ効果（元素の付与は OP_APPLY_ELEMENT）
+    _weaken_enemy(state.enemy, value, duration)
+    state.battle_log.add(LOG_FREEZE, ACTOR_ENEMY, int(value*100), None, duration)
+
+
+DEBUFF_HANDLERS: Dict[str, Callable[[BattleState, float, int], None]] = {
+    "weaken": _debuff_weaken,
+    "stun": _debuff_stun,
+    "poison": _debuff_poison,
+    "freeze": _debuff_freeze,
+}
+
+
+def _op_debuff(state: BattleState, debuff_type: str, value: float, duration: int):
+    DEBUFF_HANDLERS[debuff_type](state, value, duration)
+
+
+def _op_apply_element(state: BattleState, element: str):
+    # デバフの元素付与は、反応直後のクールダウン中なら何も記録せずに付けない
+    if state.element_reaction_cooldown == 0:
+        _attach_element(state, element)
+
+
+OP_HANDLERS: Dict[str, Callable[..., None]] = {
+    OP_DAMAGE: _op_damage,
+    OP_SHIELD: _op_shield,
+    OP_BUFF: _op_buff,
+    OP_DEBUFF: _op_debuff,
+    OP_DRAW: _op_draw,
+    OP_APPLY_ELEMENT: _op_apply_element,
+    OP_EXTRA_DAMAGE: _op_extra_damage,
+}
+
+# カタログの各カードのコンパイル結果（強化されていないカードはこれを共有する）
+CARD_OPS: Mapping[str, Tuple[tuple, ...]] = MappingProxyType(
+    {name: compile_card(definition) for name, definition in CARD_CATALOG.items()}
+)
+
+def play_card(state: BattleState, card_index: int):
+    """カードをプレイする"""
+    # インデックス範囲チェック（rerun後に手札が変わっている場合の防御）
+    if card_index >= len(state.hand):
+        return
+
+    card = state.hand[card_index]
+    cost = card.get("cost", 0)
+
+    # エネルギー上限を強制（念のためクランプ）
+    state.energy = min(state.energy, state.max_energy)
+
+    # コストチェック（描画タイミングズレによる二重消費・不正使用を防ぐ）
+    if state.energy < cost:
+        state.battle_log.add(LOG_NO_ENERGY, ACTOR_PLAYER, cost, None, state.energy)
+        return
+
+    # コスト消費
+    state.energy -= cost
+    # 念のため下限クランプ
+    state.energy = max(0, state.energy)
+
+    # エネルギー消費エフェクトを設定
+    state.energy_effect = {
+        "amount": cost
+    }
+
+    state.battle_log.add(LOG_CARD_PLAYED, ACTOR_PLAYER, cost, card.get("element"), card["name"])
+
+    # カードの効果（コンパイル済みの命令列）を順に実行
+    for op in card.ops:
+        OP_HANDLERS[op[0]](state, *op[1:])
+
+    # カードを捨て札へ
+    state.hand.pop(card_index)
+    state.discard.append(card)
+
+def enemy_turn(state: BattleState):
+    """敵のターン"""
+    enemy = state.enemy
+    state.battle_log.add(LOG_ENEMY_TURN, ACTOR_ENEMY)
+
+    # 毒ダメージ処理
+    if enemy.get("poison_duration", 0) > 0:
+        poison_dmg = enemy.get("poison", 0)
+        enemy["hp"] -= poison_dmg
+        if enemy["hp"] < 0:
+            enemy["hp"] = 0
+        state.battle_log.add(LOG_POISON_DAMAGE, ACTOR_ENEMY, poison_dmg, None, enemy["poison_duration"])
+        enemy["poison_duration"] -= 1
+        if enemy["hp"] <= 0:
+            state.shield = 0
+            return
+
+    # 敵が生きている場合のみ行動
+    if enemy["hp"] > 0:
+        # スタン中は行動スキップ
+        if enemy.get("stunned", False):
+            state.battle_log.add(LOG_STUNNED, ACTOR_ENEMY)
+            enemy["stunned"] = False
+        else:
+            action = enemy["next_action"]
+
+            # 弱体化による攻撃力補正
+            base_attack = enemy["attack"]
+            weaken = enemy.get("debuff_weaken", 0)
+            effective_attack = int(base_attack * (1 - weaken))
+
+            if action == "attack":
+                damage = effective_attack
+                state.battle_log.add(LOG_ENEMY_ACTION, ACTOR_ENEMY, damage, None, action)
+                if weaken > 0:
+                    state.battle_log.add(LOG_WEAKENED_ATTACK, ACTOR_ENEMY, effective_attack, None,
+                                         int(weaken*100), base_attack)
+                apply_damage_to_player(state, damage)
+
+            elif action == "big_attack":
+                damage = int(effective_attack * 1.5)
+                state.battle_log.add(LOG_ENEMY_ACTION, ACTOR_ENEMY, damage, None, action)
+                if weaken > 0:
+                    state.battle_log.add(LOG_WEAKENED_ATTACK, ACTOR_ENEMY, damage, None,
+                                         int(weaken*100), int(base_attack*1.5))
+                apply_damage_to_player(state, damage)
+
+            elif action == "defend":
+                shield_amount = int(effective_attack * 1.2)
+                enemy["shield"] += shield_amount
+                state.battle_log.add(LOG_ENEMY_ACTION, ACTOR_ENEMY, shield_amount, None, action, enemy["shield"])
+
+        # 弱体化のターン経過
+        if enemy.get("debuff_weaken_duration", 0) > 0:
+            enemy["debuff_weaken_duration"] -= 1
+            if enemy["debuff_weaken_duration"] == 0:
+                enemy["debuff_weaken"] = 0
+                state.battle_log.add(LOG_WEAKEN_EXPIRED, ACTOR_ENEMY)
+
+        # 次の行動を決定
+        decide_enemy_action(state)
+
+    # プレイヤーのシールドをリセット
+    state.shield = 0
+
+def apply_damage_to_player(state: BattleState, damage: int):
+    """プレイヤーにダメージを適用"""
+    # シールドで軽減
+    if state.shield > 0:
+        if state.shield >= damage:
+            state.shield -= damage
+            state.battle_log.add(LOG_SHIELD_FULL_BLOCK, ACTOR_PLAYER, damage, None, state.shield)
+            damage = 0
+        else:
+            damage -= state.shield
+            state.battle_log.add(LOG_SHIELD_BLOCK, ACTOR_PLAYER, state.shield, None, damage)
+            state.shield = 0
+
+    # HPにダメージ
+    if damage > 0:
+        state.player_hp -= damage
+        state.battle_log.add(LOG_DAMAGE, ACTOR_PLAYER, damage, None, state.player_hp, state.player_max_hp)
+
+        # プレイヤーダメージエフェクトを設定
+        state.damage_effect = {
+            "type": "player",
+            "amount": damage,
+            "color": "#ff4444",
+            "reaction": ""  # プレイヤーダメージには反応なし
+        }
+        state.screen_shake = True
+        state.screen_flash = "damage"
+
+def start_turn(state: BattleState):
+    """ターン開始処理"""
+    enemy = state.enemy
+    # 燃焼ダメージ処理（ターン開始時）
+    if enemy["burn_duration"] > 0:
+        burn_damage = enemy["burn"]
+        enemy["hp"] -= burn_damage
+        if enemy["hp"] < 0:
+            enemy["hp"] = 0
+        state.battle_log.add(LOG_BURN_DAMAGE, ACTOR_ENEMY, burn_damage, ELEMENT_FIRE, enemy["burn_duration"])
+
+        # 燃焼ダメージエフェクトを表示
+        state.damage_effect = {
+            "type": "enemy",
+            "amount": burn_damage,
+            "color": "#ff4444",
+            "reaction": "🔥燃焼"
+        }
+
+        enemy["burn_duration"] -= 1
+
+    # エネルギー回復
+    state.energy = state.max_energy
+
+    # バフ期間減少（999=休憩所バフ=戦闘中ずっと有効→減らさない）
+    if 0 < state.attack_buff_duration < BUFF_WHOLE_BATTLE:
+        state.attack_buff_duration -= 1
+        if state.attack_buff_duration == 0:
+            state.attack_buff = 0
+
+    # 元素期間減少（敵ごと、敵オブジェクト内で管理）
+    if enemy.get("element_duration", 0) > 0:
+        enemy["element_duration"] -= 1
+        if enemy["element_duration"] == 0:
+            enemy["element"] = None
+
+    # 元素反応クールダウン減少
+    if state.element_reaction_cooldown > 0:
+        state.element_reaction_cooldown -= 1
+
+    # アップグレードによるドロー枚数ボーナスを適用
+    draw_cards(state, BASE_HAND_SIZE + state.draw_bonus)
+
+def discard_hand(state: BattleState):
+    """手札を全て捨て札へ（Slay the Spire式）"""
+    if len(state.hand) > 0:
+        discard_count = len(state.hand)
+        state.discard.extend(state.hand)
+        state.hand.clear()
+        state.battle_log.add(LOG_DISCARD, ACTOR_PLAYER, discard_count)
+
+def end_turn(state: BattleState) -> List[LogEvent]:
+    """
+    ターン終了: 手札を捨てて敵のターン→次のターン開始
+
+    Returns:
+        敵のターンに追加されたログ（文字列にするのは format_log）
+    """
+    discard_hand(state)
+
+    # 敵が生きている場合のみ敵のターン
+    log_before = state.battle_log.position
+    if state.enemy["hp"] > 0:
+        enemy_turn(state)
+    enemy_log = state.battle_log.since(log_before)
+
+    # 次のターン開始
+    start_turn(state)
+    return enemy_log
+
+def enemy_situation(state: BattleState) -> int:
+    """敵の状況の区分（SITUATION_*）。割合は整数の比較で判定する"""
+    enemy = state.enemy
+    hp, max_hp = enemy["hp"], enemy["max_hp"]
+    if hp * 4 < max_hp:
+        return SITUATION_DYING
+    if hp * 2 < max_hp:
+        return SITUATION_LOW_HP if enemy["shield"] < 10 else SITUATION_LOW_HP_SHIELDED
+    if hp * 4 < max_hp * 3:
+        return SITUATION_MID_HP_PLAYER_BUFFED if state.attack_buff_duration > 0 else SITUATION_MID_HP
+    if state.player_hp * 10 > state.player_max_hp * 7:
+        return SITUATION_HIGH_HP_PLAYER_HEALTHY
+    return SITUATION_HIGH_HP_PLAYER_HURT
+
+def decide_enemy_action(state: BattleState):
+    """敵の次の行動を決定（敵ごとの行動方針の表から引く）"""
+    enemy = state.enemy
+    policy = ENEMY_POLICIES.get(enemy["name"], DEFAULT_ENEMY_POLICY)
+    enemy["next_action"] = policy.choose(enemy_situation(state), state.enemy_rng)
+
+def setup_battle(state: BattleState, enemy: dict, cards: List[Card], battle_number: int, rest_buff: float = 0):
+    """
+    新しい戦闘をセットアップ
+
+    Args:
+        state: 戦闘状態（プレイヤーHPなどは引き継ぐ）
+        enemy: create_enemy_data で作った敵データ
+        cards: 所持カード全体（山札の元）
+        battle_number: 第何戦か（ログ表示用）
+        rest_buff: 休憩所バフ（戦闘中ずっと有効）
+    """
+    state.enemy = enemy
+
+    # 敵の次の行動を決定
+    decide_enemy_action(state)
+
+    # プレイヤー状態をリセット（前の戦闘の残りをクリア）
+    state.shield = 0
+    state.element_reaction_cooldown = 0
+
+    # 休憩所バフ（次の1戦限り）の引き継ぎ
+    if rest_buff > 0:
+        # 次の戦闘に持ち込む（戦闘中は全ターン有効: duration=999）
+        state.attack_buff = rest_buff
+        state.attack_buff_duration = BUFF_WHOLE_BATTLE  # 戦闘終了まで有効
+    else:
+        state.attack_buff = 0
+        state.attack_buff_duration = 0
+
+    # デッキをリセット（各パイルのリストは使い回す）
+    state.hand.clear()
+    state.discard.clear()
+    state.deck.refill(cards, state.deck_rng)
+
+    state.energy = state.max_energy
+    state.battle_log.clear()
+    state.battle_log.add(LOG_BATTLE_START, ACTOR_ENEMY, 0, None, battle_number, enemy["name"])
+
+    # アップグレードによるドロー枚数ボーナスを適用
+    draw_cards(state, BASE_HAND_SIZE + state.draw_bonus)
@@ -0,0 +1,563 @@
+"""
+ベクトル化戦闘カーネル（NumPy）
+独立した多数の戦闘を配列でまとめて1手ずつ進める（難易度カーブの調整用）
+
+ダメージ・シールド・元素反応・敵の行動決定は battle_engine と同じルール。
+プレイヤーの操作は「使えるカードのうち優先度が最も高いもの（同じならドロー順）を
+使い、使えるカードがなくなったらターン終了」という固定方針で行う。
+
+使い方:
+    python battle_kernel.py --battles 100000
+"""
+
+import argparse
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+import battle_engine
+from battle_engine import (
+    ELEMENT_NONE,
+    CARD_ATTACK, CARD_DEFEND, CARD_BUFF, CARD_DEBUFF, CARD_DRAW,
+    BUFF_WHOLE_BATTLE, BASE_HAND_SIZE,
+)
+
+# ===== コード表 =====
+
+# 元素コードと元素反応は battle_engine の表をそのまま使う
+ELEMENT_CODES = battle_engine.ELEMENT_CODES
+
+REACTION_NONE, REACTION_BURN, REACTION_VAPORIZE, REACTION_BLOOM = range(4)
+_REACTION_CODES = {"burn": REACTION_BURN, "vaporize": REACTION_VAPORIZE, "bloom": REACTION_BLOOM}
+REACTION_TYPE = np.array(
+    [[_REACTION_CODES[r.type] if r else REACTION_NONE for r in row] for row in battle_engine.REACTION_TABLE],
+    dtype=np.int8,
+)
+REACTION_BONUS = np.array(
+    [[r.bonus if r else 0 for r in row] for row in battle_engine.REACTION_TABLE],
+    dtype=np.int64,
+)
+
+BURN_DAMAGE = 10
+BURN_DURATION = 3
+BLOOM_HEAL_RATE = 0.12
+ELEMENT_DURATION = 2
+
+# カードタイプ
+TYPE_CODES = {CARD_ATTACK: 0, CARD_DEFEND: 1, CARD_BUFF: 2, CARD_DEBUFF: 3, CARD_DRAW: 4}
+TYPE_ATTACK, TYPE_DEFEND, TYPE_BUFF, TYPE_DEBUFF, TYPE_DRAW = range(5)
+
+# デバフ
+DEBUFF_CODES = {"": 0, "weaken": 1, "stun": 2, "poison": 3, "freeze": 4}
+DEBUFF_WEAKEN, DEBUFF_STUN, DEBUFF_POISON, DEBUFF_FREEZE = range(1, 5)
+
+# 敵の行動
+ACTION_CODES = {"attack": 0, "big_attack": 1, "defend": 2}
+ACTION_ATTACK, ACTION_BIG_ATTACK, ACTION_DEFEND = range(3)
+
+
+def _action_row(policy: battle_engine.EnemyPolicy, situation: int) -> List[int]:
+    """状況の行動を重みの数だけ並べる（並びから一様に選ぶと重み付きの抽選になる）"""
+    row, previous = [], 0
+    for action, cum in zip(policy.actions[situation], policy.cum_weights[situation]):
+        row += [ACTION_CODES[action]] * (cum - previous)
+        previous = cum
+    return row
+
+
+# 状況（battle_engine.SITUATION_*）別の候補。敵の種類は区別せず標準の方針を使う
+ACTION_TABLE = np.array(
+    [_action_row(battle_engine.DEFAULT_ENEMY_POLICY, i) for i in range(battle_engine.SITUATION_COUNT)],
+    dtype=np.int8,
+)
+
+# カードの所在
+PILE_DECK, PILE_HAND, PILE_DISCARD, PILE_NONE = range(4)
+
+# 戦闘結果
+RESULT_ONGOING, RESULT_WON, RESULT_LOST, RESULT_TIMEOUT = range(4)
+
+# ===== カード表 =====
+
+@dataclass
+class CardTable:
+    """カードの数値を列ごとの配列にしたもの（カードIDは配列の添字）"""
+    names: List[str]
+    type: np.ndarray
+    cost: np.ndarray
+    element: np.ndarray
+    damage: np.ndarray
+    shield: np.ndarray
+    buff_value: np.ndarray
+    buff_duration: np.ndarray
+    draw_count: np.ndarray
+    debuff_type: np.ndarray
+    debuff_value: np.ndarray
+    debuff_duration: np.ndarray
+
+
+def compile_cards(cards: Sequence[dict]) -> CardTable:
+    """カード辞書のリストを CardTable に変換"""
+    def column(key, default, dtype):
+        return np.array([card.get(key, default) for card in cards], dtype=dtype)
+
+    return CardTable(
+        names=[card["name"] for card in cards],
+        type=np.array([TYPE_CODES[card["type"]] for card in cards], dtype=np.int8),
+        cost=column("cost", 0, np.int64),
+        element=np.array([ELEMENT_CODES[card.get("element", ELEMENT_NONE)] for card in cards], dtype=np.int8),
+        damage=column("damage", 0, np.int64),
+        shield=column("shield", 0, np.int64),
+        buff_value=column("buff_value", 0, np.float64),
+        # バフの既定持続はカードの種類によらず1（battle_engine.compile_card の OP_BUFF と同じ）
+        buff_duration=column("buff_duration", 1, np.int64),
+        draw_count=column("draw_count", 0, np.int64),
+        debuff_type=np.array([DEBUFF_CODES[card.get("debuff_type", "")] for card in cards], dtype=np.int8),
+        debuff_value=column("debuff_value", 0, np.float64),
+        debuff_duration=column("debuff_duration", 1, np.int64),
+    )
+
+# ===== 戦闘のまとまり =====
+
+@dataclass
+class BattleBatch:
+    """N戦分の戦闘状態（各配列の先頭次元が戦闘）"""
+    cards: CardTable
+    rng: np.random.Generator
+    # 敵
+    enemy_hp: np.ndarray
+    enemy_max_hp: np.ndarray
+    enemy_attack: np.ndarray
+    enemy_shield: np.ndarray
+    enemy_element: np.ndarray
+    enemy_element_duration: np.ndarray
+    burn: np.ndarray
+    burn_duration: np.ndarray
+    poison: np.ndarray
+    poison_duration: np.ndarray
+    weaken: np.ndarray
+    weaken_duration: np.ndarray
+    stunned: np.ndarray
+    next_action: np.ndarray
+    # プレイヤー
+    player_hp: np.ndarray
+    player_max_hp: np.ndarray
+    player_shield: np.ndarray
+    energy: np.ndarray
+    max_energy: np.ndarray
+    attack_buff: np.ndarray
+    attack_buff_duration: np.ndarray
+    reaction_cooldown: np.ndarray
+    draw_per_turn: np.ndarray
+    # カード（N × デッキ枚数）
+    deck: np.ndarray          # カードID（-1 は空き）
+    pile: np.ndarray          # PILE_*
+    order: np.ndarray         # 山札内の順番（小さいほど上）
+    hand_order: np.ndarray    # 手札に入った順番
+    draw_counter: np.ndarray
+    # 進行
+    result: np.ndarray
+    turns: np.ndarray
+
+    @property
+    def size(self) -> int:
+        return len(self.enemy_hp)
+
+    @property
+    def active(self) -> np.ndarray:
+        """決着していない戦闘"""
+        return self.result == RESULT_ONGOING
+
+
+def new_batch(difficulty, deck_ids: np.ndarray, cards: CardTable, player_hp=100, player_max_hp=100,
+              max_energy=5, draw_bonus=0, rest_buff=0.0, seed: Optional[int] = None) -> BattleBatch:
+    """
+    戦闘を一括でセットアップ（create_enemy_data + setup_battle 相当）
+
+    Args:
+        difficulty: 敵の難易度（スカラーまたは長さNの配列）
+        deck_ids: デッキのカードID（N × 枚数、空きは -1）
+        cards: compile_cards の結果
+        player_hp, player_max_hp, max_energy, draw_bonus: プレイヤー状態（スカラーまたは配列）
+        rest_buff: 休憩所バフ（戦闘中ずっと有効）
+        seed: 乱数シード
+    """
+    deck_ids = np.asarray(deck_ids, dtype=np.int64)
+    n, width = deck_ids.shape
+
+    def full(value, dtype):
+        return np.broadcast_to(np.asarray(value, dtype=dtype), (n,)).copy()
+
+    difficulty = full(difficulty, np.int64)
+    # create_enemy_data と同じ式（10%削弱）
+    enemy_max_hp = ((45 + difficulty * 12) * 0.9).astype(np.int64)
+    enemy_attack = ((6 + difficulty * 1.2) * 0.9).astype(np.int64)
+    rest_buff = full(rest_buff, np.float64)
+
+    rng = np.random.default_rng(seed)
+    batch = BattleBatch(
+        cards=cards,
+        rng=rng,
+        enemy_hp=enemy_max_hp.copy(),
+        enemy_max_hp=enemy_max_hp,
+        enemy_attack=enemy_attack,
+        enemy_shield=np.zeros(n, dtype=np.int64),
+        enemy_element=np.zeros(n, dtype=np.int8),
+        enemy_element_duration=np.zeros(n, dtype=np.int64),
+        burn=np.zeros(n, dtype=np.int64),
+        burn_duration=np.zeros(n, dtype=np.int64),
+        poison=np.zeros(n, dtype=np.int64),
+        poison_duration=np.zeros(n, dtype=np.int64),
+        weaken=np.zeros(n, dtype=np.float64),
+        weaken_duration=np.zeros(n, dtype=np.int64),
+        stunned=np.zeros(n, dtype=bool),
+        next_action=np.zeros(n, dtype=np.int8),
+        player_hp=full(player_hp, np.int64),
+        player_max_hp=full(player_max_hp, np.int64),
+        player_shield=np.zeros(n, dtype=np.int64),
+        energy=full(max_energy, np.int64),
+        max_energy=full(max_energy, np.int64),
+        attack_buff=np.where(rest_buff > 0, rest_buff, 0.0),
+        attack_buff_duration=np.where(rest_buff > 0, BUFF_WHOLE_BATTLE, 0).astype(np.int64),
+        reaction_cooldown=np.zeros(n, dtype=np.int64),
+        draw_per_turn=BASE_HAND_SIZE + full(draw_bonus, np.int64),
+        deck=deck_ids,
+        pile=np.where(deck_ids >= 0, PILE_DECK, PILE_NONE).astype(np.int8),
+        order=rng.random((n, width)),
+        hand_order=np.zeros((n, width), dtype=np.int64),
+        draw_counter=np.zeros(n, dtype=np.int64),
+        result=np.full(n, RESULT_ONGOING, dtype=np.int8),
+        turns=np.zeros(n, dtype=np.int64),
+    )
+
+    everyone = np.ones(n, dtype=bool)
+    # 初手の敵行動はバフ・シールドのない満タンHPの状態で決める（setup_battle と同じ順序）
+    decide_enemy_action(batch, everyone)
+    draw_cards(batch, everyone, batch.draw_per_turn)
+    return batch
+
+# ===== ドロー =====
+
+def _draw_one(batch: BattleBatch, rows: np.ndarray):
+    """rows の戦闘で1枚ずつドロー（山札が空なら捨て札をシャッフルして戻す）"""
+    in_deck = batch.pile == PILE_DECK
+    empty = rows & ~in_deck.any(axis=1)
+    if empty.any():
+        refill = (batch.pile == PILE_DISCARD) & empty[:, None]
+        batch.pile[refill] = PILE_DECK
+        batch.order[refill] = batch.rng.random(int(refill.sum()))
+        in_deck = batch.pile == PILE_DECK
+
+    idx = np.nonzero(rows & in_deck.any(axis=1))[0]
+    if len(idx) == 0:
+        return
+    top = np.where(in_deck[idx], batch.order[idx], np.inf).argmin(axis=1)
+    batch.pile[idx, top] = PILE_HAND
+    batch.hand_order[idx, top] = batch.draw_counter[idx]
+    batch.draw_counter[idx] += 1
+
+
+def draw_cards(batch: BattleBatch, rows: np.ndarray, counts: np.ndarray):
+    """rows の戦闘でそれぞれ counts 枚ドロー"""
+    counts = np.where(rows, counts, 0)
+    for k in range(int(counts.max(initial=0))):
+        _draw_one(batch, counts > k)
+
+# ===== プレイヤーの行動 =====
+
+def choose_cards(batch: BattleBatch, priority: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    各戦闘で使う手札のスロット（使えるカードがなければ -1）
+
+    Args:
+        priority: カードIDごとの優先度（大きいほど先に使う。None なら全て同じ）
+    """
+    ids = np.maximum(batch.deck, 0)
+    usable = (batch.pile == PILE_HAND) & (batch.cards.cost[ids] <= batch.energy[:, None]) & batch.active[:, None]
+    score = -batch.hand_order.astype(np.float64)
+    if priority is not None:
+        score = score + np.asarray(priority, dtype=np.float64)[ids] * 1e9
+    slot = np.where(usable, score, -np.inf).argmax(axis=1)
+    return np.where(usable.any(axis=1), slot, -1)
+
+
+def _apply_damage_to_enemy(batch: BattleBatch, rows: np.ndarray, total: np.ndarray):
+    """シールドを考慮して敵にダメージ"""
+    blocked = np.minimum(batch.enemy_shield, total)
+    batch.enemy_shield = np.where(rows, batch.enemy_shield - blocked, batch.enemy_shield)
+    batch.enemy_hp = np.where(rows, np.maximum(0, batch.enemy_hp - (total - blocked)), batch.enemy_hp)
+
+
+def _buffed_damage(batch: BattleBatch, base: np.ndarray) -> np.ndarray:
+    """攻撃バフ適用後のダメージ"""
+    boosted = (base * (1 + batch.attack_buff)).astype(np.int64)
+    return np.where(batch.attack_buff_duration > 0, boosted, base)
+
+
+def _apply_buff(batch: BattleBatch, rows: np.ndarray, value: np.ndarray, duration: np.ndarray):
+    """攻撃バフ（強い方の値・長い方の持続を採用）"""
+    batch.attack_buff = np.where(rows, np.maximum(batch.attack_buff, value), batch.attack_buff)
+    batch.attack_buff_duration = np.where(
+        rows, np.maximum(batch.attack_buff_duration, duration), batch.attack_buff_duration
+    )
+
+
+def _attach_element(batch: BattleBatch, rows: np.ndarray, element: np.ndarray):
+    """クールダウン中でなければ元素を付与"""
+    attach = rows & (element != 0) & (batch.reaction_cooldown == 0)
+    batch.enemy_element = np.where(attach, element, batch.enemy_element).astype(np.int8)
+    batch.enemy_element_duration = np.where(attach, ELEMENT_DURATION, batch.enemy_element_duration)
+
+
+def play_cards(batch: BattleBatch, slots: np.ndarray):
+    """
+    各戦闘で手札の slots 番目のカードを使用（-1 の戦闘は何もしない）
+    勝敗が決まった戦闘は result を更新する
+    """
+    cards = batch.cards
+    n = batch.size
+    rows_all = np.arange(n)
+    playing = (slots >= 0) & batch.active
+    slot = np.maximum(slots, 0)
+    card = np.maximum(batch.deck[rows_all, slot], 0)
+    cost = cards.cost[card]
+
+    # エネルギー不足のカードは使えない
+    playing &= batch.energy >= cost
+    if not playing.any():
+        return
+    batch.energy = np.where(playing, np.maximum(0, batch.energy - cost), batch.energy)
+
+    card_type = cards.type[card]
+    element = cards.element[card]
+    attack = playing & (card_type == TYPE_ATTACK)
+    defend = playing & (card_type == TYPE_DEFEND)
+    buff = playing & (card_type == TYPE_BUFF)
+    debuff = playing & (card_type == TYPE_DEBUFF)
+    draw_damage = playing & (card_type == TYPE_DRAW) & (cards.damage[card] > 0)
+
+    # --- ダメージ（攻撃カード、ドローカードの複合ダメージ） ---
+    hitting = attack | draw_damage
+    if hitting.any():
+        total = _buffed_damage(batch, cards.damage[card])
+        reaction = REACTION_TYPE[batch.enemy_element, element]
+        reacted = hitting & (reaction != REACTION_NONE)
+        total = total + np.where(reacted, REACTION_BONUS[batch.enemy_element, element], 0)
+
+        # 燃焼・成長の追加効果は攻撃カードのみ（ドローカードの複合ダメージはボーナスだけ）
+        burn = attack & (reaction == REACTION_BURN)
+        batch.burn = np.where(burn, BURN_DAMAGE, batch.burn)
+        batch.burn_duration = np.where(burn, BURN_DURATION, batch.burn_duration)
+        bloom = attack & (reaction == REACTION_BLOOM)
+        heal = (batch.player_max_hp * BLOOM_HEAL_RATE).astype(np.int64)
+        batch.player_hp = np.where(bloom, np.minimum(batch.player_max_hp, batch.player_hp + heal), batch.player_hp)
+
+        # 反応したら元素をリセットしてクールダウン、しなければ付与
+        batch.enemy_element = np.where(reacted, 0, batch.enemy_element).astype(np.int8)
+        batch.enemy_element_duration = np.where(reacted, 0, batch.enemy_element_duration)
+        _attach_element(batch, hitting & ~reacted, element)
+        batch.reaction_cooldown = np.where(reacted, 1, batch.reaction_cooldown)
+
+        _apply_damage_to_enemy(batch, hitting, total)
+
+    # --- 防御（防壁術などの複合バフを含む） ---
+    batch.player_shield = np.where(defend, batch.player_shield + cards.shield[card], batch.player_shield)
+    _apply_buff(batch, (defend & (cards.buff_value[card] > 0)) | buff,
+                cards.buff_value[card], cards.buff_duration[card])
+
+    # --- デバフ ---
+    if debuff.any():
+        debuff_type = cards.debuff_type[card]
+        value = cards.debuff_value[card]
+        duration = cards.debuff_duration[card]
+        weaken = debuff & ((debuff_type == DEBUFF_WEAKEN) | (debuff_type == DEBUFF_FREEZE))
+        batch.weaken = np.where(weaken, np.maximum(batch.weaken, value), batch.weaken)
+        batch.weaken_duration = np.where(weaken, np.maximum(batch.weaken_duration, duration), batch.weaken_duration)
+        batch.stunned |= debuff & (debuff_type == DEBUFF_STUN)
+        poison = debuff & (debuff_type == DEBUFF_POISON)
+        batch.poison = np.where(poison, value.astype(np.int64), batch.poison)
+        batch.poison_duration = np.where(poison, duration, batch.poison_duration)
+        # 毒霧・氷結は反応判定なしで元素を付与
+        _attach_element(batch, poison | (debuff & (debuff_type == DEBUFF_FREEZE)), element)
+
+    # --- ドロー（攻撃・バフ・ドローカード。使用中のカードは手札に残ったまま） ---
+    drawing = (attack | buff | (playing & (card_type == TYPE_DRAW))) & (cards.draw_count[card] > 0)
+    if drawing.any():
+        draw_cards(batch, drawing, cards.draw_count[card])
+
+    # カードを捨て札へ
+    idx = np.nonzero(playing)[0]
+    batch.pile[idx, slot[idx]] = PILE_DISCARD
+
+    batch.result = np.where(batch.active & (batch.enemy_hp <= 0), RESULT_WON, batch.result).astype(np.int8)
+
+# ===== 敵のターン =====
+
+def decide_enemy_action(batch: BattleBatch, rows: np.ndarray):
+    """敵の次の行動を決定（decide_enemy_action と同じ重み）"""
+    hp_ratio = batch.enemy_hp / batch.enemy_max_hp
+    player_buff = batch.attack_buff_duration > 0
+    player_hp_ratio = batch.player_hp / batch.player_max_hp
+    situation = np.select(
+        [
+            hp_ratio < 0.25,
+            (hp_ratio < 0.5) & (batch.enemy_shield < 10),
+            hp_ratio < 0.5,
+            (hp_ratio < 0.75) & player_buff,
+            hp_ratio < 0.75,
+            player_hp_ratio > 0.7,
+        ],
+        [0, 1, 2, 3, 4, 5],
+        default=6,
+    )
+    choice = batch.rng.integers(0, ACTION_TABLE.shape[1], size=batch.size)
+    batch.next_action = np.where(rows, ACTION_TABLE[situation, choice], batch.next_action).astype(np.int8)
+
+
+def _apply_damage_to_player(batch: BattleBatch, rows: np.ndarray, damage: np.ndarray):
+    """シールドを考慮してプレイヤーにダメージ"""
+    blocked = np.minimum(batch.player_shield, damage)
+    batch.player_shield = np.where(rows, batch.player_shield - blocked, batch.player_shield)
+    batch.player_hp = np.where(rows, batch.player_hp - (damage - blocked), batch.player_hp)
+
+
+def enemy_turn(batch: BattleBatch, rows: np.ndarray):
+    """敵のターン（毒 → 行動 → 弱体化の経過 → 次の行動決定 → プレイヤーのシールド消滅）"""
+    rows = rows & (batch.enemy_hp > 0)
+
+    poisoned = rows & (batch.poison_duration > 0)
+    batch.enemy_hp = np.where(poisoned, np.maximum(0, batch.enemy_hp - batch.poison), batch.enemy_hp)
+    batch.poison_duration = np.where(poisoned, batch.poison_duration - 1, batch.poison_duration)
+
+    acting = rows & (batch.enemy_hp > 0)
+    stunned = acting & batch.stunned
+    batch.stunned &= ~stunned
+    moving = acting & ~stunned
+
+    effective = (batch.enemy_attack * (1 - batch.weaken)).astype(np.int64)
+    action = batch.next_action
+    damage = np.where(action == ACTION_BIG_ATTACK, (effective * 1.5).astype(np.int64), effective)
+    _apply_damage_to_player(batch, moving & (action != ACTION_DEFEND), damage)
+    guard = moving & (action == ACTION_DEFEND)
+    batch.enemy_shield = np.where(guard, batch.enemy_shield + (effective * 1.2).astype(np.int64), batch.enemy_shield)
+
+    weakened = acting & (batch.weaken_duration > 0)
+    batch.weaken_duration = np.where(weakened, batch.weaken_duration - 1, batch.weaken_duration)
+    batch.weaken = np.where(weakened & (batch.weaken_duration == 0), 0.0, batch.weaken)
+
+    decide_enemy_action(batch, acting)
+    batch.player_shield = np.where(rows, 0, batch.player_shield)
+
+
+def start_turn(batch: BattleBatch, rows: np.ndarray):
+    """ターン開始（燃焼 → エネルギー回復 → バフ・元素・クールダウンの経過 → ドロー）"""
+    burning = rows & (batch.burn_duration > 0)
+    batch.enemy_hp = np.where(burning, np.maximum(0, batch.enemy_hp - batch.burn), batch.enemy_hp)
+    batch.burn_duration = np.where(burning, batch.burn_duration - 1, batch.burn_duration)
+
+    batch.energy = np.where(rows, batch.max_energy, batch.energy)
+
+    buffed = rows & (batch.attack_buff_duration > 0) & (batch.attack_buff_duration < BUFF_WHOLE_BATTLE)
+    batch.attack_buff_duration = np.where(buffed, batch.attack_buff_duration - 1, batch.attack_buff_duration)
+    batch.attack_buff = np.where(buffed & (batch.attack_buff_duration == 0), 0.0, batch.attack_buff)
+
+    attached = rows & (batch.enemy_element_duration > 0)
+    batch.enemy_element_duration = np.where(attached, batch.enemy_element_duration - 1, batch.enemy_element_duration)
+    batch.enemy_element = np.where(attached & (batch.enemy_element_duration == 0), 0, batch.enemy_element).astype(np.int8)
+
+    batch.reaction_cooldown = np.where(rows & (batch.reaction_cooldown > 0), batch.reaction_cooldown - 1,
+                                       batch.reaction_cooldown)
+
+    draw_cards(batch, rows, batch.draw_per_turn)
+
+
+def end_turn(batch: BattleBatch, rows: np.ndarray):
+    """ターン終了（手札を捨てる → 敵のターン → 次のターン開始 → 勝敗判定）"""
+    rows = rows & batch.active
+    batch.pile[(batch.pile == PILE_HAND) & rows[:, None]] = PILE_DISCARD
+    enemy_turn(batch, rows)
+    start_turn(batch, rows)
+    batch.turns += rows
+
+    # run_engine.check_battle_end と同じく敵の撃破を先に判定
+    won = rows & (batch.enemy_hp <= 0)
+    lost = rows & ~won & (batch.player_hp <= 0)
+    batch.result = np.where(won, RESULT_WON, np.where(lost, RESULT_LOST, batch.result)).astype(np.int8)
+
+
+def run_battles(batch: BattleBatch, priority: Optional[np.ndarray] = None, max_turns: int = 200) -> BattleBatch:
+    """全戦闘が決着するまで進める（max_turns で打ち切った戦闘は RESULT_TIMEOUT）"""
+    for _ in range(max_turns):
+        if not batch.active.any():
+            break
+        while True:
+            slots = choose_cards(batch, priority)
+            if (slots < 0).all():
+                break
+            play_cards(batch, slots)
+        end_turn(batch, batch.active)
+    batch.result = np.where(batch.active, RESULT_TIMEOUT, batch.result).astype(np.int8)
+    return batch
+
+# ===== 難易度カーブ =====
+
+def deck_ids_for(cards: CardTable, deck: Sequence[dict], n: int) -> np.ndarray:
+    """カード辞書のデッキを N 戦分のカードID配列に変換"""
+    index = {name: i for i, name in enumerate(cards.names)}
+    row = np.array([index[card["name"]] for card in deck], dtype=np.int64)
+    return np.tile(row, (n, 1))
+
+
+def difficulty_curve(difficulties: Sequence[int], battles: int, deck: Optional[List[dict]] = None,
+                     seed: Optional[int] = None, **player) -> Dict[int, Dict[str, float]]:
+    """
+    難易度ごとに同じデッキで battles 戦ずつ戦った結果
+
+    Returns:
+        {難易度: {"win_rate", "mean_hp_loss", "mean_turns"}}
+    """
+    deck = deck if deck is not None else battle_engine.create_starter_deck()
+    cards = compile_cards(list(battle_engine.CARD_CATALOG.values()))
+    difficulties = list(difficulties)
+    difficulty = np.repeat(np.array(difficulties, dtype=np.int64), battles)
+    batch = new_batch(difficulty, deck_ids_for(cards, deck, len(difficulty)), cards, seed=seed, **player)
+    start_hp = batch.player_hp.copy()
+    run_battles(batch)
+
+    curve = {}
+    for i, d in enumerate(difficulties):
+        part = slice(i * battles, (i + 1) * battles)
+        curve[d] = {
+            "win_rate": float((batch.result[part] == RESULT_WON).mean()),
+            "mean_hp_loss": float((start_hp[part] - np.maximum(batch.player_hp[part], 0)).mean()),
+            "mean_turns": float(batch.turns[part].mean()),
+        }
+    return curve
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="初期デッキでの難易度別の勝率（ベクトル化カーネル）")
+    parser.add_argument("--battles", type=int, default=20000, help="難易度ごとの戦闘数")
+    parser.add_argument("--min-difficulty", type=int, default=1)
+    parser.add_argument("--max-difficulty", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    difficulties = range(args.min_difficulty, args.max_difficulty + 1)
+    curve = difficulty_curve(difficulties, args.battles, seed=args.seed)
+    elapsed = time.perf_counter() - started
+
+    print(f"  {'難易度':>4} {'敵HP':>5} {'敵攻撃':>5} {'勝率':>7} {'平均被ダメージ':>8} {'平均ターン':>6}")
+    for d, row in curve.items():
+        enemy = battle_engine.create_enemy_data("", d)
+        print(f"  {d:>6} {enemy['max_hp']:>6} {enemy['attack']:>7} {row['win_rate']:>8.1%}"
+              f" {row['mean_hp_loss']:>14.1f} {row['mean_turns']:>10.2f}")
+    total = args.battles * len(difficulties)
+    print(f"\n所要時間: {elapsed:.2f}秒 ({total / max(elapsed, 1e-9):.0f} 戦/秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""
+戦闘画面のHTML断片（Streamlit非依存）
+
+カード・ポートレート・エネルギーバー・レイアウトCSSなど、クリックのたびに
+作り直していたHTMLを入力ごとにメモ化して返す。入力が同じなら毎回同じ文字列
+（同じオブジェクト）になるので、再描画で作り直すのは変化した断片だけになる。
+変化のない断片は出力も1バイトも変わらない
+"""
+
+from functools import lru_cache
+from typing import Optional
+
+from battle_engine import (
+    ELEMENT_NONE, ELEMENT_FIRE, ELEMENT_WATER, ELEMENT_NATURE,
+    CARD_ATTACK, CARD_DEFEND, CARD_BUFF, CARD_DEBUFF, CARD_DRAW,
+)
+
+# ===== アイコン・色 =====
+
+CARD_TYPE_ICONS = {
+    CARD_ATTACK: "⚔️",
+    CARD_DEFEND: "🛡️",
+    CARD_BUFF: "⭐",
+    CARD_DEBUFF: "💀",
+    CARD_DRAW: "🎴",
+}
+
+ELEMENT_EMOJIS = {
+    ELEMENT_FIRE: "🔥",
+    ELEMENT_WATER: "💧",
+    ELEMENT_NATURE: "🌿",
+    ELEMENT_NONE: "⚪",
+}
+
+ELEMENT_COLORS = {
+    ELEMENT_NONE: "#888888",
+    ELEMENT_FIRE: "#FF6B6B",
+    ELEMENT_WATER: "#4ECDC4",
+    ELEMENT_NATURE: "#95E77D",
+}
+
+ENEMY_EMOJIS = {
+    "スライム": "🟢",
+    "ゴブリン": "👺",
+    "オーク": "🐗",
+    "ドラゴン": "🐉",
+    "魔法使い": "🧙‍♂️",
+}
+
+
+def get_element_emoji(element: str) -> str:
+    """元素の絵文字を取得"""
+    return ELEMENT_EMOJIS.get(element, "⚪")
+
+
+def get_enemy_emoji(enemy_name: str) -> str:
+    """敵の種族に応じた絵文字を取得"""
+    return ENEMY_EMOJIS.get(enemy_name, "👾")
+
+# ===== 静的な断片 =====
+
+# 戦闘画面のレイアウトとアニメーション（内容は常に同じなので styles のスタイルシート管理でセッションに1回だけ入れる）。
+# 他の画面にも残るので、レイアウトの規則は BATTLE_SCREEN_MARKER がある画面だけに効かせる
+BATTLE_SCREEN_MARKER = "<div class='battle-screen'></div>"
+
+BATTLE_LAYOUT_CSS = """
+<style>
+/* ダメージポップアップアニメーション */
+@keyframes damagePopup {
+    0% { transform: translate(-50%, -50%) scale(0.5); opacity: 0; }
+    20% { transform: translate(-50%, -70%) scale(1.2); opacity: 1; }
+    70% { transform: translate(-50%, -90%) scale(1.1); opacity: 1; }
+    100% { transform: translate(-50%, -120%) scale(1); opacity: 0; }
+}
+
+/* 敵ポートレートの鼓動 */
+@keyframes enemyPulse {
+    0%, 100% { transform: scale(1); }
+    50% { transform: scale(1.05); }
+}
+
+/* ページ全体のパディングを削除 */
+.stApp:has(.battle-screen) .main .block-container {
+    padding-top: 0.5rem !important;
+    padding-bottom: 0.5rem !important;
+    max-width: 100% !important;
+}
+
+/* 要素間のマージンを削減 */
+.stApp:has(.battle-screen) .element-container {
+    margin: 0 !important;
+}
+
+/* 見出しのマージンを削減 */
+.stApp:has(.battle-screen) h1,
+.stApp:has(.battle-screen) h2,
+.stApp:has(.battle-screen) h3,
+.stApp:has(.battle-screen) h4 {
+    margin-top: 0.2rem !important;
+    margin-bottom: 0.2rem !important;
+    font-size: 0.9rem !important;
+}
+
+/* プログレスバーを小さく */
+.stApp:has(.battle-screen) .stProgress {
+    height: 15px !important;
+}
+
+/* ボタンを小さく */
+.stApp:has(.battle-screen) .stButton > button {
+    padding: 0.3rem 0.8rem !important;
+    font-size: 0.9rem !important;
+}
+
+/* カードを小さく */
+.stApp:has(.battle-screen) div[style*="min-height: 140px"] {
+    min-height: 100px !important;
+    padding: 10px !important;
+    margin: 3px 0 !important;
+}
+
+/* 区切り線を削除 */
+.stApp:has(.battle-screen) hr {
+    margin: 0.3rem 0 !important;
+}
+</style>
+"""
+
+PLAYER_PORTRAIT_HTML = """
+<div style='text-align: center; margin-bottom: 10px;'>
+    <div style='
+        width: 80px;
+        height: 80px;
+        margin: 0 auto;
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        border-radius: 50%;
+        display: flex;
+        align-items: center;
+        justify-content: center;
+        font-size: 3rem;
+        box-shadow: 0 4px 12px rgba(102, 126, 234, 0.4);
+        border: 3px solid rgba(255, 255, 255, 0.3);
+    '>
+        🧙
+    </div>
+    <div style='color: white; font-weight: bold; margin-top: 5px; font-size: 0.9rem;'>プレイヤー</div>
+</div>
+"""
+
+ELEMENT_GUIDE_HTML = """
+<div style='font-size: 0.8rem;'>
+    <div style='background: rgba(255, 107, 107, 0.3); padding: 8px; border-radius: 6px; margin-bottom: 6px; border-left: 3px solid #FF6B6B;'>
+        <strong>🔥 燃焼</strong> 炎 + 草: 追加+12 | 持続10×3T
+    </div>
+    <div style='background: rgba(78, 205, 196, 0.3); padding: 8px; border-radius: 6px; margin-bottom: 6px; border-left: 3px solid #4ECDC4;'>
+        <strong>💧 蒸発</strong> 炎 + 水: 追加+30 高威力！
+    </div>
+    <div style='background: rgba(149, 231, 125, 0.3); padding: 8px; border-radius: 6px; margin-bottom: 6px; border-left: 3px solid #95E77D;'>
+        <strong>🌿 成長</strong> 水 + 草: 追加+25 | HP回復12%
+    </div>
+    <div style='background: rgba(180, 100, 220, 0.3); padding: 8px; border-radius: 6px; margin-bottom: 4px; border-left: 3px solid #b464dc;'>
+        <strong>💀 デバフカード</strong><br>
+        ⬇️ 弱体化: 敵攻撃力ダウン<br>
+        💫 スタン: 1T行動不能<br>
+        ☠️ 毒: 毎T継続ダメージ<br>
+        ❄️ 氷結: 弱体化 + 水付与
+    </div>
+    <p style='margin-top: 6px; font-size: 0.75rem; color: rgba(255,255,255,0.7);'>
+        ⏳ 反応後1ターンは元素付着不可
+    </p>
+</div>
+"""
+
+# ===== 入力ごとにメモ化する断片 =====
+
+@lru_cache(maxsize=64)
+def enemy_portrait_html(enemy_name: str) -> str:
+    """敵の画像と名前（アニメーションは BATTLE_LAYOUT_CSS の enemyPulse）"""
+    return f"""
+<div style='text-align: center; margin-bottom: 10px;'>
+    <div style='
+        width: 80px;
+        height: 80px;
+        margin: 0 auto;
+        background: linear-gradient(135deg, #ff6b6b 0%, #ee5a6f 100%);
+        border-radius: 50%;
+        display: flex;
+        align-items: center;
+        justify-content: center;
+        font-size: 3rem;
+        box-shadow: 0 4px 12px rgba(255, 107, 107, 0.4);
+        border: 3px solid rgba(255, 255, 255, 0.3);
+        animation: enemyPulse 2s ease-in-out infinite;
+    '>
+        {get_enemy_emoji(enemy_name)}
+    </div>
+    <div style='color: white; font-weight: bold; margin-top: 5px; font-size: 0.9rem;'>{enemy_name}</div>
+</div>
+"""
+
+
+@lru_cache(maxsize=128)
+def energy_bars_html(current_energy: int, max_energy: int) -> str:
+    """
+    エネルギーをmax_energy個のバーで表示
+    各バーには⚡マークを表示
+    """
+    # 安全クランプ
+    max_energy = max(1, int(max_energy))
+    current_energy = max(0, min(int(current_energy), max_energy))
+
+    html = '<div style="width: 100%; margin-top: 4px; padding: 2px 0;">'
+    html += f'<div style="font-size:0.7rem; color:rgba(255,255,255,0.7); margin-bottom:2px;">⚡ {current_energy}/{max_energy}</div>'
+    html += '<div style="display: flex; gap: 3px; align-items: center;">'
+
+    # max_energy個のバーを描画（最大10個まで）
+    for i in range(min(max_energy, 10)):
+        # バーi（0-4）が現在のエネルギー値より小さい場合は色、大きい場合は黒
+        if i < current_energy:
+            # 色（残りエネルギー）- グラデーション効果
+            bg_gradient = "linear-gradient(135deg, #5DBDAE 0%, #6ECDC4 100%)"
+            border_color = "rgba(110, 205, 196, 0.8)"
+            box_shadow = "0 4px 12px rgba(110, 205, 196, 0.5), inset -1px -1px 3px rgba(0, 0, 0, 0.2)"
+            icon = "⚡"
+            icon_color = "#FFE135"
+        else:
+            # 黒（使用済み）- グラデーション効果
+            bg_gradient = "linear-gradient(135deg, #252525 0%, #2C2C2C 100%)"
+            border_color = "rgba(255, 255, 255, 0.2)"
+            box_shadow = "0 2px 6px rgba(0, 0, 0, 0.4), inset 1px 1px 2px rgba(255, 255, 255, 0.05)"
+            icon = ""
+            icon_color = "transparent"
+
+        bar_html = f"""<div style="
+            flex: 1;
+            height: 24px;
+            background: {bg_gradient};
+            border-radius: 4px;
+            border: 1.5px solid {border_color};
+            box-shadow: {box_shadow};
+            transition: all 0.3s cubic-bezier(0.25, 0.46, 0.45, 0.94);
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-size: 13px;
+            font-weight: bold;
+            color: {icon_color};
+            cursor: default;
+        ">{icon}</div>"""
+        html += bar_html
+
+    html += '</div>'
+    html += '</div>'  # 外側div閉じる
+
+    return html
+
+
+@lru_cache(maxsize=512)
+def card_html(name: str, element: str, card_type: str, cost: int, description: str, can_use: bool) -> str:
+    """手札のカード1枚（TCGスタイル）。使えるかどうかで見た目が変わる"""
+    color = ELEMENT_COLORS.get(element, "#888888")
+    element_emoji = get_element_emoji(element)
+    type_icon = CARD_TYPE_ICONS.get(card_type, "🎴")
+    opacity = "1" if can_use else "0.5"
+    border_color = "rgba(255, 255, 255, 0.3)" if can_use else "rgba(255, 0, 0, 0.5)"
+
+    return f"""
+<div style="background: linear-gradient(135deg, {color} 0%, {color}CC 100%);
+            border: 2px solid {border_color};
+            border-radius: 8px;
+            padding: 0;
+            margin: 2px 0;
+            color: white;
+            text-shadow: 1px 1px 2px rgba(0, 0, 0, 0.7);
+            min-height: 130px;
+            max-height: 130px;
+            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.3);
+            opacity: {opacity};
+            font-size: 0.75rem;
+            overflow: hidden;
+            display: flex;
+            flex-direction: column;">
+    <div style="background: rgba(0,0,0,0.2); padding: 6px; text-align: center; flex-shrink: 0;">
+        <div style="font-size: 28px; line-height: 1;">{type_icon}</div>
+    </div>
+    <div style="padding: 4px 8px; background: rgba(0,0,0,0.1); flex-shrink: 0;">
+        <div style="font-size: 0.8rem; font-weight: bold; white-space: nowrap; overflow: hidden; text-overflow: ellipsis;">
+            {element_emoji} {name}
+        </div>
+        <div style="font-size: 0.65rem; background: rgba(0, 0, 0, 0.3); display: inline-block; padding: 1px 4px; border-radius: 3px; margin-top: 2px;">
+            ⚡{cost}
+        </div>
+    </div>
+    <div style="padding: 3px 8px; background: rgba(0,0,0,0.2); font-size: 0.65rem; line-height: 1.3; overflow: hidden; max-height: 3.5em; flex-grow: 1; word-wrap: break-word;">
+        {description}
+    </div>
+</div>
+    """
+
+
+@lru_cache(maxsize=16)
+def screen_effect_css(shake: bool, flash: Optional[str]) -> str:
+    """被ダメージ時の画面シェイク・フラッシュ（どちらもなければ空文字列）"""
+    css = ""
+    if shake:
+        css += """
+@keyframes shake {
+    0%, 100% { transform: translateX(0); }
+    10%, 30%, 50%, 70%, 90% { transform: translateX(-5px); }
+    20%, 40%, 60%, 80% { transform: translateX(5px); }
+}
+.main { animation: shake 0.5s ease-in-out; }
+"""
+    if flash:
+        flash_color = "#ff000040" if flash == "damage" else "#00ff0040"
+        css += f"""
+@keyframes flash {{
+    0%, 100% {{ background-color: transparent; }}
+    50% {{ background-color: {flash_color}; }}
+}}
+.main::before {{
+    content: "";
+    position: fixed;
+    top: 0;
+    left: 0;
+    width: 100%;
+    height: 100%;
+    animation: flash 0.3s ease-out;
+    pointer-events: none;
+    z-index: 9998;
+}}
+"""
+    return f"<style>{css}</style>" if css else ""
+
+
+@lru_cache(maxsize=256)
+def damage_popup_html(text: str, color: str, left: str) -> str:
+    """ダメージ数字のポップアップ（アニメーションは BATTLE_LAYOUT_CSS の damagePopup）"""
+    return f"""
+<div style='
+    position: fixed;
+    top: 35%;
+    left: {left};
+    transform: translate(-50%, -50%);
+    text-align: center;
+    pointer-events: none;
+    z-index: 9999;
+    font-size: 5rem;
+    font-weight: bold;
+    color: {color};
+    text-shadow:
+        0 0 10px rgba(0,0,0,0.8),
+        0 0 20px {color},
+        0 0 40px {color},
+        2px 2px 4px rgba(0,0,0,0.9);
+    animation: damagePopup 1.7s ease-out forwards;
+    -webkit-text-stroke: 2px rgba(0,0,0,0.5);
+'>
+    {text}
+</div>
+"""
+
+
+@lru_cache(maxsize=16)
+def energy_popup_html(amount: int) -> str:
+    """エネルギー消費のポップアップ"""
+    return f"""
+<div style='
+    position: fixed;
+    top: 50%;
+    left: 15%;
+    transform: translate(-50%, -50%);
+    text-align: center;
+    pointer-events: none;
+    z-index: 9998;
+    font-size: 3rem;
+    font-weight: bold;
+    color: #FFD93D;
+    text-shadow:
+        0 0 10px rgba(0,0,0,0.8),
+        0 0 20px #FFD93D,
+        0 0 40px #FFD93D,
+        2px 2px 4px rgba(0,0,0,0.9);
+    animation: damagePopup 1.7s ease-out forwards;
+    -webkit-text-stroke: 1.5px rgba(0,0,0,0.5);
+'>
+    -{amount}⚡
+</div>
+"""
+
+
+@lru_cache(maxsize=256)
+def battle_header_html(battle_count: int) -> str:
+    """戦闘番号の見出し"""
+    return f"""
+<div style='text-align: center; margin-bottom: 10px;'>
+    <h2 style='color: white; font-size: 1.2rem; margin: 0; text-shadow: 0 0 10px rgba(255, 255, 255, 0.3);'>
+        ⚔️ 第{battle_count}戦 ⚔️
+    </h2>
+</div>
+"""
@@ -0,0 +1 @@
+"""pytest の設定（このファイルのあるリポジトリ直下が sys.path に入り、tests から各モジュールを import できる）"""
@@ -1,7 +1,8 @@
+import functools
 import os
 import sys
 
-# Graphvizのパスを設定（最優先で実行）
+# Graphvizのパスを設定（MAP_BACKEND=graphviz の場合のみ使う。最優先で実行）
 if os.name == 'nt':  # Windows
     possible_paths = [
         r"C:\Program Files (x86)\Graphviz\bin",
@@ -14,34 +15,27 @@ if os.name == 'nt':  # Windows
             break
 
 import streamlit as st
-import random
-from typing import List, Optional
 import game_data  # 永続データ管理
 import styles as styles  # コンパクトなスタイル
 import floor_tree  # フロアツリーシステム
+import battle_engine  # 戦闘ルール（Streamlit非依存）
+import run_engine  # ラン進行ルール（Streamlit非依存）
+import replay_log  # 操作ログの記録・再生
+import battle_view  # 戦闘画面のHTML断片（メモ化）
+from battle_view import CARD_TYPE_ICONS, get_element_emoji
+from battle_engine import (
+    ELEMENT_NONE, ELEMENT_FIRE, ELEMENT_WATER, ELEMENT_NATURE,
+    CARD_ATTACK,
+    get_action_description,
+)
 
-# ===== 定数定義 =====
+# ===== スタイル =====
 
-ELEMENT_NONE = "無"
-ELEMENT_FIRE = "炎"
-ELEMENT_WATER = "水"
-ELEMENT_NATURE = "草"
+# 静的なCSS（登録順に <head> へ入る。戦闘画面の規則を後にして共通の規則を上書きする）
+styles.register_stylesheet("compact", styles.COMPACT_CSS)
+styles.register_stylesheet("battle", battle_view.BATTLE_LAYOUT_CSS)
 
-CARD_ATTACK = "攻撃"
-CARD_DEFEND = "防御"
-CARD_BUFF = "バフ"
-CARD_DEBUFF = "デバフ"
-CARD_DRAW = "ドロー"
-
-# ===== カードタイプとアイコン =====
-
-CARD_TYPE_ICONS = {
-    CARD_ATTACK: "⚔️",
-    CARD_DEFEND: "🛡️",
-    CARD_BUFF: "⭐",
-    CARD_DEBUFF: "💀",
-    CARD_DRAW: "🎴",
-}
+# ===== アイコン =====
 
 # デバフタイプのアイコン
 DEBUFF_TYPE_ICONS = {
@@ -51,741 +45,38 @@ DEBUFF_TYPE_ICONS = {
     "freeze": "❄️",
 }
 
-# ===== カードデータベース =====
-
-def create_basic_cards() -> List[dict]:
-    """基本カードセットを作成"""
-    return [
-        # 攻撃カード（高コストほどコスト効率良く）
-        {"name": "基本攻撃", "type": CARD_ATTACK, "cost": 1, "element": ELEMENT_NONE, "damage": 10, "description": "ダメージ10"},
-        {"name": "火球", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_FIRE, "damage": 22, "description": "ダメージ22 + 炎付与"},
-        {"name": "水鉄砲", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_WATER, "damage": 22, "description": "ダメージ22 + 水付与"},
-        {"name": "草の鞭", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_NATURE, "damage": 22, "description": "ダメージ22 + 草付与"},
-        {"name": "メテオ", "type": CARD_ATTACK, "cost": 3, "element": ELEMENT_FIRE, "damage": 40, "description": "ダメージ40 + 炎付与"},
-        {"name": "大洪水", "type": CARD_ATTACK, "cost": 3, "element": ELEMENT_WATER, "damage": 40, "description": "ダメージ40 + 水付与"},
-        {"name": "森の怒り", "type": CARD_ATTACK, "cost": 3, "element": ELEMENT_NATURE, "damage": 40, "description": "ダメージ40 + 草付与"},
-        {"name": "烈火斬", "type": CARD_ATTACK, "cost": 4, "element": ELEMENT_FIRE, "damage": 60, "description": "ダメージ60 + 炎付与"},
-        
-        # 防御カード（バランス調整）
-        {"name": "基本防御", "type": CARD_DEFEND, "cost": 1, "element": ELEMENT_NONE, "shield": 8, "description": "シールド8獲得"},
-        {"name": "鉄壁", "type": CARD_DEFEND, "cost": 2, "element": ELEMENT_NONE, "shield": 20, "description": "シールド20獲得"},
-        {"name": "完全防御", "type": CARD_DEFEND, "cost": 3, "element": ELEMENT_NONE, "shield": 38, "description": "シールド38獲得"},
-        
-        # バフカード（効果を抑えて持続を長く）
-        {"name": "闘志", "type": CARD_BUFF, "cost": 1, "element": ELEMENT_NONE, "buff_value": 0.15, "buff_duration": 2, "description": "攻撃力+15% 2ターン"},
-        {"name": "集中", "type": CARD_BUFF, "cost": 2, "element": ELEMENT_NONE, "buff_value": 0.3, "buff_duration": 3, "description": "攻撃力+30% 3ターン"},
-        {"name": "覚醒", "type": CARD_BUFF, "cost": 3, "element": ELEMENT_NONE, "buff_value": 0.6, "buff_duration": 2, "description": "攻撃力+60% 2ターン"},
-        
-        # ドローカード（コスト調整）
-        {"name": "占い", "type": CARD_DRAW, "cost": 1, "element": ELEMENT_NONE, "draw_count": 1, "description": "カード1枚ドロー"},
-        {"name": "策略", "type": CARD_DRAW, "cost": 2, "element": ELEMENT_NONE, "draw_count": 2, "description": "カード2枚ドロー"},
-        {"name": "大量ドロー", "type": CARD_DRAW, "cost": 3, "element": ELEMENT_NONE, "draw_count": 3, "description": "カード3枚ドロー"},
-        
-        # デバフカード（敵を弱体化）
-        {"name": "威圧", "type": CARD_DEBUFF, "cost": 1, "element": ELEMENT_NONE, "debuff_type": "weaken", "debuff_value": 0.25, "debuff_duration": 2, "description": "敵の攻撃力-25% 2ターン"},
-        {"name": "束縛", "type": CARD_DEBUFF, "cost": 2, "element": ELEMENT_NONE, "debuff_type": "stun", "debuff_value": 1, "debuff_duration": 1, "description": "敵を1ターン行動不能にする"},
-        {"name": "毒霧", "type": CARD_DEBUFF, "cost": 2, "element": ELEMENT_NATURE, "debuff_type": "poison", "debuff_value": 8, "debuff_duration": 4, "description": "毒: 4ターン間毎ターン8ダメージ + 草付与"},
-        {"name": "呪縛", "type": CARD_DEBUFF, "cost": 3, "element": ELEMENT_NONE, "debuff_type": "weaken", "debuff_value": 0.5, "debuff_duration": 3, "description": "敵の攻撃力-50% 3ターン"},
-        {"name": "氷結", "type": CARD_DEBUFF, "cost": 2, "element": ELEMENT_WATER, "debuff_type": "freeze", "debuff_value": 0.3, "debuff_duration": 2, "description": "敵の攻撃力-30% 2ターン + 水付与"},
-
-        # 複合カード
-        {"name": "連撃", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_NONE, "damage": 15, "draw_count": 1, "description": "ダメージ15 + カード1枚ドロー"},
-        {"name": "防壁術", "type": CARD_DEFEND, "cost": 1, "element": ELEMENT_NONE, "shield": 12, "buff_value": 0.1, "buff_duration": 1, "description": "シールド12 + 攻撃+10% 1ターン"},
-        {"name": "魔力強化", "type": CARD_BUFF, "cost": 2, "element": ELEMENT_NONE, "buff_value": 0.25, "buff_duration": 2, "draw_count": 1, "description": "攻撃+25% 2ターン + ドロー1枚"},
-        {"name": "急速成長", "type": CARD_DRAW, "cost": 2, "element": ELEMENT_NATURE, "draw_count": 2, "damage": 10, "description": "カード2枚ドロー + ダメージ10"},
-    ]
-
-def create_starter_deck() -> List[dict]:
-    """初期デッキを作成"""
-    cards = []
-    # 基本攻撃 × 3
-    for _ in range(3):
-        cards.append({"name": "基本攻撃", "type": CARD_ATTACK, "cost": 1, "element": ELEMENT_NONE, "damage": 10, "description": "ダメージ10"})
-    # 元素攻撃カード（調整後の数値）
-    cards.append({"name": "火球", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_FIRE, "damage": 22, "description": "ダメージ22 + 炎付与"})
-    cards.append({"name": "水鉄砲", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_WATER, "damage": 22, "description": "ダメージ22 + 水付与"})
-    cards.append({"name": "草の鞭", "type": CARD_ATTACK, "cost": 2, "element": ELEMENT_NATURE, "damage": 22, "description": "ダメージ22 + 草付与"})
-    # 基本防御 × 2
-    for _ in range(2):
-        cards.append({"name": "基本防御", "type": CARD_DEFEND, "cost": 1, "element": ELEMENT_NONE, "shield": 8, "description": "シールド8獲得"})
-    # 占い × 2
-    for _ in range(2):
-        cards.append({"name": "占い", "type": CARD_DRAW, "cost": 1, "element": ELEMENT_NONE, "draw_count": 1, "description": "カード1枚ドロー"})
-    return cards
-
-# ===== 元素反応システム =====
-
-def check_element_reaction(current_element: Optional[str], new_element: str) -> tuple[bool, str, int, str]:
-    """
-    元素反応をチェック
-    Returns: (反応発生, 反応名, 追加ダメージ, 反応タイプ)
-    """
-    if current_element is None or new_element == ELEMENT_NONE:
-        return False, "", 0, ""
-    
-    reactions = {
-        (ELEMENT_FIRE, ELEMENT_NATURE): ("🔥燃焼", 12, "持続ダメージ発動！", "burn"),
-        (ELEMENT_NATURE, ELEMENT_FIRE): ("🔥燃焼", 12, "持続ダメージ発動！", "burn"),
-        (ELEMENT_FIRE, ELEMENT_WATER): ("💧蒸発", 30, "大ダメージ！", "vaporize"),
-        (ELEMENT_WATER, ELEMENT_FIRE): ("💧蒸発", 30, "大ダメージ！", "vaporize"),
-        (ELEMENT_WATER, ELEMENT_NATURE): ("🌿成長", 25, "自然の力！", "bloom"),
-        (ELEMENT_NATURE, ELEMENT_WATER): ("🌿成長", 25, "自然の力！", "bloom"),
-    }
-    
-    reaction_key = (current_element, new_element)
-    if reaction_key in reactions:
-        name, damage, msg, reaction_type = reactions[reaction_key]
-        return True, f"⚡元素反応 {name}！ {msg}", damage, reaction_type
-    
-    return False, "", 0, ""
-
-# ===== ゲームロジック =====
-
-def draw_cards(count: int):
-    """カードをドローする"""
-    for _ in range(count):
-        if len(st.session_state.deck) == 0:
-            # デッキが空なら捨て札をシャッフルして戻す
-            if len(st.session_state.discard) == 0:
-                break
-            st.session_state.deck = st.session_state.discard.copy()
-            st.session_state.discard = []
-            random.shuffle(st.session_state.deck)
-            st.session_state.battle_log.append("🔄 捨て札をシャッフルしてデッキに戻しました")
-        
-        if len(st.session_state.deck) > 0:
-            card = st.session_state.deck.pop(0)
-            st.session_state.hand.append(card)
-
-def play_card(card_index: int):
-    """カードをプレイする"""
-    # インデックス範囲チェック（rerun後に手札が変わっている場合の防御）
-    if card_index >= len(st.session_state.hand):
-        return
-
-    card = st.session_state.hand[card_index]
-    cost = card.get("cost", 0)
-
-    # エネルギー上限を強制（念のためクランプ）
-    st.session_state.energy = min(st.session_state.energy, st.session_state.max_energy)
-
-    # コストチェック（描画タイミングズレによる二重消費・不正使用を防ぐ）
-    if st.session_state.energy < cost:
-        st.session_state.battle_log.append(f"❌ エネルギー不足！（必要: {cost}, 残り: {st.session_state.energy}）")
-        return
-
-    # コスト消費
-    st.session_state.energy -= cost
-    # 念のため下限クランプ
-    st.session_state.energy = max(0, st.session_state.energy)
-    
-    # エネルギー消費エフェクトを設定
-    st.session_state.energy_effect = {
-        "amount": cost
-    }
-    st.session_state.show_energy_effect = True
-    
-    st.session_state.battle_log.append(f"🎴 {card['name']} を使用！（コスト{cost}）")
-    
-    # カードの効果を適用
-    card_type = card.get("type")
-    
-    if card_type == CARD_ATTACK:
-        # ダメージ計算（バフ適用）
-        base_damage = card.get("damage", 0)
-        total_damage = base_damage
-        if st.session_state.attack_buff_duration > 0:
-            total_damage = int(total_damage * (1 + st.session_state.attack_buff))
-            st.session_state.battle_log.append(f"💪 バフ効果で{base_damage} → {total_damage}ダメージに強化！")
-        
-        # 元素反応チェック
-        reaction_occurred, reaction_msg, reaction_damage, reaction_type = check_element_reaction(
-            st.session_state.enemy["element"], 
-            card.get("element", ELEMENT_NONE)
-        )
-        
-        reaction_bonus = 0
-        if reaction_occurred:
-            st.session_state.battle_log.append(reaction_msg)
-            reaction_bonus = reaction_damage
-            total_damage += reaction_damage
-            
-            # 燃焼反応の場合、持続ダメージを設定
-            if reaction_type == "burn":
-                st.session_state.enemy["burn"] = 10  # 毎ターン10ダメージ
-                st.session_state.enemy["burn_duration"] = 3  # 3ターン持続
-                st.session_state.battle_log.append(f"🔥 燃焼付与！ 3ターンの間、毎ターン10ダメージ")
-            
-            # 成長反応の場合、HP回復
-            if reaction_type == "bloom":
-                heal_amount = int(st.session_state.player_max_hp * 0.12)  # 最大HPの12%
-                st.session_state.player_hp = min(st.session_state.player_max_hp, st.session_state.player_hp + heal_amount)
-                st.session_state.battle_log.append(f"🌿 HP回復！ +{heal_amount} (現在: {st.session_state.player_hp}/{st.session_state.player_max_hp})")
-            
-            # 元素反応が起きたら元素をリセット＆クールダウン設定
-            st.session_state.enemy["element"] = None
-            st.session_state.enemy["element_duration"] = 0
-            st.session_state.element_reaction_cooldown = 1  # 1ターン元素付着不可
-        else:
-            # 元素反応が起きなかった場合のみ新しい元素を付与
-            element = card.get("element", ELEMENT_NONE)
-            # クールダウン中は元素付着不可
-            if element != ELEMENT_NONE and not hasattr(st.session_state, 'element_reaction_cooldown'):
-                st.session_state.element_reaction_cooldown = 0
-            
-            if element != ELEMENT_NONE and st.session_state.element_reaction_cooldown == 0:
-                st.session_state.enemy["element"] = element
-                st.session_state.enemy["element_duration"] = 2
-                st.session_state.battle_log.append(f"🔥 敵に{element}を付与！")
-            elif element != ELEMENT_NONE and st.session_state.element_reaction_cooldown > 0:
-                st.session_state.battle_log.append(f"⏳ 反応直後のため{element}は付着しなかった")
-        
-        # ダメージ適用（シールドを考慮）
-        remaining_damage = total_damage
-        shield_blocked = 0
-        
-        if st.session_state.enemy["shield"] > 0:
-            if st.session_state.enemy["shield"] >= total_damage:
-                # シールドで全て防げる
-                shield_blocked = total_damage
-                st.session_state.enemy["shield"] -= total_damage
-                remaining_damage = 0
-                st.session_state.battle_log.append(f"🛡️ 敵のシールドで{shield_blocked}ダメージを完全に防いだ！ (残りシールド: {st.session_state.enemy['shield']})")
-            else:
-                # シールドを貫通
-                shield_blocked = st.session_state.enemy["shield"]
-                remaining_damage = total_damage - st.session_state.enemy["shield"]
-                st.session_state.battle_log.append(f"🛡️ 敵のシールドで{shield_blocked}ダメージを防いだ！ (残り{remaining_damage}ダメージ)")
-                st.session_state.enemy["shield"] = 0
-        
-        # HPにダメージ
-        st.session_state.enemy["hp"] -= remaining_damage
-        if st.session_state.enemy["hp"] < 0:
-            st.session_state.enemy["hp"] = 0
-        
-        # ダメージエフェクトを設定
-        # 元素に応じた色を設定
-        element = card.get("element", ELEMENT_NONE)
-        element_colors = {
-            ELEMENT_FIRE: "#ff4444",      # 炎: 赤
-            ELEMENT_WATER: "#4488ff",     # 水: 青
-            ELEMENT_NATURE: "#44ff44",    # 草: 緑
-            ELEMENT_NONE: "#ff6b6b"       # 無: ピンク
-        }
-        effect_color = element_colors.get(element, "#ff6b6b")
-        
-        # 元素反応時は反応名を追加
-        reaction_text = ""
-        if reaction_occurred:
-            # 反応名を抽出（"⚡元素反応 🔥燃焼！ 持続ダメージ発動！" から "🔥燃焼" を取得）
-            reaction_name = reaction_msg.split("！")[0].split(" ")[-1] if "！" in reaction_msg else ""
-            reaction_text = reaction_name
-        
-        st.session_state.damage_effect = {
-            "type": "enemy",
-            "amount": total_damage,
-            "color": effect_color,
-            "reaction": reaction_text
-        }
-        st.session_state.screen_shake = True
-        st.session_state.show_effect = True  # エフェクト表示フラグをオン
-        
-        # 詳細なダメージログ
-        if remaining_damage > 0:
-            if reaction_bonus > 0:
-                st.session_state.battle_log.append(f"⚔️ {remaining_damage}ダメージ！ (基本{base_damage} + 反応{reaction_bonus} - シールド{shield_blocked}) → 残りHP: {st.session_state.enemy['hp']}/{st.session_state.enemy['max_hp']}")
-            else:
-                st.session_state.battle_log.append(f"⚔️ {remaining_damage}ダメージ！ → 残りHP: {st.session_state.enemy['hp']}/{st.session_state.enemy['max_hp']}")
-        elif shield_blocked > 0:
-            # ダメージが0でもシールドでブロックした場合は表示済み
-            pass
-
-        # Bug2修正: 攻撃カードの複合ドロー効果（連撃など）
-        if card.get("draw_count"):
-            draw_count = card.get("draw_count", 0)
-            draw_cards(draw_count)
-            st.session_state.battle_log.append(f"📥 {draw_count}枚追加ドロー！（手札: {len(st.session_state.hand)}枚）")
-    
-    elif card_type == CARD_DEFEND:
-        shield_amount = card.get("shield", 0)
-        st.session_state.shield += shield_amount
-        st.session_state.battle_log.append(f"🛡️ シールド{shield_amount}獲得！（現在: {st.session_state.shield}）")
-        # 複合効果：防御+バフ（防壁術など）
-        if card.get("buff_value"):
-            new_buff = card.get("buff_value", 0)
-            new_dur = card.get("buff_duration", 1)
-            # バフは加算（上書きではなく最大値を採用し残りターンも延長）
-            st.session_state.attack_buff = max(st.session_state.attack_buff, new_buff)
-            st.session_state.attack_buff_duration = max(st.session_state.attack_buff_duration, new_dur)
-            st.session_state.battle_log.append(f"💪 さらに攻撃力+{int(new_buff*100)}% {new_dur}ターン！")
-
-    elif card_type == CARD_BUFF:
-        new_buff = card.get("buff_value", 0)
-        new_dur = card.get("buff_duration", 0)
-        # バフは加算（既存バフより強ければ上書き、残りターンも延長）
-        st.session_state.attack_buff = max(st.session_state.attack_buff, new_buff)
-        st.session_state.attack_buff_duration = max(st.session_state.attack_buff_duration, new_dur)
-        st.session_state.battle_log.append(f"💪 攻撃力+{int(new_buff*100)}% {new_dur}ターン！（現在: +{int(st.session_state.attack_buff*100)}%）")
-        # 複合効果：バフ+ドロー（魔力強化など）
-        if card.get("draw_count"):
-            draw_count = card.get("draw_count", 0)
-            draw_cards(draw_count)
-            st.session_state.battle_log.append(f"📥 カード{draw_count}枚追加ドロー！（手札: {len(st.session_state.hand)}枚）")
-
-    elif card_type == CARD_DEBUFF:
-        debuff_type = card.get("debuff_type", "")
-        debuff_value = card.get("debuff_value", 0)
-        debuff_duration = card.get("debuff_duration", 1)
-
-        if debuff_type == "weaken":
-            # 弱体化: 敵の攻撃力を一時的に下げる
-            if "debuff_weaken" not in st.session_state.enemy:
-                st.session_state.enemy["debuff_weaken"] = 0
-                st.session_state.enemy["debuff_weaken_duration"] = 0
-            # 既存より強い弱体化のみ適用
-            st.session_state.enemy["debuff_weaken"] = max(st.session_state.enemy.get("debuff_weaken", 0), debuff_value)
-            st.session_state.enemy["debuff_weaken_duration"] = max(
-                st.session_state.enemy.get("debuff_weaken_duration", 0), debuff_duration
-            )
-            st.session_state.battle_log.append(
-                f"💀 敵に弱体化付与！ 攻撃力-{int(debuff_value*100)}% {debuff_duration}ターン"
-            )
-        elif debuff_type == "stun":
-            # スタン: 次のターン行動不能
-            st.session_state.enemy["stunned"] = True
-            st.session_state.battle_log.append("💀 敵をスタン！ 次のターン行動不能")
-        elif debuff_type == "poison":
-            # 毒: 毎ターンダメージ（燃焼とは別管理）
-            st.session_state.enemy["poison"] = debuff_value
-            st.session_state.enemy["poison_duration"] = debuff_duration
-            st.session_state.battle_log.append(
-                f"☠️ 毒付与！ {debuff_duration}ターン間毎ターン{debuff_value}ダメージ"
-            )
-            # 草属性付与
-            element = card.get("element", ELEMENT_NONE)
-            if element != ELEMENT_NONE and st.session_state.element_reaction_cooldown == 0:
-                st.session_state.enemy["element"] = element
-                st.session_state.enemy["element_duration"] = 2
-                st.session_state.battle_log.append(f"🌿 敵に草を付与！")
-        elif debuff_type == "freeze":
-            # 氷結: 攻撃力低下 + 水属性付与
-            st.session_state.enemy["debuff_weaken"] = max(st.session_state.enemy.get("debuff_weaken", 0), debuff_value)
-            st.session_state.enemy["debuff_weaken_duration"] = max(
-                st.session_state.enemy.get("debuff_weaken_duration", 0), debuff_duration
-            )
-            st.session_state.battle_log.append(
-                f"❄️ 氷結付与！ 攻撃力-{int(debuff_value*100)}% {debuff_duration}ターン"
-            )
-            element = card.get("element", ELEMENT_NONE)
-            if element != ELEMENT_NONE and st.session_state.element_reaction_cooldown == 0:
-                st.session_state.enemy["element"] = element
-                st.session_state.enemy["element_duration"] = 2
-                st.session_state.battle_log.append(f"💧 敵に水を付与！")
-
-    elif card_type == CARD_DRAW:
-        draw_count = card.get("draw_count", 0)
-        draw_cards(draw_count)
-        st.session_state.battle_log.append(f"📥 カード{draw_count}枚ドロー！（手札: {len(st.session_state.hand)}枚）")
-        # Bug3修正: ドローカードの複合ダメージ効果（急速成長など）
-        if card.get("damage"):
-            base_damage = card.get("damage", 0)
-            total_damage = base_damage
-            if st.session_state.attack_buff_duration > 0:
-                total_damage = int(total_damage * (1 + st.session_state.attack_buff))
-            element = card.get("element", ELEMENT_NONE)
-            reaction_occurred, reaction_msg, reaction_damage, reaction_type = check_element_reaction(
-                st.session_state.enemy["element"], element
-            )
-            if reaction_occurred:
-                st.session_state.battle_log.append(reaction_msg)
-                total_damage += reaction_damage
-                st.session_state.enemy["element"] = None
-                st.session_state.enemy["element_duration"] = 0
-                st.session_state.element_reaction_cooldown = 1
-            elif element != ELEMENT_NONE and st.session_state.element_reaction_cooldown == 0:
-                st.session_state.enemy["element"] = element
-                st.session_state.enemy["element_duration"] = 2
-            # ダメージ適用
-            remaining = total_damage
-            if st.session_state.enemy["shield"] > 0:
-                blocked = min(st.session_state.enemy["shield"], total_damage)
-                st.session_state.enemy["shield"] -= blocked
-                remaining = total_damage - blocked
-            st.session_state.enemy["hp"] = max(0, st.session_state.enemy["hp"] - remaining)
-            if remaining > 0:
-                st.session_state.battle_log.append(
-                    f"⚔️ {remaining}ダメージ！ → 残りHP: {st.session_state.enemy['hp']}/{st.session_state.enemy['max_hp']}"
-                )
-    
-    # カードを捨て札へ
-    st.session_state.hand.pop(card_index)
-    st.session_state.discard.append(card)
-
-def enemy_turn():
-    """敵のターン"""
-    st.session_state.battle_log.append("--- 👾 敵のターン ---")
-
-    # 毒ダメージ処理
-    if st.session_state.enemy.get("poison_duration", 0) > 0:
-        poison_dmg = st.session_state.enemy.get("poison", 0)
-        st.session_state.enemy["hp"] -= poison_dmg
-        if st.session_state.enemy["hp"] < 0:
-            st.session_state.enemy["hp"] = 0
-        st.session_state.battle_log.append(
-            f"☠️ 毒ダメージ！ {poison_dmg}ダメージ (残り{st.session_state.enemy['poison_duration']}ターン)"
-        )
-        st.session_state.enemy["poison_duration"] -= 1
-        if st.session_state.enemy["hp"] <= 0:
-            st.session_state.shield = 0
-            return
-
-    # 敵が生きている場合のみ行動
-    if st.session_state.enemy["hp"] > 0:
-        # スタン中は行動スキップ
-        if st.session_state.enemy.get("stunned", False):
-            st.session_state.battle_log.append("💫 敵はスタン中！ 行動できない")
-            st.session_state.enemy["stunned"] = False
-        else:
-            action = st.session_state.enemy["next_action"]
-            desc, icon = get_action_description(action)
-
-            # 弱体化による攻撃力補正
-            base_attack = st.session_state.enemy["attack"]
-            weaken = st.session_state.enemy.get("debuff_weaken", 0)
-            effective_attack = int(base_attack * (1 - weaken))
-
-            if action == "attack":
-                damage = effective_attack
-                st.session_state.battle_log.append(f"{icon} 敵の{desc}！")
-                if weaken > 0:
-                    st.session_state.battle_log.append(f"⬇️ 弱体化中 (-{int(weaken*100)}%): {base_attack} → {effective_attack}")
-                apply_damage_to_player(damage)
-
-            elif action == "big_attack":
-                damage = int(effective_attack * 1.5)
-                st.session_state.battle_log.append(f"{icon} 敵の{desc}！")
-                if weaken > 0:
-                    st.session_state.battle_log.append(f"⬇️ 弱体化中 (-{int(weaken*100)}%): {int(base_attack*1.5)} → {damage}")
-                apply_damage_to_player(damage)
-
-            elif action == "defend":
-                shield_amount = int(effective_attack * 1.2)
-                st.session_state.enemy["shield"] += shield_amount
-                st.session_state.battle_log.append(
-                    f"{icon} 敵は{desc}を取った！ シールド+{shield_amount} (現在: {st.session_state.enemy['shield']})"
-                )
-
-        # 弱体化のターン経過
-        if st.session_state.enemy.get("debuff_weaken_duration", 0) > 0:
-            st.session_state.enemy["debuff_weaken_duration"] -= 1
-            if st.session_state.enemy["debuff_weaken_duration"] == 0:
-                st.session_state.enemy["debuff_weaken"] = 0
-                st.session_state.battle_log.append("✅ 敵の弱体化が解除された")
-
-        # 次の行動を決定
-        decide_enemy_action()
-
-    # プレイヤーのシールドをリセット
-    st.session_state.shield = 0
-
-def apply_damage_to_player(damage: int):
-    """プレイヤーにダメージを適用"""
-    # シールドで軽減
-    if st.session_state.shield > 0:
-        if st.session_state.shield >= damage:
-            st.session_state.shield -= damage
-            st.session_state.battle_log.append(f"🛡️ シールドで{damage}ダメージを完全に防いだ！ (残りシールド: {st.session_state.shield})")
-            damage = 0
-        else:
-            damage -= st.session_state.shield
-            st.session_state.battle_log.append(f"🛡️ シールドで{st.session_state.shield}ダメージを防いだ！ (残り{damage}ダメージ)")
-            st.session_state.shield = 0
-    
-    # HPにダメージ
-    if damage > 0:
-        st.session_state.player_hp -= damage
-        st.session_state.battle_log.append(f"💔 {damage}ダメージを受けた！ (残りHP: {st.session_state.player_hp}/{st.session_state.player_max_hp})")
-        
-        # プレイヤーダメージエフェクトを設定
-        st.session_state.damage_effect = {
-            "type": "player",
-            "amount": damage,
-            "color": "#ff4444",
-            "reaction": ""  # プレイヤーダメージには反応なし
-        }
-        st.session_state.screen_shake = True
-        st.session_state.screen_flash = "damage"
-        st.session_state.show_effect = True  # エフェクト表示フラグをオン
-
-def start_turn():
-    """ターン開始処理"""
-    # 燃焼ダメージ処理（ターン開始時）
-    if st.session_state.enemy["burn_duration"] > 0:
-        burn_damage = st.session_state.enemy["burn"]
-        st.session_state.enemy["hp"] -= burn_damage
-        if st.session_state.enemy["hp"] < 0:
-            st.session_state.enemy["hp"] = 0
-        st.session_state.battle_log.append(f"🔥 燃焼ダメージ！ {burn_damage}ダメージ (残り{st.session_state.enemy['burn_duration']}ターン)")
-
-        # 燃焼ダメージエフェクトを表示
-        st.session_state.damage_effect = {
-            "type": "enemy",
-            "amount": burn_damage,
-            "color": "#ff4444",
-            "reaction": "🔥燃焼"
-        }
-        st.session_state.show_effect = True
-
-        st.session_state.enemy["burn_duration"] -= 1
-
-    # エネルギー回復
-    st.session_state.energy = st.session_state.max_energy
-
-    # バフ期間減少（999=休憩所バフ=戦闘中ずっと有効→減らさない）
-    if 0 < st.session_state.attack_buff_duration < 999:
-        st.session_state.attack_buff_duration -= 1
-        if st.session_state.attack_buff_duration == 0:
-            st.session_state.attack_buff = 0
-
-    # 元素期間減少（敵ごと、敵オブジェクト内で管理）
-    if st.session_state.enemy.get("element_duration", 0) > 0:
-        st.session_state.enemy["element_duration"] -= 1
-        if st.session_state.enemy["element_duration"] == 0:
-            st.session_state.enemy["element"] = None
-
-    # 元素反応クールダウン減少
-    if hasattr(st.session_state, 'element_reaction_cooldown') and st.session_state.element_reaction_cooldown > 0:
-        st.session_state.element_reaction_cooldown -= 1
-
-    # アップグレードによるドロー枚数ボーナスを適用
-    draw_bonus = 0
-    if hasattr(st.session_state, 'persistent_data'):
-        draw_bonus = game_data.get_total_effect(st.session_state.persistent_data, "card_draw_bonus")
-    draw_cards(5 + draw_bonus)
-
-# ===== エネルギー表示関数 =====
-
-def render_energy_bars(current_energy: int, max_energy: int) -> str:
-    """
-    エネルギーをmax_energy個のバーで表示
-    各バーには⚡マークを表示
-    """
-    # 安全クランプ
-    max_energy = max(1, int(max_energy))
-    current_energy = max(0, min(int(current_energy), max_energy))
-
-    html = f'<div style="width: 100%; margin-top: 4px; padding: 2px 0;">'
-    html += f'<div style="font-size:0.7rem; color:rgba(255,255,255,0.7); margin-bottom:2px;">⚡ {current_energy}/{max_energy}</div>'
-    html += '<div style="display: flex; gap: 3px; align-items: center;">'
-
-    # max_energy個のバーを描画（最大10個まで）
-    for i in range(min(max_energy, 10)):
-        # バーi（0-4）が現在のエネルギー値より小さい場合は色、大きい場合は黒
-        if i < current_energy:
-            # 色（残りエネルギー）- グラデーション効果
-            bg_gradient = "linear-gradient(135deg, #5DBDAE 0%, #6ECDC4 100%)"
-            border_color = "rgba(110, 205, 196, 0.8)"
-            box_shadow = "0 4px 12px rgba(110, 205, 196, 0.5), inset -1px -1px 3px rgba(0, 0, 0, 0.2)"
-            icon = "⚡"
-            icon_color = "#FFE135"
-        else:
-            # 黒（使用済み）- グラデーション効果
-            bg_gradient = "linear-gradient(135deg, #252525 0%, #2C2C2C 100%)"
-            border_color = "rgba(255, 255, 255, 0.2)"
-            box_shadow = "0 2px 6px rgba(0, 0, 0, 0.4), inset 1px 1px 2px rgba(255, 255, 255, 0.05)"
-            icon = ""
-            icon_color = "transparent"
-        
-        bar_html = f"""<div style="
-            flex: 1;
-            height: 24px;
-            background: {bg_gradient};
-            border-radius: 4px;
-            border: 1.5px solid {border_color};
-            box-shadow: {box_shadow};
-            transition: all 0.3s cubic-bezier(0.25, 0.46, 0.45, 0.94);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 13px;
-            font-weight: bold;
-            color: {icon_color};
-            cursor: default;
-        ">{icon}</div>"""
-        html += bar_html
-    
-    html += '</div>'
-    html += '</div>'  # 外側div閉じる
-    
-    return html
-
 # ===== UI表示 =====
 
-def get_element_emoji(element: str) -> str:
-    """元素の絵文字を取得"""
-    emoji_map = {
-        ELEMENT_FIRE: "🔥",
-        ELEMENT_WATER: "💧",
-        ELEMENT_NATURE: "🌿",
-        ELEMENT_NONE: "⚪"
-    }
-    return emoji_map.get(element, "⚪")
-
-def get_enemy_emoji(enemy_name: str) -> str:
-    """敵の種族に応じた絵文字を取得"""
-    emoji_map = {
-        "スライム": "🟢",
-        "ゴブリン": "👺",
-        "オーク": "🐗",
-        "ドラゴン": "🐉",
-        "魔法使い": "🧙‍♂️",
-    }
-    return emoji_map.get(enemy_name, "👾")
-
-def decide_enemy_action():
-    """敵の次の行動を決定（改善版：より戦略的）"""
-    import random
-    
-    hp_ratio = st.session_state.enemy["hp"] / st.session_state.enemy["max_hp"]
-    shield = st.session_state.enemy["shield"]
-    player_buff = st.session_state.attack_buff_duration > 0
-    player_hp_ratio = st.session_state.player_hp / st.session_state.player_max_hp
-    
-    # 戦略的な行動決定
-    if hp_ratio < 0.25:
-        # 瀕死時：防御優先で生き延びる
-        actions = ["defend"] * 6 + ["big_attack"] * 2 + ["attack"] * 2
-    elif hp_ratio < 0.5:
-        # 低HP時：防御/攻撃バランス + シールドがない場合は防御
-        if shield < 10:
-            actions = ["defend"] * 5 + ["big_attack"] * 3 + ["attack"] * 2
-        else:
-            actions = ["big_attack"] * 4 + ["attack"] * 4 + ["defend"] * 2
-    elif hp_ratio < 0.75:
-        # 中程度HP：バランスの取れた攻撃
-        if player_buff:
-            # プレイヤーがバフ状態なら防御
-            actions = ["defend"] * 4 + ["big_attack"] * 4 + ["attack"] * 2
-        else:
-            actions = ["big_attack"] * 4 + ["attack"] * 5 + ["defend"] * 1
-    else:
-        # 高HP時：攻撃的
-        if player_hp_ratio > 0.7:
-            # プレイヤーHP多い→大攻撃で圧力
-            actions = ["big_attack"] * 5 + ["attack"] * 4 + ["defend"] * 1
-        else:
-            # プレイヤーHP少ない→強気で攻撃
-            actions = ["big_attack"] * 6 + ["attack"] * 3 + ["defend"] * 1
-    
-    st.session_state.enemy["next_action"] = random.choice(actions)
-
-def create_enemy_data(name: str, difficulty: int) -> dict:
-    """敵データを作成（改善版：10%削弱）"""
-    # ゲームバランス調整：敵を約10%削弱
-    hp_base = (45 + difficulty * 12) * 0.9  # 10%削弱
-    attack_base = (6 + difficulty * 1.2) * 0.9  # 10%削弱
-    
-    return {
-        "name": name,
-        "max_hp": int(hp_base),
-        "hp": int(hp_base),
-        "attack": int(attack_base),
-        "shield": 0,
-        "element": None,
-        "element_duration": 0,
-        "burn": 0,
-        "burn_duration": 0,
-        "next_action": "attack",
-        # デバフフィールド
-        "debuff_weaken": 0,
-        "debuff_weaken_duration": 0,
-        "stunned": False,
-        "poison": 0,
-        "poison_duration": 0,
-    }
-
-
-def setup_battle_from_node(node):
-    """ツリーのノードから戦闘をセットアップ"""
-    if node.node_type != "battle":
-        return  # 戦闘ノード以外はスキップ
-
-    # 敵データを構造化して保存
-    st.session_state.enemy = create_enemy_data(node.enemy_name, node.difficulty)
-
-    # 敵の次の行動を決定
-    decide_enemy_action()
-
-    # プレイヤー状態をリセット（前の戦闘の残りをクリア）
-    st.session_state.shield = 0
-    st.session_state.element_reaction_cooldown = 0
-
-    # 休憩所バフ（次の1戦限り）の引き継ぎ
-    rest_buff = st.session_state.get('rest_attack_buff', 0)
-    if rest_buff > 0:
-        # 次の戦闘に持ち込む（戦闘中は全ターン有効: duration=999）
-        st.session_state.attack_buff = rest_buff
-        st.session_state.attack_buff_duration = 999  # 戦闘終了まで有効
-        st.session_state.rest_attack_buff = 0  # 使い切り
-    else:
-        st.session_state.attack_buff = 0
-        st.session_state.attack_buff_duration = 0
-
-    # デッキをリセット
-    st.session_state.deck = st.session_state.all_cards.copy()
-    st.session_state.hand = []
-    st.session_state.discard = []
-    random.shuffle(st.session_state.deck)
-
-    # ターン進行 & 現在階層を正しく設定
-    st.session_state.turn += 1
-    st.session_state.current_floor = node.floor_level
-    st.session_state.energy = st.session_state.max_energy
-
-    # アップグレードによるドロー枚数ボーナスを適用
-    draw_bonus = 0
-    if hasattr(st.session_state, 'persistent_data'):
-        draw_bonus = game_data.get_total_effect(st.session_state.persistent_data, "card_draw_bonus")
-    draw_cards(5 + draw_bonus)
-
-    st.session_state.battle_log = [f"⚔️ 第{st.session_state.turn}戦: {st.session_state.enemy['name']}との戦闘開始！"]
-    st.session_state.current_turn_log = []
 
+def sync_run_phase():
+    """ランの進行状態を画面に反映（遷移時の永続データ更新もここで行う）"""
+    run = st.session_state.run
+    if run.phase == st.session_state.game_state:
+        return
 
-def proceed_to_next_floor():
-    """次の階層を選択する画面へ進む"""
-    nodes = st.session_state.floor_nodes
-    current_node_id = st.session_state.current_node_id
-    current_node = nodes[current_node_id]
+    if run.phase == run_engine.PHASE_DEFEAT:
+        st.session_state.persistent_data, _ = game_data.update_game_data(
+            functools.partial(game_data.record_game_result, won=False, floor_reached=run.current_floor),
+            player_id=st.session_state.player_id)
+    elif run.phase == run_engine.PHASE_CLEAR:
+        st.session_state.persistent_data, _ = game_data.update_game_data(
+            functools.partial(game_data.record_game_clear, floor_reached=run.map_spec.depth),
+            player_id=st.session_state.player_id)
+    elif run.phase == run_engine.PHASE_BATTLE:
+        st.session_state.current_turn_log = []
 
     # Bug4修正: 報酬関連の状態を確実にリセット
     st.session_state.reward_choice = None
     st.session_state.cards_to_delete = []
-    if 'reward_cards_cache' in st.session_state:
-        del st.session_state.reward_cards_cache
-
-    left_child, right_child = floor_tree.get_node_children(nodes, current_node_id)
-
-    # 子ノードが1つもない場合（ゲーム終了）
-    if not left_child and not right_child:
-        if current_node.floor_level == 10:
-            st.session_state.game_state = 'clear'
-        else:
-            st.session_state.game_state = 'victory'
-        return
+    st.session_state.game_state = run.phase
 
-    # それ以外の場合は常にマップ選択画面を表示
-    st.session_state.game_state = 'tree_selection'
-    return
 
-def get_action_description(action: str) -> tuple[str, str]:
-    """行動の説明とアイコンを取得"""
-    descriptions = {
-        "attack": ("通常攻撃", "⚔️"),
-        "big_attack": ("強攻撃 (1.5倍)", "💥"),
-        "defend": ("防御態勢 (ダメージ半減)", "🛡️"),
-    }
-    return descriptions.get(action, ("不明", "❓"))
+def route_hint(nodes: floor_tree.FloorTree, node: floor_tree.FloorNode) -> str:
+    """選択肢の先の見通し（マップ生成時に計算済みの値を引くだけ）"""
+    info = nodes.analytics.node(node.node_id)
+    return (f"この先: 🏘️ 休憩所 {info.rest_count} ・ 🛍️ ショップ {info.shop_count} ・ "
+            f"ルート {info.path_count}通り ・ 戦闘難易度 {info.min_difficulty}〜{info.max_difficulty}"
+            f"（平均 {info.mean_difficulty:.0f}）")
 
 def display_card(card: dict, key_prefix: str, index: int):
     """カードを表示する（ボタンは別で作成）- TCGスタイル"""
@@ -807,7 +98,7 @@ def display_card(card: dict, key_prefix: str, index: int):
     description = card.get('description', '')
     
     # コスト判定
-    can_use = st.session_state.energy >= cost
+    can_use = st.session_state.run.battle.energy >= cost
     
     # カードのスタイル
     if can_use:
@@ -866,64 +157,16 @@ def display_card(card: dict, key_prefix: str, index: int):
         type="primary" if can_use else "secondary"
     )
 
-def display_card_compact(card: dict, key_prefix: str, index: int):
-    """コンパクトなカード表示（1画面表示用）- TCGスタイル"""
-    color_map = {
-        ELEMENT_NONE: "#888888",
-        ELEMENT_FIRE: "#FF6B6B",
-        ELEMENT_WATER: "#4ECDC4",
-        ELEMENT_NATURE: "#95E77D",
-    }
-    
-    element = card.get("element", ELEMENT_NONE)
-    card_type = card.get("type", CARD_ATTACK)
-    color = color_map.get(element, "#888888")
-    element_emoji = get_element_emoji(element)
-    type_icon = CARD_TYPE_ICONS.get(card_type, "🎴")
-    name = card.get('name', '')
+def display_card_compact(card: dict, key_prefix: str, index: int, on_click=None, args=None):
+    """コンパクトなカード表示（1画面表示用）- TCGスタイル。on_click/args はボタンのコールバック"""
     cost = card.get('cost', 0)
-    description = card.get('description', '')
+    can_use = st.session_state.run.battle.energy >= cost
     
-    can_use = st.session_state.energy >= cost
-    
-    # コンパクトなカードHTML
-    opacity = "1" if can_use else "0.5"
-    border_color = "rgba(255, 255, 255, 0.3)" if can_use else "rgba(255, 0, 0, 0.5)"
-    
-    card_html = f"""
-<div style="background: linear-gradient(135deg, {color} 0%, {color}CC 100%); 
-            border: 2px solid {border_color};
-            border-radius: 8px; 
-            padding: 0; 
-            margin: 2px 0; 
-            color: white; 
-            text-shadow: 1px 1px 2px rgba(0, 0, 0, 0.7); 
-            min-height: 130px; 
-            max-height: 130px;
-            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.3);
-            opacity: {opacity};
-            font-size: 0.75rem;
-            overflow: hidden;
-            display: flex;
-            flex-direction: column;">
-    <div style="background: rgba(0,0,0,0.2); padding: 6px; text-align: center; flex-shrink: 0;">
-        <div style="font-size: 28px; line-height: 1;">{type_icon}</div>
-    </div>
-    <div style="padding: 4px 8px; background: rgba(0,0,0,0.1); flex-shrink: 0;">
-        <div style="font-size: 0.8rem; font-weight: bold; white-space: nowrap; overflow: hidden; text-overflow: ellipsis;">
-            {element_emoji} {name}
-        </div>
-        <div style="font-size: 0.65rem; background: rgba(0, 0, 0, 0.3); display: inline-block; padding: 1px 4px; border-radius: 3px; margin-top: 2px;">
-            ⚡{cost}
-        </div>
-    </div>
-    <div style="padding: 3px 8px; background: rgba(0,0,0,0.2); font-size: 0.65rem; line-height: 1.3; overflow: hidden; max-height: 3.5em; flex-grow: 1; word-wrap: break-word;">
-        {description}
-    </div>
-</div>
-    """
-    
-    st.markdown(card_html, unsafe_allow_html=True)
+    # カードHTMLは内容と使用可否ごとにメモ化されている
+    st.markdown(battle_view.card_html(
+        card.get('name', ''), card.get("element", ELEMENT_NONE), card.get("type", CARD_ATTACK),
+        cost, card.get('description', ''), can_use,
+    ), unsafe_allow_html=True)
     
     # 小さなボタン
     return st.button(
@@ -931,7 +174,9 @@ def display_card_compact(card: dict, key_prefix: str, index: int):
         key=f"use_{key_prefix}_{index}",
         disabled=not can_use,
         use_container_width=True,
-        type="primary" if can_use else "secondary"
+        type="primary" if can_use else "secondary",
+        on_click=on_click,
+        args=args,
     )
 
 def display_card_reward(card: dict, index: int):
@@ -986,18 +231,260 @@ def display_card_reward(card: dict, index: int):
     
     st.markdown(card_html, unsafe_allow_html=True)
 
+# ===== 戦闘画面 =====
+# 戦闘中の操作（カードを使う・ターン終了）は on_click のコールバックで処理し、
+# 再実行されるのは battle_board のフラグメントだけ（メニューの分岐や見出し・ガイドは再実行しない）。
+# 勝利などで画面が変わった時だけアプリ全体を再実行する
+
+
+def play_card_action(hand_index: int):
+    """手札のカードを使う（ボタンのコールバック）"""
+    run = st.session_state.run
+    battle = run.battle
+    log_before = battle.battle_log.position
+    run_engine.play_card(run, hand_index)
+    st.session_state.current_turn_log = battle.battle_log.since(log_before)
+    sync_run_phase()
+
+
+def end_turn_action():
+    """ターン終了（ボタンのコールバック）"""
+    run = st.session_state.run
+    # 手札を捨てて敵のターン→次のターン開始（敵のターンのログをターンログに表示）
+    st.session_state.current_turn_log = run_engine.end_turn(run)
+    sync_run_phase()
+
+
+def render_battle_effects(battle: battle_engine.BattleState):
+    """画面シェイク・ダメージ数字などの一度きりの演出（表示したら消す）"""
+    # 画面シェイク・フラッシュ（発生した時だけ）
+    styles.emit_dynamic_css(battle_view.screen_effect_css(battle.screen_shake, battle.screen_flash))
+    battle.screen_shake = False
+    battle.screen_flash = None
+    
+    # ダメージ数字ポップアップ（エフェクトが設定されている時のみ）
+    if battle.damage_effect:
+        effect = battle.damage_effect
+        # ダメージと元素反応を1つのテキストに統合
+        damage_text = f"-{effect['amount']}"
+        if effect.get('reaction'):
+            damage_text = f"-{effect['amount']} {effect.get('reaction')}"
+        position = "60%" if effect["type"] == "enemy" else "30%"
+        st.markdown(battle_view.damage_popup_html(damage_text, effect["color"], position), unsafe_allow_html=True)
+        # エフェクト表示後にデータをクリア
+        battle.damage_effect = None
+    
+    # エネルギー消費エフェクト（同様に設定されている時のみ）
+    if battle.energy_effect:
+        st.markdown(battle_view.energy_popup_html(battle.energy_effect['amount']), unsafe_allow_html=True)
+        battle.energy_effect = None
+
+
+def render_battle_status(run: run_engine.RunState):
+    """プレイヤーと敵のステータス"""
+    battle = run.battle
+    # 上部：プレイヤーと敵（2カラムで横幅たっぷり）
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        # プレイヤー画像とステータス
+        st.markdown(battle_view.PLAYER_PORTRAIT_HTML, unsafe_allow_html=True)
+        
+        # プレイヤーステータス（コンパクト）
+        hp_ratio = battle.player_hp / battle.player_max_hp
+        st.progress(max(0, hp_ratio), text=f"❤️ HP: {battle.player_hp}/{battle.player_max_hp}")
+        
+        # エネルギーを5つのバーで表示
+        energy_html = battle_view.energy_bars_html(battle.energy, battle.max_energy)
+        st.markdown(energy_html, unsafe_allow_html=True)
+        
+        # 詳細ステータス情報を整理
+        status_parts = []
+        
+        if battle.shield > 0:
+            status_parts.append(f"🛡️{battle.shield}")
+        
+        if battle.attack_buff_duration > 0:
+            buff_percent = int(battle.attack_buff * 100)
+            if battle.attack_buff_duration >= 999:
+                status_parts.append(f"💪+{buff_percent}% (この戦闘限り)")
+            else:
+                status_parts.append(f"💪+{buff_percent}% ({battle.attack_buff_duration}T)")
+        
+        if status_parts:
+            st.caption(" | ".join(status_parts))
+        
+        # 追加情報（デッキ、クールダウン）
+        info_parts = [f"📚山札:{len(battle.deck)} 🗑️捨札:{len(battle.discard)}"]
+        
+        if battle.element_reaction_cooldown > 0:
+            info_parts.append(f"⏳反応CD:{battle.element_reaction_cooldown}T")
+        
+        st.caption(" | ".join(info_parts))
+    
+    with col2:
+        # 敵画像とステータス
+        st.markdown(battle_view.enemy_portrait_html(battle.enemy["name"]), unsafe_allow_html=True)
+        
+        # 敵ステータス（コンパクト）
+        enemy_hp_ratio = max(0, battle.enemy["hp"] / battle.enemy["max_hp"])
+        st.progress(enemy_hp_ratio, text=f"❤️ HP: {max(0, battle.enemy['hp'])}/{battle.enemy['max_hp']}")
+        
+        # 次の行動（コンパクト）
+        action_desc, action_icon = get_action_description(battle.enemy["next_action"])
+        
+        # 攻撃の場合はダメージ数を表示
+        if battle.enemy["next_action"] == "attack":
+            damage = battle.enemy["attack"]
+            enemy_status = f"{action_icon} 次:{action_desc}({damage})"
+        elif battle.enemy["next_action"] == "big_attack":
+            damage = int(battle.enemy["attack"] * 1.5)
+            enemy_status = f"{action_icon} 次:{action_desc}({damage})"
+        elif battle.enemy["next_action"] == "defend":
+            shield = int(battle.enemy["attack"] * 1.2)
+            enemy_status = f"{action_icon} 次:{action_desc}(+{shield})"
+        else:
+            enemy_status = f"{action_icon} 次:{action_desc}"
+        
+        # シールド表示
+        if battle.enemy["shield"] > 0:
+            enemy_status += f" 🛡️{battle.enemy['shield']}"
+        
+        # 元素反応クールダウン表示（敵側）
+        if battle.element_reaction_cooldown > 0:
+            enemy_status += f" ⏳反応CD:{battle.element_reaction_cooldown}T"
+        
+        # 元素付与状態（持続ターン表示）
+        if battle.enemy["element"]:
+            emoji = get_element_emoji(battle.enemy["element"])
+            if battle.enemy["element_duration"] > 0:
+                enemy_status += f" {emoji}×{battle.enemy['element_duration']}T"
+            else:
+                enemy_status += f" {emoji}"
+
+        # 燃焼状態（持続ターン表示）
+        if battle.enemy["burn_duration"] > 0:
+            enemy_status += f" 🔥×{battle.enemy['burn_duration']}T"
+
+        # デバフ状態表示
+        if battle.enemy.get("poison_duration", 0) > 0:
+            enemy_status += f" ☠️×{battle.enemy['poison_duration']}T"
+        if battle.enemy.get("debuff_weaken_duration", 0) > 0:
+            weaken_pct = int(battle.enemy.get("debuff_weaken", 0) * 100)
+            enemy_status += f" ⬇️-{weaken_pct}%×{battle.enemy['debuff_weaken_duration']}T"
+        if battle.enemy.get("stunned", False):
+            enemy_status += " 💫スタン"
+
+        st.caption(enemy_status)
+
+
+def render_defeat_panel(run: run_engine.RunState):
+    """敗北画面（ステータスの下に表示）"""
+    st.error("💀 敗北")
+    
+    floor_reached = run.current_floor
+    points_earned = max(1, floor_reached // 2)
+    st.caption(f"到達階層:{floor_reached} 獲得:💎{points_earned}")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("🔄 最初から", use_container_width=True, type="primary"):
+            st.session_state.game_state = 'menu'
+            st.rerun()
+    with col2:
+        if st.button("🔼 アップグレード", use_container_width=True):
+            st.session_state.game_state = 'upgrade'
+            st.rerun()
+
+
+def render_battle_hand(run: run_engine.RunState):
+    """手札・ターンログ・ターン終了ボタン"""
+    battle = run.battle
+    # 中央：手札（横1列・コンパクト）
+    # エネルギーを描画前にクランプして不整合を防ぐ
+    battle.energy = max(0, min(battle.energy, battle.max_energy))
+
+    if len(battle.hand) == 0:
+        st.caption("手札なし")
+    else:
+        cols = st.columns(len(battle.hand))
+        for i, card in enumerate(battle.hand):
+            with cols[i]:
+                display_card_compact(card, "hand", i, on_click=play_card_action, args=(i,))
+    
+    # 下部：ターンログ（コンパクト）
+    if st.session_state.current_turn_log:
+        recent_logs = battle_engine.format_log(st.session_state.current_turn_log[-3:])
+        st.caption("📝 " + " | ".join(recent_logs))
+    
+    # ターン終了ボタン（ターンログの直下）
+    st.button("🔚 ターン終了", key="end_turn_main", use_container_width=True, type="primary",
+              on_click=end_turn_action)
+
+
+def render_battle_panels(run: run_engine.RunState):
+    """デッキ・ガイド・戦闘ログのエクスパンダー"""
+    battle = run.battle
+    st.write("---")
+    
+    # 情報パネル：3つのエクスパンダーを横並び
+    info_col1, info_col2, info_col3 = st.columns(3)
+    
+    with info_col1:
+        with st.expander("🎴 デッキ＆カード"):
+            st.metric("山札", f"{len(battle.deck)}枚")
+            st.metric("捨札", f"{len(battle.discard)}枚")
+            st.write("**所持カード一覧:**")
+            card_counts = {}
+            for card in run.all_cards:
+                name = card['name']
+                card_counts[name] = card_counts.get(name, 0) + 1
+            
+            for name, count in sorted(card_counts.items()):
+                st.caption(f"{name} × {count}")
+    
+    with info_col2:
+        with st.expander("⚡ 元素反応＆デバフガイド"):
+            st.markdown(battle_view.ELEMENT_GUIDE_HTML, unsafe_allow_html=True)
+    
+    with info_col3:
+        with st.expander("📜 戦闘ログ"):
+            st.write("**最新20件:**")
+            for log in battle_engine.format_log(battle.battle_log.latest(20)):
+                st.caption(log)
+
+
+@st.fragment
+def battle_board():
+    """戦闘画面の操作で変わる部分（演出・ステータス・手札・ログ）。操作ではこのフラグメントだけ再実行する"""
+    if st.session_state.game_state not in ('battle', 'defeat'):
+        # 勝利・クリアなどで画面が変わった
+        st.rerun()
+    run = st.session_state.run
+    render_battle_effects(run.battle)
+    render_battle_status(run)
+    if run.phase == run_engine.PHASE_DEFEAT:
+        render_defeat_panel(run)
+        return
+    render_battle_hand(run)
+    render_battle_panels(run)
+
 # ===== メインゲーム =====
 
 def main():
     st.set_page_config(page_title="デッキ構築RPG", page_icon="⚔️", layout="wide")
     
-    # コンパクトなCSSを適用
-    st.markdown(styles.COMPACT_CSS, unsafe_allow_html=True)
+    # 静的なCSS（セッションの最初の1回だけ送る）
+    styles.inject_stylesheets()
     
     # ゲーム状態の初期化
     if 'game_state' not in st.session_state:
         st.session_state.game_state = 'menu'
     
+    # プレイヤーID（URLの ?player=... で指定。なければ共有の既定プロフィール）
+    if 'player_id' not in st.session_state:
+        st.session_state.player_id = st.query_params.get("player", game_data.DEFAULT_PLAYER_ID)
+    
     # 現在のターンログを管理
     if 'current_turn_log' not in st.session_state:
         st.session_state.current_turn_log = []
@@ -1005,7 +492,7 @@ def main():
     if st.session_state.game_state == 'menu':
         # セーブデータを読み込み
         if 'persistent_data' not in st.session_state:
-            st.session_state.persistent_data = game_data.load_game_data()
+            st.session_state.persistent_data = game_data.load_game_data(st.session_state.player_id)
 
         save_data = st.session_state.persistent_data
         total_wins = save_data.get("total_wins", 0)
@@ -1085,63 +572,20 @@ def main():
         with col_start:
             if st.button("🎮 ゲーム開始", use_container_width=True, type="primary"):
                 # 初回プレイかチェック
-                save_data = st.session_state.persistent_data
-                is_first_time = save_data.get("total_games", 0) == 0
+                is_first_time = st.session_state.persistent_data.get("total_games", 0) == 0
                 
                 # 総ゲーム数を増加
-                save_data["total_games"] = save_data.get("total_games", 0) + 1
-                game_data.save_game_data(save_data)
-                
-                # アップグレードを適用
-                hp_bonus = game_data.get_total_effect(save_data, "max_hp_bonus")
-                energy_bonus = game_data.get_total_effect(save_data, "starting_energy_bonus")
-                draw_bonus = game_data.get_total_effect(save_data, "card_draw_bonus")
-                
-                
-                # プレイヤー初期化
-                starter_deck = create_starter_deck()
-                random.shuffle(starter_deck)
-                
-                st.session_state.player_max_hp = 100 + hp_bonus
-                st.session_state.player_hp = 100 + hp_bonus
-                st.session_state.shield = 0
-                st.session_state.attack_buff = 0
-                st.session_state.attack_buff_duration = 0
-                st.session_state.rest_attack_buff = 0  # 休憩所バフ（次の1戦限り）
-                st.session_state.deck = starter_deck
-                st.session_state.hand = []
-                st.session_state.discard = []
-                st.session_state.energy = 5 + energy_bonus  # 基本5エネルギーに変更
-                st.session_state.max_energy = 5 + energy_bonus
-                st.session_state.all_cards = starter_deck.copy()  # 全カードリスト
-                st.session_state.gold = 100  # 初期ゴールド
-                
-                st.session_state.turn = 0  # ツリーナビゲーション開始前
-                st.session_state.battle_log = []
-                st.session_state.current_turn_log = []
-                
-                # エフェクト用の状態変数
-                st.session_state.damage_effect = None
-                st.session_state.screen_shake = False
-                st.session_state.screen_flash = None
-                st.session_state.show_effect = False
+                save_data, _ = game_data.update_game_data(
+                    game_data.record_game_start, player_id=st.session_state.player_id)
+                st.session_state.persistent_data = save_data
                 
                 # 初回プレイフラグ
                 st.session_state.show_tutorial = is_first_time
                 
-                # フロアツリーを生成
-                nodes, root_id = floor_tree.generate_floor_tree()
-                st.session_state.floor_nodes = nodes
-                st.session_state.current_node_id = root_id
-                
-                
-                # 最初のノードで初期化
-                root_node = nodes[root_id]
-                st.session_state.current_floor = 1
-                
-                # 第1階層の戦闘を開始
-                setup_battle_from_node(root_node)
-                st.session_state.game_state = 'battle'
+                # ランを開始（アップグレード適用・ツリー生成・第1階層の戦闘開始）
+                st.session_state.run = run_engine.new_run(save_data)
+                replay_log.start_recording(st.session_state.run, save_data)
+                sync_run_phase()
                 st.rerun()
         
         with col_upgrade:
@@ -1151,12 +595,10 @@ def main():
     
     elif st.session_state.game_state == 'tree_selection':
         """ツリーから次の階層を選択"""
-        nodes = st.session_state.floor_nodes
-        current_node_id = st.session_state.current_node_id
-        current_node = nodes[current_node_id]
-        
-        
-        st.markdown(styles.COMPACT_CSS, unsafe_allow_html=True)
+        run = st.session_state.run
+        nodes = run.nodes
+        current_node_id = run.current_node_id
+        current_node = run.current_node
         
         # タイトル
         # 次の階層番号を計算（選択肢は current_node の子 = 次の階層）
@@ -1175,32 +617,33 @@ def main():
         # プレイヤーステータス
         col1, col2, col3 = st.columns([2, 2, 1])
         with col1:
-            st.metric("❤️ HP", f"{st.session_state.player_hp}/{st.session_state.player_max_hp}")
+            st.metric("❤️ HP", f"{run.battle.player_hp}/{run.battle.player_max_hp}")
         with col2:
-            st.metric("🎴 デッキ", f"{len(st.session_state.all_cards)}枚")
+            st.metric("🎴 デッキ", f"{len(run.all_cards)}枚")
         with col3:
             # エネルギーを5つのバーで表示
-            energy_html = render_energy_bars(st.session_state.energy, st.session_state.max_energy)
+            energy_html = battle_view.energy_bars_html(run.battle.energy, run.battle.max_energy)
             st.markdown(energy_html, unsafe_allow_html=True)
 
         # 休憩バフ・戦闘バフ中なら表示
-        rest_buff = st.session_state.get('rest_attack_buff', 0)
-        active_buff = st.session_state.attack_buff_duration >= 999
+        rest_buff = run.rest_attack_buff
+        active_buff = run.battle.attack_buff_duration >= battle_engine.BUFF_WHOLE_BATTLE
         if rest_buff > 0:
             st.info(f"💪 次の戦闘: 攻撃力+{int(rest_buff*100)}%（この戦闘限り）")
         elif active_buff:
-            st.info(f"💪 戦闘バフ継続中: 攻撃力+{int(st.session_state.attack_buff*100)}%（この戦闘限り）")
+            st.info(f"💪 戦闘バフ継続中: 攻撃力+{int(run.battle.attack_buff*100)}%（この戦闘限り）")
 
         st.write("---")
         
         # ツリー表示（常時展開）
         st.write("### 🌳 マップ")
         try:
-            svg_content = floor_tree.visualize_tree_graphviz(nodes, current_node_id)
+            # 既定は組み込みレンダラー（MAP_BACKEND=graphviz で graphviz を使う）
+            svg_content = floor_tree.visualize_tree(nodes, current_node_id, os.environ.get("MAP_BACKEND", "svg"))
             # SVGを直接markdownで表示（高さ制限）
             st.markdown(f"<div style='text-align: center; max-height: 400px; overflow: auto;'>{svg_content}</div>", unsafe_allow_html=True)
         except Exception as e:
-            # Graphvizが使えない場合はテキスト表示
+            # 描画できない場合はテキスト表示
             text_tree = floor_tree.visualize_tree_text(nodes, current_node_id)
             st.text(text_tree)
         
@@ -1228,16 +671,11 @@ def main():
                         st.markdown(f"## 🏘️ 休憩所\n**第{node.floor_level}階層** | HP回復 + バフ")
                     else:
                         st.markdown(f"## 🛍️ ショップ\n**第{node.floor_level}階層** | カード購入/売却")
+                    st.caption(route_hint(nodes, node))
                     
                     if st.button("→ 進む", key="choose_only", use_container_width=True, type="primary"):
-                        st.session_state.current_node_id = node.node_id
-                        if node.node_type == "battle":
-                            setup_battle_from_node(node)
-                            st.session_state.game_state = 'battle'
-                        elif node.node_type == "rest":
-                            st.session_state.game_state = 'rest'
-                        else:
-                            st.session_state.game_state = 'shop'
+                        run_engine.choose_node(run, 0)
+                        sync_run_phase()
                         st.rerun()
             else:
                 st.markdown("<h3 style='text-align: center;'>次の階層を選択</h3>", unsafe_allow_html=True)
@@ -1252,16 +690,11 @@ def main():
                             st.markdown(f"## 🏘️ 休憩所\n**第{left_child.floor_level}階層** | HP回復 + バフ")
                         else:
                             st.markdown(f"## 🛍️ ショップ\n**第{left_child.floor_level}階層** | カード購入/売却")
+                        st.caption(route_hint(nodes, left_child))
                         
                         if st.button("← 選択", key="choose_left", use_container_width=True, type="primary"):
-                            st.session_state.current_node_id = left_child.node_id
-                            if left_child.node_type == "battle":
-                                setup_battle_from_node(left_child)
-                                st.session_state.game_state = 'battle'
-                            elif left_child.node_type == "rest":
-                                st.session_state.game_state = 'rest'
-                            else:
-                                st.session_state.game_state = 'shop'
+                            run_engine.choose_node(run, 0)
+                            sync_run_phase()
                             st.rerun()
                 
                 if right_child:
@@ -1272,48 +705,26 @@ def main():
                             st.markdown(f"## 🏘️ 休憩所\n**第{right_child.floor_level}階層** | HP回復 + バフ")
                         else:
                             st.markdown(f"## 🛍️ ショップ\n**第{right_child.floor_level}階層** | カード購入/売却")
+                        st.caption(route_hint(nodes, right_child))
                         
                         if st.button("選択 →", key="choose_right", use_container_width=True, type="primary"):
-                            st.session_state.current_node_id = right_child.node_id
-                            if right_child.node_type == "battle":
-                                setup_battle_from_node(right_child)
-                                st.session_state.game_state = 'battle'
-                            elif right_child.node_type == "rest":
-                                st.session_state.game_state = 'rest'
-                            else:
-                                st.session_state.game_state = 'shop'
+                            run_engine.choose_node(run, 1)
+                            sync_run_phase()
                             st.rerun()
-        else:
-            if current_node.floor_level == 10:
-                st.success("🎊 10階層到達！ゲーム完了！")
-                save_data = st.session_state.persistent_data
-                updated_data = game_data.record_game_result(save_data, won=True, floor_reached=10)
-                st.session_state.persistent_data = updated_data
-                game_data.save_game_data(updated_data)
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("🔄 最初から", use_container_width=True, type="primary"):
-                        st.session_state.game_state = 'menu'
-                        st.rerun()
-                with col2:
-                    if st.button("🔼 アップグレード", use_container_width=True):
-                        st.session_state.game_state = 'upgrade'
-                        st.rerun()
         return
     
     elif st.session_state.game_state == 'rest':
-        current_node = st.session_state.floor_nodes.get(st.session_state.current_node_id)
-        floor_level = current_node.floor_level if current_node else "?"
+        run = st.session_state.run
+        floor_level = run.current_node.floor_level
 
-        hp = st.session_state.player_hp
-        max_hp = st.session_state.player_max_hp
+        hp = run.battle.player_hp
+        max_hp = run.battle.player_max_hp
         hp_pct = int(hp / max_hp * 100)
-        deck_size = len(st.session_state.all_cards)
-        gold = st.session_state.get('gold', 0)
-        energy = st.session_state.energy
-        max_energy = st.session_state.max_energy
-        rest_buff = st.session_state.get('rest_attack_buff', 0)
+        deck_size = len(run.all_cards)
+        gold = run.gold
+        energy = run.battle.energy
+        max_energy = run.battle.max_energy
+        rest_buff = run.rest_attack_buff
 
         # HP割合に応じた色
         if hp_pct >= 70:
@@ -1373,8 +784,8 @@ def main():
 <div style="font-size:0.62rem;color:#666;margin-top:0.4rem;">永続効果なし</div>
 </div>""", unsafe_allow_html=True)
             if st.button("😴 就寝して回復", key="rest_sleep", use_container_width=True, type="primary"):
-                st.session_state.player_hp = st.session_state.player_max_hp
-                proceed_to_next_floor()
+                run_engine.rest_sleep(run)
+                sync_run_phase()
                 st.rerun()
 
         with col2:
@@ -1385,12 +796,12 @@ def main():
 <div style="font-size:0.62rem;color:#c8921f;margin-top:0.4rem;">⚠️ 次の1戦のみ</div>
 </div>""", unsafe_allow_html=True)
             if st.button("🧘 瞑想する", key="rest_meditate", use_container_width=True, type="primary"):
-                st.session_state.rest_attack_buff = max(st.session_state.get('rest_attack_buff', 0), 0.2)
-                proceed_to_next_floor()
+                run_engine.rest_meditate(run)
+                sync_run_phase()
                 st.rerun()
 
         with col3:
-            attack_cards = [c for c in st.session_state.all_cards if c.get('type') == CARD_ATTACK and 'damage' in c]
+            attack_cards = run_engine.alchemy_targets(run)
             st.markdown(f"""<div style="background:#1a1800;border:2px solid #fbbf24;border-top:3px solid #fbbf24;border-radius:12px;padding:1rem 0.8rem;text-align:center;min-height:150px;">
 <div style="font-size:2.2rem;">🧪</div>
 <div style="font-size:1rem;font-weight:800;color:#fbbf24;margin:0.3rem 0;">錬金術</div>
@@ -1398,38 +809,25 @@ def main():
 <div style="font-size:0.62rem;color:#4ade80;margin-top:0.4rem;">✅ 永続効果</div>
 </div>""", unsafe_allow_html=True)
             if st.button("🧪 錬金術を使う", key="rest_alchemy", use_container_width=True, type="primary"):
-                for card in st.session_state.all_cards:
-                    if card.get('type') == CARD_ATTACK and 'damage' in card:
-                        card['damage'] = int(card['damage'] * 1.1)
-                proceed_to_next_floor()
+                run_engine.rest_alchemy(run)
+                sync_run_phase()
                 st.rerun()
 
         return
 
     elif st.session_state.game_state == 'shop':
+        run = st.session_state.run
         st.title("🛍️ ショップ")
-        st.write(f"💰 所持ゴールド: **{st.session_state.get('gold', 0)}G**")
-
-        # P1-6: shop_cardsはshop画面に入ったときだけ初期化（ノードIDをキーに紐付け）
-        shop_node_id = st.session_state.current_node_id
-        if 'shop_cards' not in st.session_state or st.session_state.get('shop_node_id') != shop_node_id:
-            all_cards = create_basic_cards()
-            st.session_state.shop_cards = random.sample(all_cards, min(5, len(all_cards)))
-            st.session_state.shop_node_id = shop_node_id
-            # 各カードに価格を設定（難易度に応じて価格調整）
-            current_node = st.session_state.floor_nodes.get(st.session_state.current_node_id)
-            floor_bonus = (current_node.floor_level * 5) if current_node else 0
-            for card in st.session_state.shop_cards:
-                card['shop_price'] = 40 + floor_bonus + random.randint(0, 20)
-        
+        st.write(f"💰 所持ゴールド: **{run.gold}G**")
+
         st.write("### 🎴 カード販売")
         cols = st.columns(5)
         
-        for i, card in enumerate(st.session_state.shop_cards):
+        for i, card in enumerate(run.shop_cards):
             with cols[i]:
                 display_card_reward(card, i)
-                price = card.get('shop_price', 50)
-                can_afford = st.session_state.get('gold', 0) >= price
+                price = run.shop_prices[i]
+                can_afford = run.gold >= price
                 
                 if st.button(
                     f"💰 {price}G で購入" if can_afford else f"❌ {price}G",
@@ -1438,9 +836,7 @@ def main():
                     type="primary" if can_afford else "secondary",
                     disabled=not can_afford
                 ):
-                    st.session_state.gold -= price
-                    st.session_state.all_cards.append(card)
-                    st.session_state.shop_cards.pop(i)
+                    run_engine.shop_buy_card(run, i)
                     st.success(f"✅ {card['name']}を購入しました！")
                     st.rerun()
         
@@ -1457,18 +853,14 @@ def main():
                 <div style='font-size: 0.8rem; text-align: center; color: rgba(255,255,255,0.8);'>HP +30回復</div>
             </div>
             """, unsafe_allow_html=True)
-            can_buy_potion = st.session_state.get('gold', 0) >= 30
+            can_buy_potion = run.gold >= run_engine.SHOP_POTION_PRICE
             if st.button(
                 "💰 30G で購入" if can_buy_potion else "❌ 30G",
                 key="buy_potion",
                 use_container_width=True,
                 disabled=not can_buy_potion
             ):
-                st.session_state.gold -= 30
-                st.session_state.player_hp = min(
-                    st.session_state.player_max_hp,
-                    st.session_state.player_hp + 30
-                )
+                run_engine.shop_buy_potion(run)
                 st.success("✅ HP +30回復しました！")
                 st.rerun()
         
@@ -1480,16 +872,14 @@ def main():
                 <div style='font-size: 0.8rem; text-align: center; color: rgba(255,255,255,0.8);'>不要なカード1枚削除</div>
             </div>
             """, unsafe_allow_html=True)
-            can_buy_remove = st.session_state.get('gold', 0) >= 40
+            can_buy_remove = run.gold >= run_engine.SHOP_REMOVE_PRICE
             if st.button(
                 "💰 40G で購入" if can_buy_remove else "❌ 40G",
                 key="buy_remove",
                 use_container_width=True,
                 disabled=not can_buy_remove
             ):
-                st.session_state.gold -= 40
-                st.session_state.reward_choice = 'delete'
-                st.session_state.cards_to_delete = []
+                # 代金は削除するカードを決めた時点で支払う
                 st.session_state.game_state = 'card_remove'
                 st.rerun()
         
@@ -1501,37 +891,36 @@ def main():
                 <div style='font-size: 0.8rem; text-align: center; color: rgba(255,255,255,0.8);'>ポイント +3</div>
             </div>
             """, unsafe_allow_html=True)
-            can_buy_points = st.session_state.get('gold', 0) >= 60
+            can_buy_points = run.gold >= run_engine.SHOP_POINTS_PRICE
             if st.button(
                 "💰 60G で購入" if can_buy_points else "❌ 60G",
                 key="buy_points",
                 use_container_width=True,
                 disabled=not can_buy_points
             ):
-                st.session_state.gold -= 60
-                save_data = st.session_state.persistent_data
-                save_data['upgrade_points'] = save_data.get('upgrade_points', 0) + 3
-                st.session_state.persistent_data = save_data
-                game_data.save_game_data(save_data)
+                points = run_engine.shop_buy_points(run)
+                st.session_state.persistent_data, _ = game_data.update_game_data(
+                    functools.partial(game_data.add_upgrade_points, points=points),
+                    player_id=st.session_state.player_id)
                 st.success("✅ アップグレードポイント +3 獲得！")
                 st.rerun()
         
         st.write("---")
         if st.button("進む →", use_container_width=True, type="primary"):
-            if 'shop_cards' in st.session_state:
-                del st.session_state.shop_cards
-            proceed_to_next_floor()
+            run_engine.shop_leave(run)
+            sync_run_phase()
             st.rerun()
         return
     
     elif st.session_state.game_state == 'card_remove':
         """ショップでのカード削除画面"""
+        run = st.session_state.run
         st.title("🗑️ カード削除")
         st.write("### 削除するカードを1枚選択")
         
         # カードを種類ごとにグループ化
         card_groups = {}
-        for card in st.session_state.all_cards:
+        for card in run.all_cards:
             name = card['name']
             if name not in card_groups:
                 card_groups[name] = []
@@ -1543,9 +932,9 @@ def main():
             with cols[0]:
                 st.write(f"**{name}** × {len(cards)}")
             with cols[1]:
-                card_id = id(cards[0])
+                card_id = cards[0].instance_id
                 if st.button("🗑️ 削除", key=f"remove_{card_id}", use_container_width=True):
-                    st.session_state.all_cards.remove(cards[0])
+                    run_engine.shop_remove_card(run, next(i for i, c in enumerate(run.all_cards) if c.instance_id == card_id))
                     st.success(f"✅ {name}を削除しました！")
                     st.session_state.game_state = 'shop'
                     st.rerun()
@@ -1553,7 +942,6 @@ def main():
         st.write("---")
         if st.button("❌ キャンセル", use_container_width=True):
             st.session_state.game_state = 'shop'
-            st.session_state.gold += 40  # 返金
             st.rerun()
         return
     
@@ -1621,10 +1009,11 @@ def main():
                         use_container_width=True,
                         type="primary" if can_afford else "secondary"
                     ):
-                        success, message, updated_data = game_data.purchase_upgrade(save_data, key)
+                        updated_data, (success, message, _) = game_data.update_game_data(
+                            functools.partial(game_data.purchase_upgrade, upgrade_key=key),
+                            player_id=st.session_state.player_id)
+                        st.session_state.persistent_data = updated_data
                         if success:
-                            st.session_state.persistent_data = updated_data
-                            game_data.save_game_data(updated_data)
                             st.success(message)
                             st.rerun()
                         else:
@@ -1636,212 +1025,14 @@ def main():
             st.session_state.game_state = 'menu'
             st.rerun()
     
-    elif st.session_state.game_state == 'battle':
-        # ダメージエフェクト用のCSS・アニメーション
-        damage_effect_html = ""
-        screen_effect_css = ""
+    elif st.session_state.game_state in ('battle', 'defeat'):
+        run = st.session_state.run
         
-        # ダメージ数字ポップアップ（show_effectフラグがTrueの時のみ）
-        if st.session_state.damage_effect and st.session_state.show_effect:
-            effect = st.session_state.damage_effect
-            position = "60%" if effect["type"] == "enemy" else "30%"
-            
-            # ダメージと元素反応を1つのテキストに統合
-            damage_text = f"-{effect['amount']}"
-            if effect.get('reaction'):
-                damage_text = f"-{effect['amount']} {effect.get('reaction')}"
-            
-            damage_effect_html = f"""
-            <div style='
-                position: fixed;
-                top: 35%;
-                left: {position};
-                transform: translate(-50%, -50%);
-                text-align: center;
-                pointer-events: none;
-                z-index: 9999;
-                font-size: 5rem;
-                font-weight: bold;
-                color: {effect["color"]};
-                text-shadow: 
-                    0 0 10px rgba(0,0,0,0.8),
-                    0 0 20px {effect["color"]}, 
-                    0 0 40px {effect["color"]},
-                    2px 2px 4px rgba(0,0,0,0.9);
-                animation: damagePopup 1.7s ease-out forwards;
-                -webkit-text-stroke: 2px rgba(0,0,0,0.5);
-            '>
-                {damage_text}
-            </div>
-            <script>
-                setTimeout(function() {{
-                    var elem = document.querySelector('div[style*="damagePopup"]');
-                    if (elem) elem.remove();
-                }}, 1700);
-            </script>
-            """
-            # エフェクト表示後にフラグとデータをクリア
-            st.session_state.show_effect = False
-            st.session_state.damage_effect = None
-        
-        # エネルギー消費エフェクト（同様にshow_energy_effectフラグがTrueの時のみ）
-        energy_effect_html = ""
-        if hasattr(st.session_state, 'energy_effect') and st.session_state.energy_effect and hasattr(st.session_state, 'show_energy_effect') and st.session_state.show_energy_effect:
-            energy = st.session_state.energy_effect
-            energy_text = f"-{energy['amount']}⚡"
-            
-            energy_effect_html = f"""
-            <div style='
-                position: fixed;
-                top: 50%;
-                left: 15%;
-                transform: translate(-50%, -50%);
-                text-align: center;
-                pointer-events: none;
-                z-index: 9998;
-                font-size: 3rem;
-                font-weight: bold;
-                color: #FFD93D;
-                text-shadow: 
-                    0 0 10px rgba(0,0,0,0.8),
-                    0 0 20px #FFD93D, 
-                    0 0 40px #FFD93D,
-                    2px 2px 4px rgba(0,0,0,0.9);
-                animation: damagePopup 1.7s ease-out forwards;
-                -webkit-text-stroke: 1.5px rgba(0,0,0,0.5);
-            '>
-                {energy_text}
-            </div>
-            <script>
-                setTimeout(function() {{
-                    var elem = document.querySelectorAll('div[style*="damagePopup"]');
-                    if (elem.length > 0) elem[elem.length - 1].remove();
-                }}, 1700);
-            </script>
-            """
-            # エフェクト表示後にフラグとデータをクリア
-            st.session_state.show_energy_effect = False
-            st.session_state.energy_effect = None
-        
-        # 画面シェイク
-        if st.session_state.screen_shake:
-            screen_effect_css += """
-            @keyframes shake {
-                0%, 100% { transform: translateX(0); }
-                10%, 30%, 50%, 70%, 90% { transform: translateX(-5px); }
-                20%, 40%, 60%, 80% { transform: translateX(5px); }
-            }
-            .main { animation: shake 0.5s ease-in-out; }
-            """
-            st.session_state.screen_shake = False
-        
-        # 画面フラッシュ
-        if st.session_state.screen_flash:
-            flash_color = "#ff000040" if st.session_state.screen_flash == "damage" else "#00ff0040"
-            screen_effect_css += f"""
-            @keyframes flash {{
-                0%, 100% {{ background-color: transparent; }}
-                50% {{ background-color: {flash_color}; }}
-            }}
-            .main::before {{
-                content: "";
-                position: fixed;
-                top: 0;
-                left: 0;
-                width: 100%;
-                height: 100%;
-                animation: flash 0.3s ease-out;
-                pointer-events: none;
-                z-index: 9998;
-            }}
-            """
-            st.session_state.screen_flash = None
-        
-        # 全画面レイアウト用CSS + エフェクトCSS
-        st.markdown(f"""
-        <style>
-        /* ダメージポップアップアニメーション */
-        @keyframes damagePopup {{
-            0% {{
-                transform: translate(-50%, -50%) scale(0.5);
-                opacity: 0;
-            }}
-            20% {{
-                transform: translate(-50%, -70%) scale(1.2);
-                opacity: 1;
-            }}
-            70% {{
-                transform: translate(-50%, -90%) scale(1.1);
-                opacity: 1;
-            }}
-            100% {{
-                transform: translate(-50%, -120%) scale(1);
-                opacity: 0;
-            }}
-        }}
-        
-        {screen_effect_css}
-        
-        /* ページ全体のパディングを削除 */
-        .main .block-container {{
-            padding-top: 0.5rem !important;
-            padding-bottom: 0.5rem !important;
-            max-width: 100% !important;
-        }}
-        
-        /* 要素間のマージンを削減 */
-        .element-container {{
-            margin: 0 !important;
-        }}
-        
-        /* 見出しのマージンを削減 */
-        h1, h2, h3, h4 {{
-            margin-top: 0.2rem !important;
-            margin-bottom: 0.2rem !important;
-            font-size: 0.9rem !important;
-        }}
-        
-        /* プログレスバーを小さく */
-        .stProgress {{
-            height: 15px !important;
-        }}
-        
-        /* ボタンを小さく */
-        .stButton > button {{
-            padding: 0.3rem 0.8rem !important;
-            font-size: 0.9rem !important;
-        }}
-        
-        /* カードを小さく */
-        div[style*="min-height: 140px"] {{
-            min-height: 100px !important;
-            padding: 10px !important;
-            margin: 3px 0 !important;
-        }}
-        
-        /* 区切り線を削除 */
-        hr {{
-            margin: 0.3rem 0 !important;
-        }}
-        </style>
-        """, unsafe_allow_html=True)
-        
-        # ダメージエフェクトを別のst.markdownで表示
-        if damage_effect_html:
-            st.markdown(damage_effect_html, unsafe_allow_html=True)
-        
-        # エネルギー消費エフェクトを別のst.markdownで表示
-        if energy_effect_html:
-            st.markdown(energy_effect_html, unsafe_allow_html=True)
+        # 全画面レイアウト（CSSは登録済み。この目印がある画面だけに効く）
+        st.markdown(battle_view.BATTLE_SCREEN_MARKER, unsafe_allow_html=True)
         
         # ヘッダー：階層表示
-        st.markdown(f"""
-        <div style='text-align: center; margin-bottom: 10px;'>
-            <h2 style='color: white; font-size: 1.2rem; margin: 0; text-shadow: 0 0 10px rgba(255, 255, 255, 0.3);'>
-                ⚔️ 第{st.session_state.turn}戦 ⚔️
-            </h2>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(battle_view.battle_header_html(run.battle_count), unsafe_allow_html=True)
         
         # 初回プレイ時のチュートリアル
         if hasattr(st.session_state, 'show_tutorial') and st.session_state.show_tutorial:
@@ -1858,299 +1049,19 @@ def main():
                 st.session_state.show_tutorial = False
                 st.rerun()
         
-        # 上部：プレイヤーと敵（2カラムで横幅たっぷり）
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            # プレイヤー画像とステータス
-            player_image = """
-            <div style='text-align: center; margin-bottom: 10px;'>
-                <div style='
-                    width: 80px;
-                    height: 80px;
-                    margin: 0 auto;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    border-radius: 50%;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                    font-size: 3rem;
-                    box-shadow: 0 4px 12px rgba(102, 126, 234, 0.4);
-                    border: 3px solid rgba(255, 255, 255, 0.3);
-                '>
-                    🧙
-                </div>
-                <div style='color: white; font-weight: bold; margin-top: 5px; font-size: 0.9rem;'>プレイヤー</div>
-            </div>
-            """
-            st.markdown(player_image, unsafe_allow_html=True)
-            
-            # プレイヤーステータス（コンパクト）
-            hp_ratio = st.session_state.player_hp / st.session_state.player_max_hp
-            st.progress(max(0, hp_ratio), text=f"❤️ HP: {st.session_state.player_hp}/{st.session_state.player_max_hp}")
-            
-            # エネルギーを5つのバーで表示
-            energy_html = render_energy_bars(st.session_state.energy, st.session_state.max_energy)
-            st.markdown(energy_html, unsafe_allow_html=True)
-            
-            # 詳細ステータス情報を整理
-            status_parts = []
-            
-            if st.session_state.shield > 0:
-                status_parts.append(f"🛡️{st.session_state.shield}")
-            
-            if st.session_state.attack_buff_duration > 0:
-                buff_percent = int(st.session_state.attack_buff * 100)
-                if st.session_state.attack_buff_duration >= 999:
-                    status_parts.append(f"💪+{buff_percent}% (この戦闘限り)")
-                else:
-                    status_parts.append(f"💪+{buff_percent}% ({st.session_state.attack_buff_duration}T)")
-            
-            if status_parts:
-                st.caption(" | ".join(status_parts))
-            
-            # 追加情報（デッキ、クールダウン）
-            info_parts = [f"📚山札:{len(st.session_state.deck)} 🗑️捨札:{len(st.session_state.discard)}"]
-            
-            if hasattr(st.session_state, 'element_reaction_cooldown') and st.session_state.element_reaction_cooldown > 0:
-                info_parts.append(f"⏳反応CD:{st.session_state.element_reaction_cooldown}T")
-            
-            st.caption(" | ".join(info_parts))
-        
-        with col2:
-            # 敵画像とステータス
-            enemy_emoji = get_enemy_emoji(st.session_state.enemy["name"])
-            enemy_image = f"""
-            <div style='text-align: center; margin-bottom: 10px;'>
-                <div style='
-                    width: 80px;
-                    height: 80px;
-                    margin: 0 auto;
-                    background: linear-gradient(135deg, #ff6b6b 0%, #ee5a6f 100%);
-                    border-radius: 50%;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                    font-size: 3rem;
-                    box-shadow: 0 4px 12px rgba(255, 107, 107, 0.4);
-                    border: 3px solid rgba(255, 255, 255, 0.3);
-                    animation: enemyPulse 2s ease-in-out infinite;
-                '>
-                    {enemy_emoji}
-                </div>
-                <div style='color: white; font-weight: bold; margin-top: 5px; font-size: 0.9rem;'>{st.session_state.enemy["name"]}</div>
-            </div>
-            <style>
-                @keyframes enemyPulse {{
-                    0%, 100% {{ transform: scale(1); }}
-                    50% {{ transform: scale(1.05); }}
-                }}
-            </style>
-            """
-            st.markdown(enemy_image, unsafe_allow_html=True)
-            
-            # 敵ステータス（コンパクト）
-            enemy_hp_ratio = max(0, st.session_state.enemy["hp"] / st.session_state.enemy["max_hp"])
-            st.progress(enemy_hp_ratio, text=f"❤️ HP: {max(0, st.session_state.enemy['hp'])}/{st.session_state.enemy['max_hp']}")
-            
-            # 次の行動（コンパクト）
-            action_desc, action_icon = get_action_description(st.session_state.enemy["next_action"])
-            
-            # 攻撃の場合はダメージ数を表示
-            if st.session_state.enemy["next_action"] == "attack":
-                damage = st.session_state.enemy["attack"]
-                enemy_status = f"{action_icon} 次:{action_desc}({damage})"
-            elif st.session_state.enemy["next_action"] == "big_attack":
-                damage = int(st.session_state.enemy["attack"] * 1.5)
-                enemy_status = f"{action_icon} 次:{action_desc}({damage})"
-            elif st.session_state.enemy["next_action"] == "defend":
-                shield = int(st.session_state.enemy["attack"] * 1.2)
-                enemy_status = f"{action_icon} 次:{action_desc}(+{shield})"
-            else:
-                enemy_status = f"{action_icon} 次:{action_desc}"
-            
-            # シールド表示
-            if st.session_state.enemy["shield"] > 0:
-                enemy_status += f" 🛡️{st.session_state.enemy['shield']}"
-            
-            # 元素反応クールダウン表示（敵側）
-            if hasattr(st.session_state, 'element_reaction_cooldown') and st.session_state.element_reaction_cooldown > 0:
-                enemy_status += f" ⏳反応CD:{st.session_state.element_reaction_cooldown}T"
-            
-            # 元素付与状態（持続ターン表示）
-            if st.session_state.enemy["element"]:
-                emoji = get_element_emoji(st.session_state.enemy["element"])
-                if st.session_state.enemy["element_duration"] > 0:
-                    enemy_status += f" {emoji}×{st.session_state.enemy['element_duration']}T"
-                else:
-                    enemy_status += f" {emoji}"
-
-            # 燃焼状態（持続ターン表示）
-            if st.session_state.enemy["burn_duration"] > 0:
-                enemy_status += f" 🔥×{st.session_state.enemy['burn_duration']}T"
-
-            # デバフ状態表示
-            if st.session_state.enemy.get("poison_duration", 0) > 0:
-                enemy_status += f" ☠️×{st.session_state.enemy['poison_duration']}T"
-            if st.session_state.enemy.get("debuff_weaken_duration", 0) > 0:
-                weaken_pct = int(st.session_state.enemy.get("debuff_weaken", 0) * 100)
-                enemy_status += f" ⬇️-{weaken_pct}%×{st.session_state.enemy['debuff_weaken_duration']}T"
-            if st.session_state.enemy.get("stunned", False):
-                enemy_status += " 💫スタン"
-
-            st.caption(enemy_status)
-        
-        # 勝敗判定  敵を倒した場合
-        if st.session_state.enemy["hp"] <= 0:
-            st.session_state.show_effect = False
-            st.session_state.game_state = 'victory'
-            # P2-9: ゴールド報酬を難易度ベースに調整（floor_levelと敵難易度を参照）
-            current_node = st.session_state.floor_nodes.get(st.session_state.current_node_id)
-            floor_level = current_node.floor_level if current_node else st.session_state.turn
-            difficulty = current_node.difficulty if current_node else 1
-            gold_earned = 15 + floor_level * 8 + difficulty * 3 + random.randint(0, 10)
-            st.session_state.prev_gold = st.session_state.get('gold', 0)
-            st.session_state.gold = st.session_state.prev_gold + gold_earned
-            st.rerun()
-            return
-        
-        if st.session_state.player_hp <= 0:
-            # 敗北画面
-            st.error("💀 敗北")
-            
-            save_data = st.session_state.persistent_data
-            floor_reached = st.session_state.get('current_floor', st.session_state.turn)
-            updated_data = game_data.record_game_result(save_data, won=False, floor_reached=floor_reached)
-            st.session_state.persistent_data = updated_data
-            game_data.save_game_data(updated_data)
-            
-            points_earned = max(1, floor_reached // 2)
-            st.caption(f"到達階層:{floor_reached} 獲得:💎{points_earned}")
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("🔄 最初から", use_container_width=True, type="primary"):
-                    st.session_state.game_state = 'menu'
-                    st.rerun()
-            with col2:
-                if st.button("🔼 アップグレード", use_container_width=True):
-                    st.session_state.game_state = 'upgrade'
-                    st.rerun()
-            return
-        
-        # 中央：手札（横1列・コンパクト）
-        # エネルギーを描画前にクランプして不整合を防ぐ
-        st.session_state.energy = max(0, min(st.session_state.energy, st.session_state.max_energy))
-
-        if len(st.session_state.hand) == 0:
-            st.caption("手札なし")
-        else:
-            cols = st.columns(len(st.session_state.hand))
-            card_played = False  # 1ループで1枚だけ使えるようにするフラグ
-            for i, card in enumerate(st.session_state.hand):
-                with cols[i]:
-                    if display_card_compact(card, "hand", i) and not card_played:
-                        card_played = True
-                        st.session_state.current_turn_log = []
-                        log_before = len(st.session_state.battle_log)
-                        play_card(i)
-                        log_after = len(st.session_state.battle_log)
-                        st.session_state.current_turn_log = st.session_state.battle_log[log_before:log_after]
-                        st.rerun()
-        
-        # 下部：ターンログ（コンパクト）
-        if st.session_state.current_turn_log:
-            recent_logs = st.session_state.current_turn_log[-3:]
-            st.caption("📝 " + " | ".join(recent_logs))
-        
-        # ターン終了ボタン（ターンログの直下）
-        if st.button("🔚 ターン終了", key="end_turn_main", use_container_width=True, type="primary"):
-            # ターンログをリセット
-            st.session_state.current_turn_log = []
-            
-            # 手札を全て捨て札へ（Slay the Spire式）
-            if len(st.session_state.hand) > 0:
-                discard_count = len(st.session_state.hand)
-                st.session_state.discard.extend(st.session_state.hand)
-                st.session_state.hand = []
-                st.session_state.battle_log.append(f"🗑️ {discard_count}枚のカードを破棄")
-            
-            # ログ数を記録
-            log_before = len(st.session_state.battle_log)
-            
-            # 敵が生きている場合のみ敵のターン
-            if st.session_state.enemy["hp"] > 0:
-                enemy_turn()
-            
-            # 敵のターンログをターンログに追加（新しく追加された分のみ）
-            log_after = len(st.session_state.battle_log)
-            st.session_state.current_turn_log = st.session_state.battle_log[log_before:log_after]
-            
-            # 次のターン開始
-            start_turn()
-            
-            st.rerun()
-        
-        st.write("---")
-        
-        # 情報パネル：3つのエクスパンダーを横並び
-        info_col1, info_col2, info_col3 = st.columns(3)
-        
-        with info_col1:
-            with st.expander("🎴 デッキ＆カード"):
-                st.metric("山札", f"{len(st.session_state.deck)}枚")
-                st.metric("捨札", f"{len(st.session_state.discard)}枚")
-                st.write("**所持カード一覧:**")
-                card_counts = {}
-                for card in st.session_state.all_cards:
-                    name = card['name']
-                    card_counts[name] = card_counts.get(name, 0) + 1
-                
-                for name, count in sorted(card_counts.items()):
-                    st.caption(f"{name} × {count}")
-        
-        with info_col2:
-            with st.expander("⚡ 元素反応＆デバフガイド"):
-                st.markdown("""
-                <div style='font-size: 0.8rem;'>
-                    <div style='background: rgba(255, 107, 107, 0.3); padding: 8px; border-radius: 6px; margin-bottom: 6px; border-left: 3px solid #FF6B6B;'>
-                        <strong>🔥 燃焼</strong> 炎 + 草: 追加+12 | 持続10×3T
-                    </div>
-                    <div style='background: rgba(78, 205, 196, 0.3); padding: 8px; border-radius: 6px; margin-bottom: 6px; border-left: 3px solid #4ECDC4;'>
-                        <strong>💧 蒸発</strong> 炎 + 水: 追加+30 高威力！
-                    </div>
-                    <div style='background: rgba(149, 231, 125, 0.3); padding: 8px; border-radius: 6px; margin-bottom: 6px; border-left: 3px solid #95E77D;'>
-                        <strong>🌿 成長</strong> 水 + 草: 追加+25 | HP回復12%
-                    </div>
-                    <div style='background: rgba(180, 100, 220, 0.3); padding: 8px; border-radius: 6px; margin-bottom: 4px; border-left: 3px solid #b464dc;'>
-                        <strong>💀 デバフカード</strong><br>
-                        ⬇️ 弱体化: 敵攻撃力ダウン<br>
-                        💫 スタン: 1T行動不能<br>
-                        ☠️ 毒: 毎T継続ダメージ<br>
-                        ❄️ 氷結: 弱体化 + 水付与
-                    </div>
-                    <p style='margin-top: 6px; font-size: 0.75rem; color: rgba(255,255,255,0.7);'>
-                        ⏳ 反応後1ターンは元素付着不可
-                    </p>
-                </div>
-                """, unsafe_allow_html=True)
-        
-        with info_col3:
-            with st.expander("📜 戦闘ログ"):
-                st.write("**最新20件:**")
-                for log in st.session_state.battle_log[-20:]:
-                    st.caption(log)
+        # 演出・ステータス・手札・ログ（操作ではここだけ再実行される）
+        battle_board()
     
     elif st.session_state.game_state == 'clear':
         """ゲームクリア画面"""
-        st.markdown("""
+        st.markdown(f"""
         <div style='text-align: center; padding: 40px 0;'>
             <div style='font-size: 4rem; margin-bottom: 20px;'>🎉</div>
             <h1 style='color: #FFD700; font-size: 3rem; text-shadow: 0 0 20px rgba(255, 215, 0, 0.8); margin-bottom: 10px;'>
                 ゲームクリア！
             </h1>
             <h2 style='color: #FFA500; font-size: 1.8rem; text-shadow: 0 0 10px rgba(255, 165, 0, 0.6);'>
-                10階層を制覇しました！
+                {st.session_state.run.map_spec.depth}階層を制覇しました！
             </h2>
         </div>
         """, unsafe_allow_html=True)
@@ -2161,18 +1072,11 @@ def main():
         
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("到達階層", "10")
+            st.metric("到達階層", st.session_state.run.map_spec.depth)
         with col2:
-            st.metric("獲得ゴールド", st.session_state.get('gold', 0))
+            st.metric("獲得ゴールド", st.session_state.run.gold)
         with col3:
-            st.metric("デッキサイズ", len(st.session_state.all_cards))
-        
-        # 永続データ更新
-        save_data = st.session_state.persistent_data
-        save_data['total_wins'] = save_data.get('total_wins', 0) + 1
-        save_data['highest_floor'] = 10
-        st.session_state.persistent_data = save_data
-        game_data.save_game_data(save_data)
+            st.metric("デッキサイズ", len(st.session_state.run.all_cards))
         
         # ボタン
         st.write("---")
@@ -2190,8 +1094,9 @@ def main():
     
     elif st.session_state.game_state == 'victory':
         """勝利画面：報酬選択"""
-        st.success(f"🎉 勝利！ {st.session_state.enemy['name']}を倒した")
-        st.info(f"💰 ゴールド +{st.session_state.gold - st.session_state.get('prev_gold', 0)} (所持: {st.session_state.gold}G)")
+        run = st.session_state.run
+        st.success(f"🎉 勝利！ {run.battle.enemy['name']}を倒した")
+        st.info(f"💰 ゴールド +{run.gold - run.prev_gold} (所持: {run.gold}G)")
         
         # 報酬選択の状態管理
         if 'reward_choice' not in st.session_state:
@@ -2256,22 +1161,18 @@ def main():
                 </div>
                 """, unsafe_allow_html=True)
                 if st.button("💎 ポイント獲得", key="choose_points", use_container_width=True):
-                    # ポイント付与
-                    save_data = st.session_state.persistent_data
-                    save_data['upgrade_points'] = save_data.get('upgrade_points', 0) + 5
-                    st.session_state.persistent_data = save_data
-                    game_data.save_game_data(save_data)
-                    # 次の階層へ
-                    proceed_to_next_floor()
+                    # ポイント付与して次の階層へ
+                    points = run_engine.reward_points(run)
+                    st.session_state.persistent_data, _ = game_data.update_game_data(
+                        functools.partial(game_data.add_upgrade_points, points=points),
+                        player_id=st.session_state.player_id)
+                    sync_run_phase()
                     st.rerun()
             return
         
         # カード獲得画面（P0-2: 報酬カードをセッションキャッシュ化）
         elif st.session_state.reward_choice == 'card':
-            if 'reward_cards_cache' not in st.session_state:
-                all_cards = create_basic_cards()
-                st.session_state.reward_cards_cache = random.sample(all_cards, min(3, len(all_cards)))
-            reward_cards = st.session_state.reward_cards_cache
+            reward_cards = run_engine.roll_reward_cards(run)
 
             st.write("### ✨ カードを1枚選択")
             cols = st.columns(3)
@@ -2280,21 +1181,18 @@ def main():
                     display_card_reward(card, i)
 
                     if st.button(f"✨ 獲得", key=f"get_reward_{i}", use_container_width=True, type="primary"):
-                        st.session_state.all_cards.append(card)
-                        st.session_state.reward_choice = None
-                        if 'reward_cards_cache' in st.session_state:
-                            del st.session_state.reward_cards_cache
-                        proceed_to_next_floor()
+                        run_engine.reward_take_card(run, i)
+                        sync_run_phase()
                         st.rerun()
             return
 
         # カード削除画面（P0-3: インデントバグ修正）
         elif st.session_state.reward_choice == 'delete':
             st.write("### 🗑️ 削除するカードを選択（最大2枚）")
-            st.caption(f"現在のデッキ: {len(st.session_state.all_cards)}枚 | 選択中: {len(st.session_state.cards_to_delete)}/2枚")
+            st.caption(f"現在のデッキ: {len(run.all_cards)}枚 | 選択中: {len(st.session_state.cards_to_delete)}/2枚")
 
             card_groups = {}
-            for card in st.session_state.all_cards:
+            for card in run.all_cards:
                 name = card['name']
                 if name not in card_groups:
                     card_groups[name] = []
@@ -2305,18 +1203,18 @@ def main():
                 with cols[0]:
                     st.write(f"**{name}** × {len(cards)}")
                 with cols[1]:
-                    card_id = id(cards[0])
+                    card_id = cards[0].instance_id
                     if card_id in st.session_state.cards_to_delete:
                         if st.button("✅ 選択中", key=f"unselect_{card_id}", use_container_width=True):
                             st.session_state.cards_to_delete.remove(card_id)
                             st.rerun()
                     else:
-                        disabled = len(st.session_state.cards_to_delete) >= 2 or len(st.session_state.all_cards) <= 10
+                        disabled = len(st.session_state.cards_to_delete) >= run_engine.REWARD_DELETE_MAX or not run_engine.can_delete_cards(run)
                         if st.button("🗑️ 選択", key=f"select_{card_id}", use_container_width=True, disabled=disabled):
                             st.session_state.cards_to_delete.append(card_id)
                             st.rerun()
 
-            if len(st.session_state.all_cards) <= 10:
+            if not run_engine.can_delete_cards(run):
                 st.warning("⚠️ デッキは最低10枚必要です")
 
             st.write("---")
@@ -2333,14 +1231,9 @@ def main():
                              use_container_width=True,
                              type="primary",
                              disabled=len(st.session_state.cards_to_delete) == 0):
-                    for card_id in st.session_state.cards_to_delete:
-                        for card in st.session_state.all_cards:
-                            if id(card) == card_id:
-                                st.session_state.all_cards.remove(card)
-                                break
-                    st.session_state.cards_to_delete = []
-                    st.session_state.reward_choice = None
-                    proceed_to_next_floor()
+                    selected = [i for i, card in enumerate(run.all_cards) if card.instance_id in st.session_state.cards_to_delete]
+                    run_engine.reward_delete_cards(run, selected)
+                    sync_run_phase()
                     st.rerun()
 
             return
@@ -1,381 +1,1023 @@
-"""
-フロアツリーの生成とビジュアル化
-毎ゲーム異なるランダムツリーを生成し、プレイヤーが2択で選択できる
-"""
-
-import random
-from typing import Dict, Tuple, Optional
-from dataclasses import dataclass
-
-# ===== ノード定義 =====
-
-@dataclass
-class FloorNode:
-    """フロアツリーのノード"""
-    node_id: str              # 一意のID: "level_0_0", "level_1_0", ...
-    floor_level: int          # 階層: 1-10
-    node_type: str            # "battle" | "rest" | "shop"
-    difficulty: int           # 敵の難易度: 1-10（node_typeが"battle"の時のみ）
-    enemy_name: Optional[str] # 敵名
-    parent_id: Optional[str]  = None
-    left_child_id: Optional[str] = None
-    right_child_id: Optional[str] = None
-    visited: bool = False
-
-
-# ===== ツリー生成エンジン =====
-
-ENEMY_NAMES = ["スライム", "ゴブリン", "オーク", "ドラゴン", "魔法使い"]
-
-def get_enemy_for_difficulty(difficulty: int) -> str:
-    """難易度に応じて敵を選択"""
-    # 難易度1-2: スライム
-    # 難易度3-4: ゴブリン
-    # 難易度5-6: オーク
-    # 難易度7-8: ドラゴン
-    # 難易度9-10: 魔法使い
-    if difficulty <= 2:
-        return "スライム"
-    elif difficulty <= 4:
-        return "ゴブリン"
-    elif difficulty <= 6:
-        return "オーク"
-    elif difficulty <= 8:
-        return "ドラゴン"
-    else:
-        return "魔法使い"
-
-
-def decide_node_type(floor_level: int) -> str:
-    """階層に応じてノードタイプを決定"""
-    if floor_level == 10:
-        return "battle"  # 最終階層は必ず敵
-    
-    # 60%: 敵, 20%: 休憩, 20%: ショップ
-    rand = random.random()
-    if rand < 0.6:
-        return "battle"
-    elif rand < 0.8:
-        return "rest"
-    else:
-        return "shop"
-
-
-def generate_floor_tree(seed: Optional[int] = None) -> Tuple[Dict[str, FloorNode], str]:
-    """
-    ランダムツリー生成（スリム分岐型）
-    階層ごとに1択または2択をランダムに配置。肥大化を防ぐ
-    
-    Returns:
-        (ノード辞書, ルートノードID)
-    """
-    if seed is not None:
-        random.seed(seed)
-    
-    nodes = {}
-    node_counter = 0
-    
-    def create_node(floor_level: int, parent_id: Optional[str] = None) -> FloorNode:
-        """ノードを生成"""
-        nonlocal node_counter
-        node_id = f"node_{node_counter}"
-        node_counter += 1
-        
-        # ノードタイプを決定
-        if floor_level == 1:
-            node_type = "battle"  # 第1階層は必ず戦闘
-        elif floor_level == 10:
-            node_type = "battle"  # 最終階層は必ずボス
-        else:
-            node_type = decide_node_type(floor_level)
-        
-        # 難易度
-        if floor_level == 1:
-            difficulty = 1
-        else:
-            base_difficulty = floor_level + random.randint(-1, 2)
-            difficulty = max(1, min(base_difficulty, 10))
-        
-        # 敵名
-        enemy_name = get_enemy_for_difficulty(difficulty) if node_type == "battle" else None
-        
-        node = FloorNode(
-            node_id=node_id,
-            floor_level=floor_level,
-            node_type=node_type,
-            difficulty=difficulty,
-            enemy_name=enemy_name,
-            parent_id=parent_id
-        )
-        
-        nodes[node_id] = node
-        return node
-    
-    def generate_path(parent_node: FloorNode, max_depth: int = 10):
-        """一本道のパスを生成（分岐は確率的）"""
-        if parent_node.floor_level >= max_depth:
-            return
-        
-        next_floor = parent_node.floor_level + 1
-        
-        # 分岐確率を決定（階層が深いほど低く）
-        # 階層2-3: 80%で2択、20%で1択
-        # 階層4-6: 60%で2択、40%で1択
-        # 階層7-9: 40%で2択、60%で1択
-        if next_floor <= 3:
-            branch_chance = 0.8
-        elif next_floor <= 6:
-            branch_chance = 0.6
-        else:
-            branch_chance = 0.4
-        
-        # 分岐するかどうか決定
-        should_branch = random.random() < branch_chance
-        
-        if should_branch:
-            # 2択を生成
-            left_child = create_node(next_floor, parent_node.node_id)
-            right_child = create_node(next_floor, parent_node.node_id)
-            
-            parent_node.left_child_id = left_child.node_id
-            parent_node.right_child_id = right_child.node_id
-            
-            # それぞれのパスを再帰的に生成
-            generate_path(left_child, max_depth)
-            generate_path(right_child, max_depth)
-        else:
-            # 1択のみ生成
-            only_child = create_node(next_floor, parent_node.node_id)
-            
-            # 左右両方に同じノードを設定（1択として表示）
-            parent_node.left_child_id = only_child.node_id
-            parent_node.right_child_id = only_child.node_id
-            
-            # パスを続ける
-            generate_path(only_child, max_depth)
-    
-    # ルートノードを生成
-    root = create_node(floor_level=1)
-    root_id = root.node_id
-    
-    # ツリーを生成（階層10まで）
-    generate_path(root, max_depth=10)
-    
-    return nodes, root_id
-
-
-def get_node_children(nodes: Dict[str, FloorNode], node_id: str) -> Tuple[Optional[FloorNode], Optional[FloorNode]]:
-    """ノードの左右の子を取得"""
-    node = nodes.get(node_id)
-    if not node:
-        return None, None
-    
-    left_child = nodes.get(node.left_child_id) if node.left_child_id else None
-    right_child = nodes.get(node.right_child_id) if node.right_child_id else None
-    
-    return left_child, right_child
-
-
-def get_node_by_id(nodes: Dict[str, FloorNode], node_id: str) -> Optional[FloorNode]:
-    """IDからノードを取得"""
-    return nodes.get(node_id)
-
-
-# ===== ビジュアル化関数 =====
-
-def get_visible_nodes(nodes: Dict[str, FloorNode], current_node_id: str, depth: int = 2) -> Dict[str, FloorNode]:
-    """
-    現在のノードから到達可能なノードのみを抽出
-    
-    Args:
-        nodes: 全ノード辞書
-        current_node_id: 現在のノードID
-        depth: 表示する深さ（デフォルト2=次の次の階層まで）
-    
-    Returns:
-        到達可能なノード辞書
-    """
-    current_node = nodes[current_node_id]
-    visible_nodes = {current_node_id: current_node}
-    
-    # 再帰的に到達可能なノードを収集
-    def add_reachable_nodes(node_id: str, remaining_depth: int):
-        if remaining_depth <= 0 or node_id not in nodes:
-            return
-        
-        node = nodes[node_id]
-        
-        # 左右の子ノードを追加（重複を避ける）
-        child_ids = set()
-        if node.left_child_id:
-            child_ids.add(node.left_child_id)
-        if node.right_child_id:
-            child_ids.add(node.right_child_id)
-        
-        for child_id in child_ids:
-            if child_id not in visible_nodes:
-                visible_nodes[child_id] = nodes[child_id]
-                add_reachable_nodes(child_id, remaining_depth - 1)
-    
-    add_reachable_nodes(current_node_id, depth)
-    return visible_nodes
-
-
-def visualize_tree_graphviz(nodes: Dict[str, FloorNode], current_node_id: str) -> str:
-    """
-    graphvizでツリーを可視化してSVGを返す（2階層先までのみ表示）
-    
-    Args:
-        nodes: ノード辞書
-        current_node_id: 現在のノードID
-    
-    Returns:
-        SVG文字列
-    """
-    try:
-        import graphviz
-        import os
-    except ImportError:
-        # graphvizがインストールされていない場合はテキスト表示
-        return visualize_tree_text(nodes, current_node_id)
-    
-    # Graphvizの実行ファイルパスを明示的に設定
-    if os.name == 'nt':  # Windows
-        possible_paths = [
-            r"C:\Program Files (x86)\Graphviz\bin",
-            r"C:\Program Files\Graphviz\bin",
-        ]
-        for gv_path in possible_paths:
-            if os.path.exists(gv_path):
-                os.environ["PATH"] = gv_path + os.pathsep + os.environ.get("PATH", "")
-                # graphvizモジュールに直接パスを設定
-                try:
-                    import graphviz.backend as gb
-                    gb.DOT_BINARY = os.path.join(gv_path, "dot.exe")
-                except:
-                    pass
-                break
-    
-    # 表示するノードをフィルタリング（2階層先まで）
-    visible_nodes = get_visible_nodes(nodes, current_node_id, depth=2)
-    
-    # graphvizオブジェクト作成
-    dot = graphviz.Digraph('floor_tree', format='svg')
-    dot.attr(rankdir='TB')
-    dot.attr('node', shape='box', style='rounded,filled', fontname='MS Gothic', fontsize='9')
-    dot.attr('graph', bgcolor='transparent')
-    
-    # ノードを追加
-    for node_id, node in sorted(visible_nodes.items()):
-        # ノード表示
-        if node.node_type == "battle":
-            label = f"{node.enemy_name}\n⭐ Lv.{node.difficulty}"
-        elif node.node_type == "rest":
-            label = f"休憩所\n🏘️"
-        else:  # shop
-            label = f"ショップ\n🛍️"
-        
-        # ツールチップ（ホバー時表示）: 階層名
-        tooltip = f"第{node.floor_level}階層"
-        
-        # 色分け
-        if node_id == current_node_id:
-            color = '#FF6B6B'  # 赤: 現在位置
-            penwidth = '3'
-        elif node.node_type == "battle":
-            color = '#FFD93D'  # 金: 戦闘
-            penwidth = '1'
-        elif node.node_type == "rest":
-            color = '#6BCB77'  # 緑: 休憩
-            penwidth = '1'
-        else:  # shop
-            color = '#4D96FF'  # 青: ショップ
-            penwidth = '1'
-        
-        dot.node(node_id, label, fillcolor=color, penwidth=penwidth, fontcolor='white', tooltip=tooltip)
-    
-    # エッジを追加（重複を避ける）
-    for node_id, node in visible_nodes.items():
-        # 左右の子ノードをセットで管理（重複排除）
-        child_ids = set()
-        if node.left_child_id and node.left_child_id in visible_nodes:
-            child_ids.add(node.left_child_id)
-        if node.right_child_id and node.right_child_id in visible_nodes:
-            child_ids.add(node.right_child_id)
-        
-        # 重複しない子ノードへのエッジを追加
-        for child_id in child_ids:
-            dot.edge(node_id, child_id, color='gray80', penwidth='1.5')
-    
-    # SVG文字列を返す
-    try:
-        svg_string = dot.pipe(format='svg').decode('utf-8')
-        return svg_string
-    except Exception as e:
-        print(f"graphviz error: {e}")
-        return visualize_tree_text(nodes, current_node_id)
-
-
-def visualize_tree_text(nodes: Dict[str, FloorNode], current_node_id: str) -> str:
-    """
-    テキスト形式のツリー表示（2階層先までのみ）
-    """
-    current_node = nodes[current_node_id]
-    current_floor = current_node.floor_level
-    
-    result = "🌳 フロアツリー（次の次の階層まで表示）\n"
-    result += "=" * 40 + "\n\n"
-    
-    # 現在の階層から2階層先までを表示
-    for floor in range(current_floor, min(current_floor + 3, 11)):
-        result += f"【第{floor}階層】\n"
-        nodes_in_floor = [n for n in nodes.values() if n.floor_level == floor]
-        
-        for node in sorted(nodes_in_floor, key=lambda x: int(x.node_id.split('_')[-1])):
-            marker = "→ " if node.node_id == current_node_id else "   "
-            
-            if node.node_type == "battle":
-                result += f"{marker}🔥 {node.enemy_name} (Lv.{node.difficulty})\n"
-            elif node.node_type == "rest":
-                result += f"{marker}🏘️  休憩所\n"
-            else:
-                result += f"{marker}🛍️  ショップ\n"
-        
-        result += "\n"
-    
-    return result
-
-
-# ===== テスト用 =====
-
-if __name__ == "__main__":
-    # ツリー生成テスト
-    nodes, root_id = generate_floor_tree(seed=42)
-    
-    print(f"Generated {len(nodes)} nodes")
-    print(f"Root: {root_id}\n")
-    
-    # ツリー構造を表示
-    for floor in range(1, 11):
-        floor_nodes = [n for n in nodes.values() if n.floor_level == floor]
-        print(f"Floor {floor}: {len(floor_nodes)} nodes")
-        for node in sorted(floor_nodes, key=lambda x: int(x.node_id.split('_')[-1])):
-            print(f"  {node.node_id}: type={node.node_type}, difficulty={node.difficulty}")
-    
-    # ツリー移動テスト
-    current = nodes[root_id]
-    print(f"\nStarting at: {current.node_id} ({current.node_type})")
-    
-    for _ in range(3):
-        left, right = get_node_children(nodes, current.node_id)
-        if left or right:
-            print(f"Choices:")
-            if left:
-                print(f"  L: {left.node_id} ({left.node_type})")
-            if right:
-                print(f"  R: {right.node_id} ({right.node_type})")
-            
-            # ランダムに選択
-            choice = random.choice([left, right])
-            current = choice
+"""
+フロアツリーの生成とビジュアル化
+毎ゲーム異なるランダムツリーを生成し、プレイヤーが2択で選択できる
+"""
+
+import hashlib
+import html
+import random
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Tuple, Optional
+from dataclasses import dataclass
+
+# ===== ノード定義 =====
+
+@dataclass(slots=True)
+class FloorNode:
+    """
+    フロアツリーのノード（__slots__ で属性辞書を持たない）
+    node_type と enemy_name は NODE_TYPES / ENEMY_NAMES の文字列を共有する
+    """
+    node_id: int              # ノード番号（ルートは0、生成順）
+    floor_level: int          # 階層: 1-depth
+    node_type: str            # "battle" | "rest" | "shop"
+    difficulty: int           # 敵の難易度: 1-10（node_typeが"battle"の時のみ）
+    enemy_name: Optional[str] # 敵名
+    parent_id: Optional[int]  = None
+    left_child_id: Optional[int] = None
+    right_child_id: Optional[int] = None
+    visited: bool = False
+
+
+# ===== ツリー生成エンジン =====
+
+ENEMY_NAMES = ("スライム", "ゴブリン", "オーク", "ドラゴン", "魔法使い")
+
+# ノードタイプの番号（配列にはこの番号を入れる）
+NODE_TYPES = ("battle", "rest", "shop")
+NODE_BATTLE, NODE_REST, NODE_SHOP = range(len(NODE_TYPES))
+
+def get_enemy_for_difficulty(difficulty: int) -> str:
+    """難易度に応じて敵を選択"""
+    # 難易度1-2: スライム
+    # 難易度3-4: ゴブリン
+    # 難易度5-6: オーク
+    # 難易度7-8: ドラゴン
+    # 難易度9-10: 魔法使い
+    if difficulty <= 2:
+        return ENEMY_NAMES[0]
+    elif difficulty <= 4:
+        return ENEMY_NAMES[1]
+    elif difficulty <= 6:
+        return ENEMY_NAMES[2]
+    elif difficulty <= 8:
+        return ENEMY_NAMES[3]
+    else:
+        return ENEMY_NAMES[4]
+
+
+MAX_DIFFICULTY = 10
+MAX_MAP_DEPTH = 0xFFFF  # to_bytes は階層を符号なし16ビットで持つ
+
+# ===== マップ仕様 =====
+
+@dataclass(frozen=True)
+class MapSpec:
+    """
+    マップの形を決めるパラメータ
+
+    branch_bands は (その階層まで, 2択になる確率) を浅い順に並べたもの。
+    最後の帯より深い階層は最後の帯の確率を使う。
+    dag=True では階層ごとに幅を max_width までに抑え、隣り合うパスを合流させるので
+    ノード数は depth × max_width 以下（深いエンドレスモード向け）。
+    dag=False は従来どおり合流しない木で、深くすると指数的に増えるので max_nodes で打ち切る
+    """
+    depth: int = 10
+    branch_bands: Tuple[Tuple[int, float], ...] = ((3, 0.8), (6, 0.6), (9, 0.4))
+    node_type_weights: Tuple[Tuple[str, float], ...] = (("battle", 6), ("rest", 2), ("shop", 2))
+    dag: bool = False
+    max_width: int = 4            # DAGモードの1階層あたりの最大ノード数
+    merge_chance: float = 0.5     # DAGモードで左の子を隣のパスと合流させる確率
+    max_nodes: int = 100_000      # 木モードのノード数の上限
+
+    def __post_init__(self):
+        if not 1 <= self.depth <= MAX_MAP_DEPTH:
+            raise ValueError(f"depth は1〜{MAX_MAP_DEPTH}: {self.depth}")
+        if not self.branch_bands:
+            raise ValueError("branch_bands が空です")
+        if any(not 0 <= chance <= 1 for _, chance in self.branch_bands):
+            raise ValueError(f"branch_bands の確率は0〜1: {self.branch_bands}")
+        if not 0 <= self.merge_chance <= 1:
+            raise ValueError(f"merge_chance は0〜1: {self.merge_chance}")
+        if self.max_width < 1:
+            raise ValueError(f"max_width は1以上: {self.max_width}")
+        weights = dict(self.node_type_weights)
+        if set(weights) - set(NODE_TYPES) or sum(weights.values()) <= 0:
+            raise ValueError(f"不正な node_type_weights: {self.node_type_weights}")
+
+    def branch_chance(self, floor_level: int) -> float:
+        """floor_level に子を作るとき2択になる確率"""
+        for last_floor, chance in self.branch_bands:
+            if floor_level <= last_floor:
+                return chance
+        return self.branch_bands[-1][1]
+
+    def type_thresholds(self) -> List[Tuple[float, int]]:
+        """ノードタイプ抽選の累積確率の表 [(しきい値, タイプ番号), ...]"""
+        total = sum(weight for _, weight in self.node_type_weights)
+        thresholds = []
+        cumulative = 0.0
+        for name, weight in self.node_type_weights:
+            cumulative += weight
+            thresholds.append((cumulative / total, NODE_TYPES.index(name)))
+        return thresholds
+
+    def to_dict(self) -> dict:
+        """JSONに書ける形（リプレイログのヘッダー用）"""
+        return {
+            "depth": self.depth,
+            "branch_bands": [list(band) for band in self.branch_bands],
+            "node_type_weights": [list(weight) for weight in self.node_type_weights],
+            "dag": self.dag,
+            "max_width": self.max_width,
+            "merge_chance": self.merge_chance,
+            "max_nodes": self.max_nodes,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MapSpec":
+        """to_dict の逆"""
+        data = dict(data)
+        if "branch_bands" in data:
+            data["branch_bands"] = tuple(tuple(band) for band in data["branch_bands"])
+        if "node_type_weights" in data:
+            data["node_type_weights"] = tuple(tuple(weight) for weight in data["node_type_weights"])
+        return cls(**data)
+
+
+# 従来の10階層マップ
+DEFAULT_MAP_SPEC = MapSpec()
+
+# エンドレスモード用（100階層、階層ごとに最大4ノード）
+ENDLESS_MAP_SPEC = MapSpec(depth=100, dag=True)
+
+
+def scaled_floor(floor_level: int, depth: int) -> int:
+    """階層を 1〜MAX_DIFFICULTY の難易度の目安に換算（depth=10 なら階層そのまま）"""
+    return floor_level * MAX_DIFFICULTY // depth
+
+
+# ===== 配列表現 =====
+
+NO_NODE = -1  # 子・親がない
+
+
+@dataclass
+class FloorArrays:
+    """
+    フロアツリーの配列表現（添字 = ノード番号 = ノードID）
+
+    ノード1つごとにオブジェクトを作らず、属性ごとの配列に並べて持つ。
+    ルートは常に0番
+    """
+    floor_level: array   # 階層
+    node_type: array     # NODE_TYPES の番号
+    difficulty: array    # 難易度
+    left: array          # 左の子の番号（なければ NO_NODE）
+    right: array         # 右の子の番号（1択なら左と同じ）
+    parent: array        # 親の番号（ルートは NO_NODE。DAGモードで合流したノードは最初の親）
+    depth: int = 10      # 最終階層
+
+    def __len__(self) -> int:
+        return len(self.floor_level)
+
+    def to_node(self, index: int) -> FloorNode:
+        """index 番のノードを FloorNode にする"""
+        node_type = NODE_TYPES[self.node_type[index]]
+        difficulty = self.difficulty[index]
+        left, right, parent = self.left[index], self.right[index], self.parent[index]
+        return FloorNode(
+            node_id=index,
+            floor_level=self.floor_level[index],
+            node_type=node_type,
+            difficulty=difficulty,
+            enemy_name=get_enemy_for_difficulty(difficulty) if node_type == "battle" else None,
+            parent_id=parent if parent != NO_NODE else None,
+            left_child_id=left if left != NO_NODE else None,
+            right_child_id=right if right != NO_NODE else None,
+        )
+
+    def to_bytes(self) -> bytes:
+        """
+        ツリー全体をバイト列にする（ノード1つあたり16バイト）
+        形式: ヘッダー（マジック・形式バージョン・最終階層・ノード数）＋ 各配列（リトルエンディアン）
+        """
+        parts = [_TREE_HEADER.pack(_TREE_MAGIC, TREE_FORMAT_VERSION, self.depth, len(self))]
+        for name, typecode in _TREE_COLUMNS:
+            column = array(typecode, getattr(self, name))
+            if sys.byteorder == "big":
+                column.byteswap()
+            parts.append(column.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "FloorArrays":
+        """to_bytes の逆"""
+        magic, version, depth, count = _TREE_HEADER.unpack_from(data)
+        if magic != _TREE_MAGIC or version != TREE_FORMAT_VERSION:
+            raise ValueError(f"未対応のツリー形式です: {magic!r} v{version}")
+        columns = {}
+        offset = _TREE_HEADER.size
+        for name, typecode in _TREE_COLUMNS:
+            column = array(typecode)
+            size = column.itemsize * count
+            column.frombytes(data[offset:offset + size])
+            if sys.byteorder == "big":
+                column.byteswap()
+            columns[name] = column
+            offset += size
+        return cls(depth=depth, **columns)
+
+
+# to_bytes の形式
+TREE_FORMAT_VERSION = 1
+_TREE_MAGIC = b"FTRE"
+_TREE_HEADER = struct.Struct("<4sBHI")
+_TREE_COLUMNS = (
+    ("floor_level", "H"),
+    ("node_type", "B"),
+    ("difficulty", "B"),
+    ("left", "i"),
+    ("right", "i"),
+    ("parent", "i"),
+)
+
+
+def generate_floor_arrays(seed: Optional[int] = None,
+                          rng: Optional[random.Random] = None,
+                          spec: Optional[MapSpec] = None) -> FloorArrays:
+    """
+    ランダムツリーを配列表現で生成（再帰せず、明示的なスタックで深さ優先に展開）
+
+    既定の仕様では乱数の消費順とノード番号の振り方は従来の再帰版と同じなので、
+    同じ seed なら以前と同じツリーになる
+
+    Args:
+        seed: 乱数シード（rng を渡さない場合に使う）
+        rng: マップ生成用の乱数ストリーム
+        spec: マップ仕様（None なら DEFAULT_MAP_SPEC）
+    """
+    spec = spec or DEFAULT_MAP_SPEC
+    rng = rng or random.Random(seed)
+    rand = rng.random
+    randint = rng.randint
+    depth = spec.depth
+    thresholds = spec.type_thresholds()
+    last_type = thresholds[-1][1]
+
+    tree = FloorArrays(*(array(typecode) for _, typecode in _TREE_COLUMNS), depth=depth)
+    levels, types, difficulties = tree.floor_level, tree.node_type, tree.difficulty
+    lefts, rights, parents = tree.left, tree.right, tree.parent
+
+    def create_node(floor_level: int, parent: int) -> int:
+        """ノードを追加して番号を返す"""
+        # ノードタイプ（第1階層と最終階層は必ず戦闘。それ以外は node_type_weights の比率で、既定は 60%: 敵, 20%: 休憩, 20%: ショップ）
+        if floor_level == 1 or floor_level == depth:
+            node_type = NODE_BATTLE
+        else:
+            roll = rand()
+            node_type = last_type
+            for threshold, candidate in thresholds:
+                if roll < threshold:
+                    node_type = candidate
+                    break
+
+        # 難易度
+        if floor_level == 1:
+            difficulty = 1
+        else:
+            difficulty = max(1, min(scaled_floor(floor_level, depth) + randint(-1, 2), MAX_DIFFICULTY))
+
+        levels.append(floor_level)
+        types.append(node_type)
+        difficulties.append(difficulty)
+        lefts.append(NO_NODE)
+        rights.append(NO_NODE)
+        parents.append(parent)
+        return len(levels) - 1
+
+    root = create_node(1, NO_NODE)
+    if spec.dag:
+        _grow_dag(spec, rand, create_node, lefts, rights, root)
+        return tree
+
+    # 展開待ちのノード（左の子を先に展開するため右から積む）
+    stack = [root]
+    while stack:
+        index = stack.pop()
+        next_floor = levels[index] + 1
+        if next_floor > depth:
+            continue
+        if len(levels) >= spec.max_nodes:
+            raise ValueError(f"ノード数が上限 {spec.max_nodes} を超えました（深いマップは dag=True を使ってください）")
+
+        # 分岐確率（既定は階層が深いほど低く、階層2-3: 80%、4-6: 60%、7-: 40%で2択）
+        if rand() < spec.branch_chance(next_floor):
+            # 2択を生成
+            left = create_node(next_floor, index)
+            right = create_node(next_floor, index)
+            lefts[index] = left
+            rights[index] = right
+            stack.append(right)
+            stack.append(left)
+        else:
+            # 1択のみ生成（左右両方に同じノードを設定）
+            only = create_node(next_floor, index)
+            lefts[index] = only
+            rights[index] = only
+            stack.append(only)
+
+    return tree
+
+
+def _grow_dag(spec: MapSpec, rand, create_node, lefts: array, rights: array, root: int):
+    """
+    階層ごとに左から順に子を作り、隣り合うパスを合流させる（DAGモード）
+
+    左の子は merge_chance の確率で、左隣の親が最後に作った子と共有する。
+    階層の幅が max_width に達したら新しいノードは作らず、その階層の右端のノードにつなぐ
+    （並び順が崩れないので辺は交差しない）
+    """
+    current = [root]
+    for floor_level in range(2, spec.depth + 1):
+        branch_chance = spec.branch_chance(floor_level)
+        next_floor: List[int] = []
+        for parent in current:
+            children = []
+            for k in range(2 if rand() < branch_chance else 1):
+                if next_floor and (len(next_floor) >= spec.max_width
+                                   or (k == 0 and rand() < spec.merge_chance)):
+                    child = next_floor[-1]  # 隣のパスと合流
+                else:
+                    child = create_node(floor_level, parent)
+                    next_floor.append(child)
+                children.append(child)
+            lefts[parent] = children[0]
+            rights[parent] = children[-1]
+        current = next_floor
+
+
+class FloorTree(Mapping):
+    """
+    フロアツリー（FloorArrays を従来のノード辞書 ノードID → FloorNode として見せるアダプター）
+
+    FloorNode はアクセスされたノードだけ作ってキャッシュする
+    （シミュレーターのように通るノードしか見ない場合はほとんど作らずに済む）。
+    階層ごとのノード一覧と、深さを区切った子孫の集合も初回の問い合わせで作って持っておくので、
+    表示や到達判定は全ノードを走査せず結果の大きさに比例した時間で済む。
+    pickle では作ったノードや索引は捨てて FloorArrays.to_bytes の形式だけを保存する
+    """
+
+    def __init__(self, arrays: FloorArrays):
+        self.arrays = arrays
+        self.depth = arrays.depth
+        self._nodes: List[Optional[FloorNode]] = [None] * len(arrays)
+        self._floors: Optional[List[List[int]]] = None               # 階層 → ノードID（番号順）
+        self._descendants: Dict[Tuple[int, int], Tuple[int, ...]] = {}  # (ノードID, 深さ) → 子孫
+        self._analytics: Optional["MapAnalytics"] = None
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "FloorTree":
+        """serialize_tree の逆"""
+        return cls(FloorArrays.from_bytes(data))
+
+    def __reduce__(self):
+        return FloorTree.from_bytes, (self.arrays.to_bytes(),)
+
+    def __getitem__(self, node_id: int) -> FloorNode:
+        if not isinstance(node_id, int) or not 0 <= node_id < len(self._nodes):
+            raise KeyError(node_id)
+        node = self._nodes[node_id]
+        if node is None:
+            node = self._nodes[node_id] = self.arrays.to_node(node_id)
+        return node
+
+    def __contains__(self, node_id: object) -> bool:
+        return isinstance(node_id, int) and 0 <= node_id < len(self._nodes)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self._nodes)))
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    # ----- 索引 -----
+
+    def floor_ids(self, floor_level: int) -> List[int]:
+        """その階層のノードID（番号順。範囲外なら空）"""
+        if self._floors is None:
+            floors: List[List[int]] = [[] for _ in range(self.depth + 1)]
+            for index, level in enumerate(self.arrays.floor_level):
+                floors[level].append(index)
+            self._floors = floors
+        if 0 <= floor_level < len(self._floors):
+            return self._floors[floor_level]
+        return []
+
+    def nodes_on_floor(self, floor_level: int) -> List[FloorNode]:
+        """その階層のノード（番号順）"""
+        return [self[node_id] for node_id in self.floor_ids(floor_level)]
+
+    def children_ids(self, node_id: int) -> Tuple[int, ...]:
+        """子のノードID（左→右。1択なら1つ、最終階層なら空）"""
+        left, right = self.arrays.left[node_id], self.arrays.right[node_id]
+        if left == NO_NODE:
+            return ()
+        return (left,) if left == right else (left, right)
+
+    def descendants(self, node_id: int, depth: int) -> Tuple[int, ...]:
+        """depth 階層先までの子孫のノードID（自身は含まない、番号順）。結果はキャッシュする"""
+        if depth <= 0:
+            return ()
+        key = (node_id, depth)
+        found = self._descendants.get(key)
+        if found is None:
+            reached = set()
+            for child_id in self.children_ids(node_id):
+                reached.add(child_id)
+                reached.update(self.descendants(child_id, depth - 1))
+            found = self._descendants[key] = tuple(sorted(reached))
+        return found
+
+    def is_reachable(self, from_id: int, to_id: int) -> bool:
+        """from_id から to_id へ進めるか（間の階層のノードだけをたどる）"""
+        target_floor = self.arrays.floor_level[to_id]
+        frontier = {from_id}
+        for _ in range(target_floor - self.arrays.floor_level[from_id]):
+            frontier = {child_id for node_id in frontier for child_id in self.children_ids(node_id)}
+        return to_id in frontier
+
+    @property
+    def analytics(self) -> "MapAnalytics":
+        """全ノードの見通し（初回に analyze_tree で1度だけ計算）"""
+        if self._analytics is None:
+            self._analytics = analyze_tree(self)
+        return self._analytics
+
+
+def serialize_tree(nodes: FloorTree) -> bytes:
+    """ツリー全体をコンパクトなバイト列にする（セッション状態の保存・転送用）"""
+    return nodes.arrays.to_bytes()
+
+
+def deserialize_tree(data: bytes) -> FloorTree:
+    """serialize_tree の逆"""
+    return FloorTree.from_bytes(data)
+
+
+def generate_floor_tree(seed: Optional[int] = None,
+                        rng: Optional[random.Random] = None,
+                        spec: Optional[MapSpec] = None) -> Tuple[FloorTree, int]:
+    """
+    ランダムツリー生成（スリム分岐型）
+    階層ごとに1択または2択をランダムに配置。肥大化を防ぐ
+    グローバルな random の状態には触れない（同じ seed なら常に同じツリー）
+    
+    Args:
+        seed: 乱数シード（rng を渡さない場合に使う）
+        rng: マップ生成用の乱数ストリーム
+        spec: マップ仕様（深さ・分岐確率・ノードタイプの比率・DAGモード。None なら従来の10階層）
+    
+    Returns:
+        (ノード辞書, ルートノードID)  ノード辞書は generate_floor_arrays の結果を
+        FloorNode として読めるようにしたもの
+    """
+    return FloorTree(generate_floor_arrays(seed, rng, spec)), 0
+
+
+def get_node_children(nodes: FloorTree, node_id: int) -> Tuple[Optional[FloorNode], Optional[FloorNode]]:
+    """ノードの左右の子を取得"""
+    node = nodes.get(node_id)
+    if not node:
+        return None, None
+    
+    left_child = nodes.get(node.left_child_id) if node.left_child_id is not None else None
+    right_child = nodes.get(node.right_child_id) if node.right_child_id is not None else None
+    
+    return left_child, right_child
+
+
+def get_node_by_id(nodes: FloorTree, node_id: int) -> Optional[FloorNode]:
+    """IDからノードを取得"""
+    return nodes.get(node_id)
+
+
+# ===== マップ分析 =====
+
+@dataclass(slots=True)
+class NodeAnalytics:
+    """ノードから最終階層までの見通し（そのノード自身を含む）"""
+    rest_count: int          # 到達できる休憩所の数
+    shop_count: int          # 到達できるショップの数
+    path_count: int          # 最終階層までの経路の数
+    min_difficulty: int      # 経路上の戦闘の難易度の合計（最小）
+    max_difficulty: int      # 同（最大）
+    mean_difficulty: float   # 同（全経路の平均）
+
+
+@dataclass
+class MapAnalytics:
+    """全ノードの見通しを配列で持つ（添字 = ノードID）"""
+    rest_count: List[int]
+    shop_count: List[int]
+    path_count: List[int]
+    min_difficulty: List[int]
+    max_difficulty: List[int]
+    total_difficulty: List[int]   # 全経路の難易度の合計（平均 = これ / 経路数）
+
+    def node(self, node_id: int) -> NodeAnalytics:
+        """ノード1つ分の見通し"""
+        return NodeAnalytics(
+            rest_count=self.rest_count[node_id],
+            shop_count=self.shop_count[node_id],
+            path_count=self.path_count[node_id],
+            min_difficulty=self.min_difficulty[node_id],
+            max_difficulty=self.max_difficulty[node_id],
+            mean_difficulty=self.total_difficulty[node_id] / self.path_count[node_id],
+        )
+
+
+def analyze_tree(tree: FloorTree) -> MapAnalytics:
+    """
+    全ノードの見通しを葉から根へ1回の走査で計算
+
+    子は必ず親より大きい番号で作られるので、番号の大きい順に見れば子の値は計算済み。
+    合流のない木なら O(ノード数)。DAGモードで合流のあるマップでは、休憩所・ショップの数を
+    重複して数えないよう到達できる休憩所・ショップの集合をビット列（int）で持って OR するため、
+    休憩所・ショップの数だけは O(ノード数² / 語長) かかる（経路数・難易度は合流があっても O(ノード数)）
+    """
+    arrays = tree.arrays
+    count = len(arrays)
+    types, difficulties, lefts, rights = arrays.node_type, arrays.difficulty, arrays.left, arrays.right
+    # 木なら辺の数はノード数 - 1。それより多ければどこかで合流している
+    edges = sum((left != NO_NODE) + (right != left) for left, right in zip(lefts, rights))
+    merged = edges != count - 1
+
+    rests = [0] * count
+    shops = [0] * count
+    paths = [0] * count
+    lows = [0] * count
+    highs = [0] * count
+    totals = [0] * count
+    rest_bits = [0] * count
+    shop_bits = [0] * count
+
+    for node_id in range(count - 1, -1, -1):
+        node_type = types[node_id]
+        battle = difficulties[node_id] if node_type == NODE_BATTLE else 0
+        is_rest = node_type == NODE_REST
+        is_shop = node_type == NODE_SHOP
+        left, right = lefts[node_id], rights[node_id]
+
+        if left == NO_NODE:
+            # 最終階層
+            paths[node_id] = 1
+            lows[node_id] = highs[node_id] = totals[node_id] = battle
+            rest_count, shop_count = is_rest, is_shop
+            if merged:
+                rest_mask = is_rest << node_id
+                shop_mask = is_shop << node_id
+        elif left == right:
+            # 1択
+            path_count = paths[left]
+            paths[node_id] = path_count
+            lows[node_id] = battle + lows[left]
+            highs[node_id] = battle + highs[left]
+            totals[node_id] = battle * path_count + totals[left]
+            rest_count = is_rest + rests[left]
+            shop_count = is_shop + shops[left]
+            if merged:
+                rest_mask = (is_rest << node_id) | rest_bits[left]
+                shop_mask = (is_shop << node_id) | shop_bits[left]
+        else:
+            path_count = paths[left] + paths[right]
+            paths[node_id] = path_count
+            lows[node_id] = battle + min(lows[left], lows[right])
+            highs[node_id] = battle + max(highs[left], highs[right])
+            totals[node_id] = battle * path_count + totals[left] + totals[right]
+            rest_count = is_rest + rests[left] + rests[right]
+            shop_count = is_shop + shops[left] + shops[right]
+            if merged:
+                rest_mask = (is_rest << node_id) | rest_bits[left] | rest_bits[right]
+                shop_mask = (is_shop << node_id) | shop_bits[left] | shop_bits[right]
+
+        if merged:
+            # 合流があると子の数を足すと重複するので、到達できるノードの集合から数える
+            rest_bits[node_id], shop_bits[node_id] = rest_mask, shop_mask
+            rest_count = bin(rest_mask).count("1")
+            shop_count = bin(shop_mask).count("1")
+        rests[node_id] = rest_count
+        shops[node_id] = shop_count
+
+    return MapAnalytics(rests, shops, paths, lows, highs, totals)
+
+
+def score_map(tree: FloorTree) -> NodeAnalytics:
+    """マップ全体の見通し（ルートから最終階層まで）"""
+    return tree.analytics.node(0)
+
+
+# ===== ビジュアル化関数 =====
+
+def get_visible_nodes(nodes: FloorTree, current_node_id: int, depth: int = 2) -> Dict[int, FloorNode]:
+    """
+    現在のノードから到達可能なノードのみを抽出
+    
+    Args:
+        nodes: フロアツリー
+        current_node_id: 現在のノードID
+        depth: 表示する深さ（デフォルト2=次の次の階層まで）
+    
+    Returns:
+        到達可能なノード辞書
+    """
+    visible_nodes = {current_node_id: nodes[current_node_id]}
+    for node_id in nodes.descendants(current_node_id, depth):
+        visible_nodes[node_id] = nodes[node_id]
+    return visible_nodes
+
+
+# ===== SVGキャッシュ =====
+
+# 表示中の部分ツリーと現在地が同じなら同じSVGになるので、内容のハッシュをキーに
+# プロセス内（全セッション共通）でLRUキャッシュする
+SVG_CACHE_SIZE = 512
+
+_svg_cache: "OrderedDict[str, str]" = OrderedDict()
+_svg_cache_lock = threading.Lock()
+_svg_cache_stats = {"hits": 0, "misses": 0}
+
+
+def subgraph_key(visible_nodes: Dict[int, FloorNode], current_node_id: int, backend: str = "graphviz") -> str:
+    """表示内容（ノードの種類・難易度・敵名・表示中の辺）と現在地から作るキャッシュキー"""
+    parts = [backend, str(current_node_id)]
+    for node_id in sorted(visible_nodes):
+        node = visible_nodes[node_id]
+        children = sorted({c for c in (node.left_child_id, node.right_child_id) if c in visible_nodes})
+        parts.append(
+            f"{node_id}|{node.floor_level}|{node.node_type}|{node.difficulty}|{node.enemy_name}|{','.join(map(str, children))}"
+        )
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def get_cached_svg(key: str) -> Optional[str]:
+    """キャッシュからSVGを取得（ヒットしたら最近使ったものとして末尾へ）"""
+    with _svg_cache_lock:
+        svg = _svg_cache.get(key)
+        if svg is None:
+            _svg_cache_stats["misses"] += 1
+            return None
+        _svg_cache.move_to_end(key)
+        _svg_cache_stats["hits"] += 1
+        return svg
+
+
+def put_cached_svg(key: str, svg: str):
+    """SVGをキャッシュに追加（上限を超えたら最も古いものから削除）"""
+    with _svg_cache_lock:
+        _svg_cache[key] = svg
+        _svg_cache.move_to_end(key)
+        while len(_svg_cache) > SVG_CACHE_SIZE:
+            _svg_cache.popitem(last=False)
+
+
+def get_svg_cache_stats() -> Dict[str, int]:
+    """キャッシュのヒット数・ミス数・件数"""
+    with _svg_cache_lock:
+        return {**_svg_cache_stats, "size": len(_svg_cache)}
+
+
+def clear_svg_cache():
+    """キャッシュと統計を消去"""
+    with _svg_cache_lock:
+        _svg_cache.clear()
+        _svg_cache_stats["hits"] = 0
+        _svg_cache_stats["misses"] = 0
+
+
+# ===== ノードの見た目（SVG・graphviz 共通） =====
+
+NODE_COLORS = {
+    "current": "#FF6B6B",  # 赤: 現在位置
+    "battle": "#FFD93D",   # 金: 戦闘
+    "rest": "#6BCB77",     # 緑: 休憩
+    "shop": "#4D96FF",     # 青: ショップ
+}
+EDGE_COLOR = "#CCCCCC"  # graphviz の gray80
+
+
+def node_label(node: FloorNode) -> str:
+    """ノードのラベル（改行区切り）"""
+    if node.node_type == "battle":
+        return f"{node.enemy_name}\n⭐ Lv.{node.difficulty}"
+    elif node.node_type == "rest":
+        return "休憩所\n🏘️"
+    else:  # shop
+        return "ショップ\n🛍️"
+
+
+def node_tooltip(node: FloorNode) -> str:
+    """ツールチップ（ホバー時表示）: 階層名"""
+    return f"第{node.floor_level}階層"
+
+
+def node_style(node: FloorNode, current_node_id: int) -> Tuple[str, str]:
+    """ノードの (塗り色, 枠線の太さ)"""
+    if node.node_id == current_node_id:
+        return NODE_COLORS["current"], "3"
+    return NODE_COLORS.get(node.node_type, NODE_COLORS["shop"]), "1"
+
+
+def visible_children(node: FloorNode, visible_nodes: Dict[int, FloorNode]) -> List[int]:
+    """表示中の子ノードID（1択で左右が同じ場合は1つ、左→右の順）"""
+    child_ids = []
+    for child_id in (node.left_child_id, node.right_child_id):
+        if child_id is not None and child_id in visible_nodes and child_id not in child_ids:
+            child_ids.append(child_id)
+    return child_ids
+
+# ===== 組み込みSVGレンダラー =====
+
+# レイアウトの寸法（px）
+SVG_FONT_SIZE = 12       # graphviz の fontsize=9pt 相当
+SVG_LINE_HEIGHT = 15
+SVG_NODE_PADDING_X = 10
+SVG_NODE_MIN_WIDTH = 72
+SVG_NODE_HEIGHT = 42
+SVG_H_GAP = 18           # 横に並んだノードの間隔
+SVG_V_GAP = 36           # 階層の間隔
+SVG_MARGIN = 8
+
+
+def _text_width(text: str) -> float:
+    """文字列の表示幅の概算（全角・絵文字は1文字分、半角は0.6文字分）"""
+    return sum(SVG_FONT_SIZE * (0.6 if ch.isascii() else 1.0) for ch in text)
+
+
+def layout_tree(visible_nodes: Dict[int, FloorNode], current_node_id: int) -> Dict[int, Tuple[float, float]]:
+    """
+    表示するノードの配置を計算（上から下へ階層順、親は子の中央に置く）
+
+    現在地から左→右の順にたどり、子のないノードを左から1枠ずつ並べて
+    親は子のx座標の平均に置く。合流するノードは最初にたどった位置に置く
+
+    Returns:
+        {ノードID: (列, 段)}  列は枠単位、段は現在地からの階層差
+    """
+    root_floor = visible_nodes[current_node_id].floor_level
+    positions: Dict[int, Tuple[float, float]] = {}
+    next_slot = 0
+
+    def place(node_id: int) -> float:
+        nonlocal next_slot
+        if node_id in positions:
+            return positions[node_id][0]
+        node = visible_nodes[node_id]
+        child_ids = visible_children(node, visible_nodes)
+        # 先に登録しておく（合流するノードを二重に並べない）
+        positions[node_id] = (0.0, node.floor_level - root_floor)
+        if child_ids:
+            xs = [place(child_id) for child_id in child_ids]
+            x = sum(xs) / len(xs)
+        else:
+            x = float(next_slot)
+            next_slot += 1
+        positions[node_id] = (x, node.floor_level - root_floor)
+        return x
+
+    place(current_node_id)
+    return positions
+
+
+def _render_svg(visible_nodes: Dict[int, FloorNode], current_node_id: int) -> str:
+    """graphviz を使わずにSVGを組み立てる"""
+    positions = layout_tree(visible_nodes, current_node_id)
+
+    labels = {node_id: node_label(node).split("\n") for node_id, node in visible_nodes.items()}
+    box_width = max(
+        [SVG_NODE_MIN_WIDTH]
+        + [_text_width(line) + SVG_NODE_PADDING_X * 2 for lines in labels.values() for line in lines]
+    )
+    slot_width = box_width + SVG_H_GAP
+    row_height = SVG_NODE_HEIGHT + SVG_V_GAP
+
+    min_x = min(x for x, _ in positions.values())
+    columns = max(x for x, _ in positions.values()) - min_x + 1
+    rows = max(y for _, y in positions.values()) + 1
+    width = columns * slot_width - SVG_H_GAP + SVG_MARGIN * 2
+    height = rows * row_height - SVG_V_GAP + SVG_MARGIN * 2
+
+    def center(node_id: int) -> Tuple[float, float]:
+        x, y = positions[node_id]
+        return (SVG_MARGIN + (x - min_x) * slot_width + box_width / 2,
+                SVG_MARGIN + y * row_height + SVG_NODE_HEIGHT / 2)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" '
+        f'viewBox="0 0 {width:.1f} {height:.1f}">',
+        '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="6" markerHeight="6" '
+        f'orient="auto-start-reverse"><path d="M0,0 L10,5 L0,10 z" fill="{EDGE_COLOR}"/></marker></defs>',
+        '<g id="graph0" class="graph">',
+        '<title>floor_tree</title>',
+    ]
+
+    # エッジ（ノードの下に描く）
+    for node_id in sorted(visible_nodes):
+        x1, y1 = center(node_id)
+        for child_id in visible_children(visible_nodes[node_id], visible_nodes):
+            x2, y2 = center(child_id)
+            parts.append(
+                f'<g class="edge"><title>{node_id}&#45;&gt;{child_id}</title>'
+                f'<path fill="none" stroke="{EDGE_COLOR}" stroke-width="1.5" marker-end="url(#arrow)" '
+                f'd="M{x1:.1f},{y1 + SVG_NODE_HEIGHT / 2:.1f} L{x2:.1f},{y2 - SVG_NODE_HEIGHT / 2:.1f}"/></g>'
+            )
+
+    # ノード
+    for node_id, node in sorted(visible_nodes.items()):
+        cx, cy = center(node_id)
+        color, penwidth = node_style(node, current_node_id)
+        lines = labels[node_id]
+        first_baseline = cy - (len(lines) - 1) * SVG_LINE_HEIGHT / 2 + SVG_FONT_SIZE * 0.35
+        texts = "".join(
+            f'<text text-anchor="middle" x="{cx:.1f}" y="{first_baseline + i * SVG_LINE_HEIGHT:.1f}" '
+            f'font-family="MS Gothic, sans-serif" font-size="{SVG_FONT_SIZE}" fill="white">{html.escape(line)}</text>'
+            for i, line in enumerate(lines)
+        )
+        parts.append(
+            f'<g id="node{node_id}" class="node"><title>{html.escape(node_tooltip(node))}</title>'
+            f'<rect x="{cx - box_width / 2:.1f}" y="{cy - SVG_NODE_HEIGHT / 2:.1f}" '
+            f'width="{box_width:.1f}" height="{SVG_NODE_HEIGHT}" rx="6" ry="6" '
+            f'fill="{color}" stroke="black" stroke-width="{penwidth}"/>{texts}</g>'
+        )
+
+    parts.append("</g></svg>")
+    return "\n".join(parts)
+
+# ===== 描画の入口 =====
+
+MAP_BACKENDS = ("svg", "graphviz")
+
+
+def visualize_tree(nodes: FloorTree, current_node_id: int, backend: str = "svg") -> str:
+    """
+    ツリーを可視化してSVGを返す（2階層先までのみ表示）
+    同じ表示内容ならキャッシュしたSVGを返す
+
+    Args:
+        nodes: ノード辞書
+        current_node_id: 現在のノードID
+        backend: "svg"（組み込み、依存なし）| "graphviz"（graphviz パッケージと dot が必要）
+
+    Returns:
+        SVG文字列（graphviz が使えない場合はテキスト表示）
+    """
+    if backend not in MAP_BACKENDS:
+        raise ValueError(f"不明な描画バックエンド: {backend}")
+
+    # 表示するノードをフィルタリング（2階層先まで）
+    visible_nodes = get_visible_nodes(nodes, current_node_id, depth=2)
+    key = subgraph_key(visible_nodes, current_node_id, backend)
+    svg = get_cached_svg(key)
+    if svg is not None:
+        return svg
+
+    if backend == "svg":
+        svg = _render_svg(visible_nodes, current_node_id)
+    else:
+        svg = _render_graphviz(visible_nodes, current_node_id)
+    if svg is None:
+        # 失敗時のテキスト表示はキャッシュしない（graphvizが使えるようになれば次から描画する）
+        return visualize_tree_text(nodes, current_node_id)
+    put_cached_svg(key, svg)
+    return svg
+
+
+def visualize_tree_svg(nodes: FloorTree, current_node_id: int) -> str:
+    """組み込みレンダラーでツリーを可視化してSVGを返す（外部依存なし）"""
+    return visualize_tree(nodes, current_node_id, backend="svg")
+
+
+def visualize_tree_graphviz(nodes: FloorTree, current_node_id: int) -> str:
+    """
+    graphvizでツリーを可視化してSVGを返す（2階層先までのみ表示）
+    同じ表示内容ならキャッシュしたSVGを返すので dot は起動しない
+    
+    Args:
+        nodes: ノード辞書
+        current_node_id: 現在のノードID
+    
+    Returns:
+        SVG文字列
+    """
+    return visualize_tree(nodes, current_node_id, backend="graphviz")
+
+
+def _render_graphviz(visible_nodes: Dict[int, FloorNode], current_node_id: int) -> Optional[str]:
+    """dot でSVGを描画（graphvizが使えなければ None）"""
+    try:
+        import graphviz
+        import os
+    except ImportError:
+        # graphvizがインストールされていない場合
+        return None
+    
+    # Graphvizの実行ファイルパスを明示的に設定
+    if os.name == 'nt':  # Windows
+        possible_paths = [
+            r"C:\Program Files (x86)\Graphviz\bin",
+            r"C:\Program Files\Graphviz\bin",
+        ]
+        for gv_path in possible_paths:
+            if os.path.exists(gv_path):
+                os.environ["PATH"] = gv_path + os.pathsep + os.environ.get("PATH", "")
+                # graphvizモジュールに直接パスを設定
+                try:
+                    import graphviz.backend as gb
+                    gb.DOT_BINARY = os.path.join(gv_path, "dot.exe")
+                except:
+                    pass
+                break
+    
+    # graphvizオブジェクト作成
+    dot = graphviz.Digraph('floor_tree', format='svg')
+    dot.attr(rankdir='TB')
+    dot.attr('node', shape='box', style='rounded,filled', fontname='MS Gothic', fontsize='9')
+    dot.attr('graph', bgcolor='transparent')
+    
+    # ノードを追加
+    for node_id, node in sorted(visible_nodes.items()):
+        color, penwidth = node_style(node, current_node_id)
+        dot.node(str(node_id), node_label(node), fillcolor=color, penwidth=penwidth,
+                 fontcolor='white', tooltip=node_tooltip(node))
+    
+    # エッジを追加（重複を避ける）
+    for node_id, node in visible_nodes.items():
+        for child_id in visible_children(node, visible_nodes):
+            dot.edge(str(node_id), str(child_id), color='gray80', penwidth='1.5')
+    
+    # SVG文字列を返す
+    try:
+        svg_string = dot.pipe(format='svg').decode('utf-8')
+        return svg_string
+    except Exception as e:
+        print(f"graphviz error: {e}")
+        return None
+
+
+def visualize_tree_text(nodes: FloorTree, current_node_id: int) -> str:
+    """
+    テキスト形式のツリー表示（2階層先までのみ）
+    """
+    current_node = nodes[current_node_id]
+    current_floor = current_node.floor_level
+    
+    result = "🌳 フロアツリー（次の次の階層まで表示）\n"
+    result += "=" * 40 + "\n\n"
+    
+    # 現在の階層から2階層先までを表示
+    for floor in range(current_floor, min(current_floor + 2, nodes.depth) + 1):
+        result += f"【第{floor}階層】\n"
+        
+        for node in nodes.nodes_on_floor(floor):
+            marker = "→ " if node.node_id == current_node_id else "   "
+            
+            if node.node_type == "battle":
+                result += f"{marker}🔥 {node.enemy_name} (Lv.{node.difficulty})\n"
+            elif node.node_type == "rest":
+                result += f"{marker}🏘️  休憩所\n"
+            else:
+                result += f"{marker}🛍️  ショップ\n"
+        
+        result += "\n"
+    
+    return result
+
+
+# ===== テスト用 =====
+
+if __name__ == "__main__":
+    # ツリー生成テスト
+    nodes, root_id = generate_floor_tree(seed=42)
+    
+    print(f"Generated {len(nodes)} nodes")
+    print(f"Root: {root_id}\n")
+    
+    # ツリー構造を表示
+    for floor in range(1, nodes.depth + 1):
+        floor_nodes = nodes.nodes_on_floor(floor)
+        print(f"Floor {floor}: {len(floor_nodes)} nodes")
+        for node in floor_nodes:
+            print(f"  {node.node_id}: type={node.node_type}, difficulty={node.difficulty}")
+    
+    # ツリー移動テスト
+    current = nodes[root_id]
+    print(f"\nStarting at: {current.node_id} ({current.node_type})")
+    
+    for _ in range(3):
+        left, right = get_node_children(nodes, current.node_id)
+        if left or right:
+            print(f"Choices:")
+            if left:
+                print(f"  L: {left.node_id} ({left.node_type})")
+            if right:
+                print(f"  R: {right.node_id} ({right.node_type})")
+            
+            # ランダムに選択
+            choice = random.choice([left, right])
+            current = choice
             print(f"Selected: {current.node_id}\n")
\ No newline at end of file
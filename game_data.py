@@ -1,11 +1,23 @@
 """
 ゲームデータの永続化と管理
+
+セーブデータはプレイヤーIDごとのプロフィール。保存先は save_storage のバックエンド
+（既定はJSONファイル、SAVE_BACKEND=sqlite でSQLite）。
+変更は update_game_data で最新の内容に適用する
+（セッションが持つ古いコピーで他セッションの変更を上書きしない）。
+ディスクへの書き込みはバックグラウンドスレッドがまとめて行うので、画面の処理は待たされない
 """
-import json
+import atexit
 import os
-from typing import Dict, List, Any
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from save_storage import DEFAULT_PLAYER_ID, JsonFileStorage, SaveStorage, SqliteStorage, WriteBehindStorage
 
 SAVE_FILE = "save_data.json"
+DEFAULT_FLUSH_INTERVAL = 1.0  # 書き込みをまとめる間隔（秒）
+
+T = TypeVar("T")
 
 # デフォルトのアップグレードデータ
 DEFAULT_UPGRADES = {
@@ -46,32 +58,95 @@ UPGRADE_COSTS = {
     },
 }
 
-def load_game_data() -> Dict[str, Any]:
+# ===== 保存先 =====
+
+_storage: Optional[SaveStorage] = None
+_storage_lock = threading.Lock()
+
+def create_storage_from_env() -> SaveStorage:
+    """
+    環境変数から保存先を作る
+    SAVE_BACKEND=json（既定: save_data.json）| sqlite（SAVE_DB のデータベース、既定: save_data.db）
+    SAVE_FLUSH_INTERVAL=秒（既定: 1。書き込みはバックグラウンドでまとめて行う。0 なら都度書き込む）
+    """
+    backend = os.environ.get("SAVE_BACKEND", "json").lower()
+    if backend == "sqlite":
+        storage = SqliteStorage(DEFAULT_UPGRADES, os.environ.get("SAVE_DB", "save_data.db"))
+    else:
+        if backend != "json":
+            print(f"不明なSAVE_BACKEND: {backend}（jsonを使います）")
+        storage = JsonFileStorage(DEFAULT_UPGRADES, SAVE_FILE)
+
+    interval = float(os.environ.get("SAVE_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL))
+    if interval > 0:
+        storage = WriteBehindStorage(storage, interval)
+    return storage
+
+def get_storage() -> SaveStorage:
+    """現在の保存先（初回呼び出し時に環境変数から作成）"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage_from_env()
+        return _storage
+
+def set_storage(storage: SaveStorage):
+    """保存先を差し替える"""
+    global _storage
+    with _storage_lock:
+        if _storage is not None and _storage is not storage:
+            _storage.close()
+        _storage = storage
+
+def close_storage():
+    """未保存の変更を書き込んで保存先を閉じる（終了時に自動で呼ばれる）"""
+    global _storage
+    with _storage_lock:
+        if _storage is not None:
+            _storage.close()
+            _storage = None
+
+atexit.register(close_storage)
+
+def load_game_data(player_id: str = DEFAULT_PLAYER_ID) -> Dict[str, Any]:
     """セーブデータを読み込む"""
-    if os.path.exists(SAVE_FILE):
-        try:
-            with open(SAVE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # 新しいキーがあれば追加
-                for key, value in DEFAULT_UPGRADES.items():
-                    if key not in data:
-                        data[key] = value
-                return data
-        except Exception as e:
-            print(f"セーブデータ読み込みエラー: {e}")
-            return DEFAULT_UPGRADES.copy()
-    return DEFAULT_UPGRADES.copy()
-
-def save_game_data(data: Dict[str, Any]) -> bool:
-    """セーブデータを保存"""
     try:
-        with open(SAVE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        return get_storage().load(player_id)
+    except Exception as e:
+        print(f"セーブデータ読み込みエラー: {e}")
+        return DEFAULT_UPGRADES.copy()
+
+def save_game_data(data: Dict[str, Any], player_id: str = DEFAULT_PLAYER_ID) -> bool:
+    """セーブデータを丸ごと保存（他セッションの変更と合わせるなら update_game_data を使う）"""
+    try:
+        get_storage().save(data, player_id)
         return True
     except Exception as e:
         print(f"セーブデータ保存エラー: {e}")
         return False
 
+def update_game_data(mutate: Callable[[Dict[str, Any]], T],
+                     player_id: str = DEFAULT_PLAYER_ID) -> Tuple[Dict[str, Any], T]:
+    """
+    最新のセーブデータに変更を適用して保存する（読み込み〜保存を1トランザクションで行う）
+
+    Args:
+        mutate: セーブデータを受け取って書き換える関数（戻り値はそのまま返す）。
+            書き込み時にもう一度呼ばれることがあるので、引数を束縛済みの純粋な関数にする
+            （例: functools.partial(purchase_upgrade, upgrade_key=key)）
+        player_id: プレイヤーID
+
+    Returns:
+        (保存後のセーブデータ, mutate の戻り値)
+    """
+    try:
+        return get_storage().update(mutate, player_id)
+    except Exception as e:
+        # 保存できなくてもゲームは続けられるよう、読み込んだ内容に適用して返す
+        print(f"セーブデータ保存エラー: {e}")
+        data = load_game_data(player_id)
+        return data, mutate(data)
+
 def add_upgrade_points(data: Dict[str, Any], points: int) -> Dict[str, Any]:
     """アップグレードポイントを追加"""
     data["upgrade_points"] += points
@@ -100,6 +175,17 @@ def purchase_upgrade(data: Dict[str, Any], upgrade_key: str) -> tuple[bool, str,
     
     return True, f"{upgrade_info['name']} Lv.{current_level + 1} を購入しました！", data
 
+def record_game_start(data: Dict[str, Any]) -> Dict[str, Any]:
+    """ゲーム開始を記録"""
+    data["total_games"] = data.get("total_games", 0) + 1
+    return data
+
+def record_game_clear(data: Dict[str, Any], floor_reached: int) -> Dict[str, Any]:
+    """全階層クリアを記録"""
+    data["total_wins"] = data.get("total_wins", 0) + 1
+    data["highest_floor"] = max(data.get("highest_floor", 0), floor_reached)
+    return data
+
 def record_game_result(data: Dict[str, Any], won: bool, floor_reached: int) -> Dict[str, Any]:
     """ゲーム結果を記録"""
     data["total_games"] += 1
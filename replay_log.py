@@ -0,0 +1,175 @@
+"""
+リプレイログ
+ランのシードとプレイヤーの操作を追記専用ファイルに保存し、描画なしで再実行して最終状態を再現する
+
+ファイル形式:
+    1行目: ヘッダー（JSON: 形式バージョン・シード・アップグレードレベル・マップ仕様）
+    2行目以降: 操作トークンを空白区切りで追記（run_engine.ACTION_* を参照）
+
+使い方:
+    python replay_log.py replays/20250101-120000_123456789.rlog
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import battle_engine
+import floor_tree
+import game_data
+import run_engine
+from run_engine import RunState
+
+REPLAY_DIR = "replays"
+REPLAY_FORMAT_VERSION = 1
+
+# ヘッダーに残す永続データ（ランの初期状態に影響するもの）
+UPGRADE_KEYS = tuple(game_data.UPGRADE_COSTS)
+
+# ===== 記録 =====
+
+def start_recording(run: RunState, save_data: Optional[Dict[str, Any]] = None,
+                    directory: str = REPLAY_DIR) -> str:
+    """
+    ランの操作ログの保存を開始（以降の操作は1つずつファイルに追記される）
+
+    Args:
+        run: new_run で作った直後のラン
+        save_data: ラン開始時の永続データ
+        directory: 保存先ディレクトリ
+
+    Returns:
+        ログファイルのパス
+    """
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"{stamp}_{run.seed}.rlog")
+
+    save_data = save_data or {}
+    header = {
+        "version": REPLAY_FORMAT_VERSION,
+        "seed": run.seed,
+        "upgrades": {key: game_data.get_upgrade_level(save_data, key) for key in UPGRADE_KEYS},
+        "map_spec": run.map_spec.to_dict(),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        # 開始前の操作があればそれも残す
+        if run.actions:
+            f.write(" ".join(run.actions) + " ")
+
+    def append(token: str):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(token + " ")
+
+    run.recorder = append
+    return path
+
+
+def load_log(path: str) -> Tuple[Dict[str, Any], List[str]]:
+    """ログファイルを読み込んで (ヘッダー, 操作トークン列) を返す"""
+    with open(path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        actions = f.read().split()
+    if header.get("version") != REPLAY_FORMAT_VERSION:
+        raise ValueError(f"未対応のリプレイ形式です: {header.get('version')}")
+    return header, actions
+
+# ===== 再生 =====
+
+def apply_action(run: RunState, token: str):
+    """操作トークンを1つ実行"""
+    kind, arg = token[0], token[1:]
+    if kind == run_engine.ACTION_PLAY_CARD:
+        run_engine.play_card(run, int(arg))
+    elif kind == run_engine.ACTION_END_TURN:
+        run_engine.end_turn(run)
+    elif kind == run_engine.ACTION_CHOOSE_NODE:
+        run_engine.choose_node(run, int(arg))
+    elif kind == run_engine.ACTION_REST:
+        rest = run_engine.REST_CHOICES[int(arg)]
+        if rest == "sleep":
+            run_engine.rest_sleep(run)
+        elif rest == "meditate":
+            run_engine.rest_meditate(run)
+        else:
+            run_engine.rest_alchemy(run)
+    elif kind == run_engine.ACTION_SHOP_BUY:
+        run_engine.shop_buy_card(run, int(arg))
+    elif kind == run_engine.ACTION_SHOP_POTION:
+        run_engine.shop_buy_potion(run)
+    elif kind == run_engine.ACTION_SHOP_REMOVE:
+        run_engine.shop_remove_card(run, int(arg))
+    elif kind == run_engine.ACTION_SHOP_POINTS:
+        run_engine.shop_buy_points(run)
+    elif kind == run_engine.ACTION_SHOP_LEAVE:
+        run_engine.shop_leave(run)
+    elif kind == run_engine.ACTION_REWARD_CARD:
+        run_engine.reward_take_card(run, int(arg))
+    elif kind == run_engine.ACTION_REWARD_DELETE:
+        run_engine.reward_delete_cards(run, [int(i) for i in arg.split(",") if i])
+    elif kind == run_engine.ACTION_REWARD_POINTS:
+        run_engine.reward_points(run)
+    else:
+        raise ValueError(f"不明な操作トークン: {token}")
+
+
+def replay(header: Dict[str, Any], actions: List[str], stop: Optional[int] = None) -> RunState:
+    """
+    ヘッダーと操作列からランを再実行
+
+    Args:
+        header: load_log のヘッダー
+        actions: 操作トークン列
+        stop: 先頭から何手目まで実行するか（None で全部）
+    """
+    # マップ仕様のない古いログは従来の10階層
+    map_spec = floor_tree.MapSpec.from_dict(header["map_spec"]) if "map_spec" in header else None
+    run = run_engine.new_run(header["upgrades"], seed=header["seed"], map_spec=map_spec)
+    for token in actions[:stop]:
+        apply_action(run, token)
+    return run
+
+
+def replay_file(path: str, stop: Optional[int] = None) -> RunState:
+    """ログファイルからランを再実行"""
+    header, actions = load_log(path)
+    return replay(header, actions, stop)
+
+# ===== コマンドライン =====
+
+def describe(run: RunState) -> str:
+    """ランの状態の要約"""
+    battle = run.battle
+    lines = [
+        f"シード: {run.seed}  操作数: {len(run.actions)}",
+        f"フェーズ: {run.phase}  第{run.current_node.floor_level}階層 ({run.current_node_id})",
+        f"HP: {battle.player_hp}/{battle.player_max_hp}  ゴールド: {run.gold}  デッキ: {len(run.all_cards)}枚",
+    ]
+    if run.phase == run_engine.PHASE_BATTLE and battle.enemy:
+        enemy = battle.enemy
+        lines.append(f"敵: {enemy['name']} HP {enemy['hp']}/{enemy['max_hp']}  手札: {[c['name'] for c in battle.hand]}")
+    lines.append("直近のログ:")
+    lines.extend(f"  {line}" for line in battle_engine.format_log(battle.battle_log.latest(8)))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="リプレイログを描画なしで再実行して最終状態を表示")
+    parser.add_argument("path", help="リプレイログ（.rlog）")
+    parser.add_argument("--stop", type=int, default=None, help="先頭から何手目まで実行するか")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    run = replay_file(args.path, args.stop)
+    elapsed = time.perf_counter() - started
+
+    print(describe(run))
+    print(f"\n再生時間: {elapsed * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+ラン進行エンジン（Streamlit非依存）
+マップ移動・休憩所・ショップ・報酬など1ラン分のルールを管理する
+UIもシミュレーターも RunState を作ってここの関数を呼び出す
+"""
+
+import random
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import battle_engine
+import floor_tree
+import game_data
+from battle_engine import BattleState, Card, CARD_ATTACK
+
+# ===== ランの進行状態 =====
+
+PHASE_BATTLE = "battle"
+PHASE_VICTORY = "victory"          # 戦闘勝利 → 報酬選択
+PHASE_TREE_SELECTION = "tree_selection"
+PHASE_REST = "rest"
+PHASE_SHOP = "shop"
+PHASE_CLEAR = "clear"
+PHASE_DEFEAT = "defeat"
+
+FINAL_FLOOR = floor_tree.DEFAULT_MAP_SPEC.depth  # 既定のマップの最終階層（ランごとの値は RunState.map_spec.depth）
+
+# ===== バランス定数 =====
+
+STARTING_HP = 100
+STARTING_ENERGY = 5
+STARTING_GOLD = 100
+
+REST_MEDITATE_BUFF = 0.2      # 瞑想: 次の1戦 攻撃力+20%
+REST_ALCHEMY_RATE = 1.1       # 錬金術: 攻撃カードのダメージ+10%
+
+SHOP_CARD_COUNT = 5
+SHOP_POTION_PRICE = 30
+SHOP_POTION_HEAL = 30
+SHOP_REMOVE_PRICE = 40
+SHOP_POINTS_PRICE = 60
+SHOP_POINTS_AMOUNT = 3
+
+REWARD_CARD_COUNT = 3
+REWARD_DELETE_MAX = 2
+REWARD_POINTS_AMOUNT = 5
+MIN_DECK_SIZE = 10
+
+# ===== 乱数ストリーム =====
+
+# マップはランのシードをそのまま generate_floor_tree に渡す。
+# それ以外はシードから派生させた独立ストリームを使い、グローバルな random は使わない
+RNG_STREAMS = ("deck", "enemy", "loot")
+
+
+def split_rng(seed: int) -> Dict[str, random.Random]:
+    """ランのシードからサブシステムごとの乱数ストリームを作る"""
+    return {name: random.Random(f"{seed}:{name}") for name in RNG_STREAMS}
+
+
+# ===== 操作ログ =====
+
+# プレイヤーの操作は1つずつ短いトークンで RunState.actions に追記する
+# （シードと操作ログがあればランを再現できる。replay_log を参照）
+ACTION_PLAY_CARD = "c"        # c<手札の位置>
+ACTION_END_TURN = "e"
+ACTION_CHOOSE_NODE = "m"      # m<選択肢の位置>
+ACTION_REST = "r"             # r<REST_CHOICES の位置>
+ACTION_SHOP_BUY = "s"         # s<品揃えの位置>
+ACTION_SHOP_POTION = "h"
+ACTION_SHOP_REMOVE = "x"      # x<所持カードの位置>
+ACTION_SHOP_POINTS = "u"
+ACTION_SHOP_LEAVE = "l"
+ACTION_REWARD_CARD = "w"      # w<報酬候補の位置>
+ACTION_REWARD_DELETE = "d"    # d<所持カードの位置>,<所持カードの位置>
+ACTION_REWARD_POINTS = "g"
+
+REST_CHOICES = ("sleep", "meditate", "alchemy")
+
+
+def new_seed() -> int:
+    """シード未指定のラン用にシードを決める（リプレイできるよう必ず記録する）"""
+    return random.SystemRandom().randrange(2 ** 32)
+
+
+@dataclass
+class RunState:
+    """1ラン分の進行状態"""
+    battle: BattleState
+    nodes: floor_tree.FloorTree
+    current_node_id: int
+    all_cards: List[Card]
+    gold: int = STARTING_GOLD
+    prev_gold: int = STARTING_GOLD
+    rest_attack_buff: float = 0   # 休憩所バフ（次の1戦限り）
+    battle_count: int = 0         # 第何戦か
+    current_floor: int = 1
+    phase: str = PHASE_BATTLE
+    shop_cards: List[Card] = field(default_factory=list)
+    shop_prices: List[int] = field(default_factory=list)           # shop_cards と同じ順の価格
+    reward_cards: List[Card] = field(default_factory=list)
+    seed: int = 0
+    loot_rng: random.Random = field(default_factory=random.Random)   # ゴールド・ショップ・報酬
+    map_spec: floor_tree.MapSpec = floor_tree.DEFAULT_MAP_SPEC       # マップの深さ・分岐
+    actions: List[str] = field(default_factory=list)                 # 操作ログ
+    recorder: Optional[Callable[[str], None]] = None                 # 操作ごとに呼ばれる（ログの保存用）
+
+    @property
+    def current_node(self) -> floor_tree.FloorNode:
+        """現在のノード"""
+        return self.nodes[self.current_node_id]
+
+
+def record_action(run: RunState, token: str):
+    """操作を記録（実行前に記録するので、例外で落ちた操作もログに残る）"""
+    run.actions.append(token)
+    if run.recorder is not None:
+        run.recorder(token)
+
+
+def new_run(save_data: Optional[Dict[str, Any]] = None, seed: Optional[int] = None,
+            extra_cards: Optional[List[str]] = None,
+            map_spec: Optional[floor_tree.MapSpec] = None) -> RunState:
+    """
+    新しいランを開始（第1階層の戦闘まで進める）
+
+    Args:
+        save_data: 永続データ（アップグレード効果を適用する）
+        seed: ランのシード（マップ・山札・敵AI・報酬の乱数がすべてこれで決まる。None なら新規に決める）
+        extra_cards: 初期デッキに追加するカード名（バランス検証用）
+        map_spec: マップ仕様（None なら従来の10階層）
+    """
+    save_data = save_data or {}
+    hp_bonus = game_data.get_total_effect(save_data, "max_hp_bonus")
+    energy_bonus = game_data.get_total_effect(save_data, "starting_energy_bonus")
+    draw_bonus = game_data.get_total_effect(save_data, "card_draw_bonus")
+
+    if seed is None:
+        seed = new_seed()
+    rngs = split_rng(seed)
+
+    # フロアツリーを生成
+    map_spec = map_spec or floor_tree.DEFAULT_MAP_SPEC
+    nodes, root_id = floor_tree.generate_floor_tree(seed=seed, spec=map_spec)
+
+    # プレイヤー初期化
+    starter_deck = battle_engine.create_starter_deck()
+    if extra_cards:
+        starter_deck.extend(battle_engine.create_card(name) for name in extra_cards)
+    rngs["deck"].shuffle(starter_deck)
+
+    battle = BattleState(
+        player_hp=STARTING_HP + hp_bonus,
+        player_max_hp=STARTING_HP + hp_bonus,
+        max_energy=STARTING_ENERGY + energy_bonus,
+        energy=STARTING_ENERGY + energy_bonus,
+        draw_bonus=draw_bonus,
+        deck_rng=rngs["deck"],
+        enemy_rng=rngs["enemy"],
+    )
+    run = RunState(battle=battle, nodes=nodes, current_node_id=root_id, all_cards=starter_deck,
+                   seed=seed, loot_rng=rngs["loot"], map_spec=map_spec)
+
+    # 第1階層の戦闘を開始
+    enter_node(run, root_id)
+    return run
+
+# ===== マップ移動 =====
+
+def get_choices(run: RunState) -> List[floor_tree.FloorNode]:
+    """次に進める子ノード一覧（1択なら1つ）"""
+    left, right = floor_tree.get_node_children(run.nodes, run.current_node_id)
+    choices = []
+    for child in (left, right):
+        if child is not None and child not in choices:
+            choices.append(child)
+    return choices
+
+def choose_node(run: RunState, index: int):
+    """マップ選択画面で index 番目の選択肢に進む"""
+    record_action(run, f"{ACTION_CHOOSE_NODE}{index}")
+    enter_node(run, get_choices(run)[index].node_id)
+
+def enter_node(run: RunState, node_id: int):
+    """ノードに進入する（プレイヤーの選択は choose_node から）"""
+    node = run.nodes[node_id]
+    run.current_node_id = node_id
+
+    if node.node_type == "battle":
+        # ターン進行 & 現在階層を正しく設定
+        run.battle_count += 1
+        run.current_floor = node.floor_level
+
+        # 休憩所バフ（次の1戦限り）は使い切り
+        rest_buff = run.rest_attack_buff
+        run.rest_attack_buff = 0
+
+        battle_engine.setup_battle(
+            run.battle,
+            battle_engine.create_enemy_data(node.enemy_name, node.difficulty),
+            run.all_cards,
+            battle_number=run.battle_count,
+            rest_buff=rest_buff,
+        )
+        run.phase = PHASE_BATTLE
+    elif node.node_type == "rest":
+        run.phase = PHASE_REST
+    else:
+        roll_shop_cards(run)
+        run.phase = PHASE_SHOP
+
+def proceed_to_next_floor(run: RunState):
+    """次の階層を選択する画面へ進む"""
+    run.reward_cards = []
+    run.shop_cards = []
+    run.shop_prices = []
+
+    # 子ノードが1つもない場合（ゲーム終了）
+    if not get_choices(run):
+        if run.current_node.floor_level == run.map_spec.depth:
+            run.phase = PHASE_CLEAR
+        else:
+            run.phase = PHASE_VICTORY
+        return
+
+    # それ以外の場合は常にマップ選択画面を表示
+    run.phase = PHASE_TREE_SELECTION
+
+# ===== 戦闘 =====
+
+def check_battle_end(run: RunState):
+    """勝敗判定（勝利ならゴールド報酬を付与）"""
+    if run.phase != PHASE_BATTLE:
+        return
+    if run.battle.enemy_defeated:
+        run.phase = PHASE_VICTORY
+        # P2-9: ゴールド報酬を難易度ベースに調整（floor_levelと敵難易度を参照）
+        node = run.current_node
+        gold_earned = 15 + node.floor_level * 8 + node.difficulty * 3 + run.loot_rng.randint(0, 10)
+        run.prev_gold = run.gold
+        run.gold += gold_earned
+    elif run.battle.player_defeated:
+        run.phase = PHASE_DEFEAT
+
+def play_card(run: RunState, card_index: int):
+    """手札のカードを使用"""
+    record_action(run, f"{ACTION_PLAY_CARD}{card_index}")
+    battle_engine.play_card(run.battle, card_index)
+    check_battle_end(run)
+
+def end_turn(run: RunState) -> List[battle_engine.LogEvent]:
+    """ターン終了（敵のターン→次のターン開始）。敵のターンのログを返す"""
+    record_action(run, ACTION_END_TURN)
+    enemy_log = battle_engine.end_turn(run.battle)
+    check_battle_end(run)
+    return enemy_log
+
+# ===== 休憩所 =====
+
+def rest_sleep(run: RunState):
+    """就寝: HP全回復"""
+    record_action(run, f"{ACTION_REST}{REST_CHOICES.index('sleep')}")
+    run.battle.player_hp = run.battle.player_max_hp
+    proceed_to_next_floor(run)
+
+def rest_meditate(run: RunState):
+    """瞑想: 次の1戦 攻撃力アップ"""
+    record_action(run, f"{ACTION_REST}{REST_CHOICES.index('meditate')}")
+    run.rest_attack_buff = max(run.rest_attack_buff, REST_MEDITATE_BUFF)
+    proceed_to_next_floor(run)
+
+def alchemy_targets(run: RunState) -> List[Card]:
+    """錬金術の対象（ダメージを持つ攻撃カード）"""
+    return [c for c in run.all_cards if c.get('type') == CARD_ATTACK and 'damage' in c]
+
+def rest_alchemy(run: RunState):
+    """錬金術: 全攻撃カードのダメージを永続強化"""
+    record_action(run, f"{ACTION_REST}{REST_CHOICES.index('alchemy')}")
+    for card in alchemy_targets(run):
+        card.upgrade('damage', int(card['damage'] * REST_ALCHEMY_RATE))
+    proceed_to_next_floor(run)
+
+# ===== ショップ =====
+
+def roll_shop_cards(run: RunState):
+    """ショップの品揃えを決める（価格は階層に応じて調整。カードではなく shop_prices に持つ）"""
+    names = run.loot_rng.sample(battle_engine.CARD_NAMES, min(SHOP_CARD_COUNT, len(battle_engine.CARD_NAMES)))
+    run.shop_cards = [battle_engine.create_card(name) for name in names]
+    floor_bonus = run.current_node.floor_level * 5
+    run.shop_prices = [40 + floor_bonus + run.loot_rng.randint(0, 20) for _ in names]
+
+def shop_buy_card(run: RunState, index: int) -> bool:
+    """ショップのカードを購入"""
+    record_action(run, f"{ACTION_SHOP_BUY}{index}")
+    if index >= len(run.shop_cards):
+        return False
+    price = run.shop_prices[index]
+    if run.gold < price:
+        return False
+    run.gold -= price
+    run.all_cards.append(run.shop_cards.pop(index))
+    run.shop_prices.pop(index)
+    return True
+
+def shop_buy_potion(run: RunState) -> bool:
+    """HP回復薬を購入"""
+    record_action(run, ACTION_SHOP_POTION)
+    if run.gold < SHOP_POTION_PRICE:
+        return False
+    run.gold -= SHOP_POTION_PRICE
+    run.battle.player_hp = min(run.battle.player_max_hp, run.battle.player_hp + SHOP_POTION_HEAL)
+    return True
+
+def shop_remove_card(run: RunState, index: int) -> bool:
+    """カード削除サービスを購入して所持カードの index 番目を削除"""
+    record_action(run, f"{ACTION_SHOP_REMOVE}{index}")
+    if run.gold < SHOP_REMOVE_PRICE or index >= len(run.all_cards):
+        return False
+    run.gold -= SHOP_REMOVE_PRICE
+    run.all_cards.pop(index)
+    return True
+
+def shop_buy_points(run: RunState) -> int:
+    """アップグレードポイントを購入（獲得ポイント数を返す。永続化は呼び出し側）"""
+    record_action(run, ACTION_SHOP_POINTS)
+    if run.gold < SHOP_POINTS_PRICE:
+        return 0
+    run.gold -= SHOP_POINTS_PRICE
+    return SHOP_POINTS_AMOUNT
+
+def shop_leave(run: RunState):
+    """ショップを出る"""
+    record_action(run, ACTION_SHOP_LEAVE)
+    proceed_to_next_floor(run)
+
+# ===== 戦闘報酬 =====
+
+def roll_reward_cards(run: RunState) -> List[Card]:
+    """報酬カード候補（一度決めたら同じ報酬画面の間は固定）"""
+    if not run.reward_cards:
+        names = run.loot_rng.sample(battle_engine.CARD_NAMES, min(REWARD_CARD_COUNT, len(battle_engine.CARD_NAMES)))
+        run.reward_cards = [battle_engine.create_card(name) for name in names]
+    return run.reward_cards
+
+def reward_take_card(run: RunState, index: int):
+    """報酬カードを1枚獲得して次へ"""
+    record_action(run, f"{ACTION_REWARD_CARD}{index}")
+    run.all_cards.append(roll_reward_cards(run)[index])
+    proceed_to_next_floor(run)
+
+def can_delete_cards(run: RunState) -> bool:
+    """報酬でカード削除できるか（デッキは最低10枚）"""
+    return len(run.all_cards) > MIN_DECK_SIZE
+
+def reward_delete_cards(run: RunState, indices: List[int]):
+    """報酬で所持カードの指定位置から最大2枚を削除して次へ"""
+    indices = sorted(set(indices))[:REWARD_DELETE_MAX]
+    record_action(run, ACTION_REWARD_DELETE + ",".join(map(str, indices)))
+    # 後ろから削除して位置がずれないようにする
+    for index in reversed(indices):
+        if index < len(run.all_cards):
+            run.all_cards.pop(index)
+    proceed_to_next_floor(run)
+
+def reward_points(run: RunState) -> int:
+    """報酬でアップグレードポイントを選んで次へ（永続化は呼び出し側）"""
+    record_action(run, ACTION_REWARD_POINTS)
+    proceed_to_next_floor(run)
+    return REWARD_POINTS_AMOUNT
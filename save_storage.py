@@ -0,0 +1,353 @@
+"""
+セーブデータの保存先（ストレージバックエンド）
+
+プロフィールはプレイヤーIDごとに1つの辞書。どのバックエンドも
+- load: 読み込み（なければ初期値）
+- save: 丸ごと保存
+- update: 最新の内容に変更関数を適用して保存（1トランザクション）
+を提供する。game_data はここで選んだバックエンドを通して読み書きする
+"""
+
+import copy
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Set, Tuple, TypeVar
+
+try:
+    import fcntl  # POSIX のみ
+except ImportError:  # pragma: no cover - Windows ではプロセス内ロックのみ
+    fcntl = None
+
+DEFAULT_PLAYER_ID = "default"
+
+T = TypeVar("T")
+Profile = Dict[str, Any]
+
+
+class SaveStorage:
+    """ストレージバックエンドの基底クラス"""
+
+    def __init__(self, defaults: Profile):
+        """
+        Args:
+            defaults: プロフィールの初期値（読み込み時に足りないキーを補う）
+        """
+        self.defaults = dict(defaults)
+
+    def _fill_defaults(self, data: Profile) -> Profile:
+        """新しいキーがあれば追加"""
+        for key, value in self.defaults.items():
+            if key not in data:
+                data[key] = value
+        return data
+
+    def load(self, player_id: str = DEFAULT_PLAYER_ID) -> Profile:
+        raise NotImplementedError
+
+    def save(self, data: Profile, player_id: str = DEFAULT_PLAYER_ID):
+        raise NotImplementedError
+
+    def update(self, mutate: Callable[[Profile], T], player_id: str = DEFAULT_PLAYER_ID) -> Tuple[Profile, T]:
+        raise NotImplementedError
+
+    def close(self):
+        """接続などを閉じる"""
+
+# ===== JSONファイル =====
+
+class JsonFileStorage(SaveStorage):
+    """
+    プレイヤーごとのJSONファイル（既定のプレイヤーは従来どおり save_data.json）
+
+    書き込みは一時ファイル → fsync → rename で原子的に置き換え、
+    変更はロック内で最新のファイルを読み直してから適用する
+    """
+
+    def __init__(self, defaults: Profile, path: str = "save_data.json"):
+        super().__init__(defaults)
+        self.path = path
+        # 同一プロセス内のスレッド（Streamlitセッション）同士の排他
+        self._process_lock = threading.RLock()
+
+    def path_for(self, player_id: str) -> str:
+        """プレイヤーのセーブファイル"""
+        if player_id == DEFAULT_PLAYER_ID:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        safe_id = re.sub(r"[^0-9A-Za-z_-]", "_", player_id)
+        return f"{root}.{safe_id}{ext}"
+
+    @contextmanager
+    def _locked(self, path: str) -> Iterator[None]:
+        """セーブファイルの排他ロック（別プロセスとは隣のロックファイルで flock）"""
+        with self._process_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self, path: str) -> Profile:
+        """セーブファイルを読む（ない・壊れている場合は初期値）"""
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return self._fill_defaults(json.load(f))
+            except Exception as e:
+                print(f"セーブデータ読み込みエラー: {e}")
+        return dict(self.defaults)
+
+    def _atomic_write(self, path: str, data: Profile):
+        """一時ファイルに書いて fsync してから rename で置き換える（途中で落ちても壊れない）"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".save_", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        # rename 自体を永続化するためディレクトリも fsync
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def load(self, player_id: str = DEFAULT_PLAYER_ID) -> Profile:
+        # 置き換えは rename なので、ロックなしでも書きかけのファイルを読むことはない
+        return self._read(self.path_for(player_id))
+
+    def save(self, data: Profile, player_id: str = DEFAULT_PLAYER_ID):
+        path = self.path_for(player_id)
+        with self._locked(path):
+            self._atomic_write(path, data)
+
+    def update(self, mutate: Callable[[Profile], T], player_id: str = DEFAULT_PLAYER_ID) -> Tuple[Profile, T]:
+        path = self.path_for(player_id)
+        with self._locked(path):
+            data = self._read(path)
+            result = mutate(data)
+            self._atomic_write(path, data)
+        return data, result
+
+# ===== SQLite =====
+
+class SqliteStorage(SaveStorage):
+    """
+    SQLite のプロフィール表（プレイヤーIDが主キー、内容はJSON）
+
+    WALモードで読み取りは書き込みを待たない。接続はスレッドごとに持ち、
+    SQL は固定文字列＋プレースホルダなので sqlite3 の文キャッシュで再利用される。
+    update は BEGIN IMMEDIATE で書き込みロックを先に取り、読み込み〜保存を1トランザクションで行う
+    """
+
+    _CREATE = (
+        "CREATE TABLE IF NOT EXISTS profiles ("
+        " player_id TEXT PRIMARY KEY,"
+        " data TEXT NOT NULL,"
+        " updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+    )
+    _SELECT = "SELECT data FROM profiles WHERE player_id = ?"
+    _UPSERT = (
+        "INSERT INTO profiles (player_id, data, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)"
+        " ON CONFLICT(player_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at"
+    )
+
+    def __init__(self, defaults: Profile, path: str = "save_data.db", timeout: float = 10.0):
+        super().__init__(defaults)
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute(self._CREATE)
+
+    def _connection(self) -> sqlite3.Connection:
+        """このスレッドの接続（初回に作成してWALモードに設定）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: トランザクションは BEGIN/COMMIT で明示的に管理する
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """書き込みトランザクション（例外ならロールバック）"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _decode(self, row) -> Profile:
+        if row is None:
+            return dict(self.defaults)
+        return self._fill_defaults(json.loads(row[0]))
+
+    def load(self, player_id: str = DEFAULT_PLAYER_ID) -> Profile:
+        return self._decode(self._connection().execute(self._SELECT, (player_id,)).fetchone())
+
+    def save(self, data: Profile, player_id: str = DEFAULT_PLAYER_ID):
+        with self._transaction() as conn:
+            conn.execute(self._UPSERT, (player_id, json.dumps(data, ensure_ascii=False)))
+
+    def update(self, mutate: Callable[[Profile], T], player_id: str = DEFAULT_PLAYER_ID) -> Tuple[Profile, T]:
+        with self._transaction() as conn:
+            data = self._decode(conn.execute(self._SELECT, (player_id,)).fetchone())
+            result = mutate(data)
+            conn.execute(self._UPSERT, (player_id, json.dumps(data, ensure_ascii=False)))
+        return data, result
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+# ===== 書き込みの遅延（write-behind） =====
+
+class WriteBehindStorage(SaveStorage):
+    """
+    別のバックエンドへの書き込みをバックグラウンドスレッドでまとめて行うラッパー
+
+    load / update / save はメモリ上のプロフィールを使って即座に返し（バックエンドを読むのは
+    プレイヤーの初回だけ）、変更関数をプレイヤーごとに溜めておく。フラッシュ時はプレイヤーごとに
+    溜まった変更関数をバックエンドの update で最新の内容へまとめて適用する
+    （1プレイヤー1トランザクション。別プロセスの変更とも合わさる）。
+    フラッシュは interval 秒ごとと close() 時。書き込みに失敗した変更は次回に再試行する。
+    フラッシュでは変更のないプレイヤーのプロフィールもバックエンドから読み直す。
+    プロセスが強制終了した場合に失われるのは最後のフラッシュ以降の変更だけで、
+    保存済みのデータはバックエンドの原子的な書き込みで守られる。
+
+    変更関数はメモリ上とフラッシュ時の2回呼ばれるため、プロフィール以外に副作用を持たないこと。
+    update の戻り値はこのプロセスの変更をすべて反映した、直近のフラッシュ時点の内容から計算される。
+    その後に別プロセスが同じプレイヤーを書き換えた場合、フラッシュ時の結果は戻り値と異なることがある
+    （保存されるのはフラッシュ時の結果で、その後の load はそちらを返す）
+    """
+
+    def __init__(self, backend: SaveStorage, interval: float = 1.0):
+        super().__init__(backend.defaults)
+        self.backend = backend
+        self.interval = interval
+        self._lock = threading.RLock()
+        self._views: Dict[str, Profile] = {}                         # 未保存の変更を含むプロフィール
+        self._pending: Dict[str, List[Callable]] = {}                # プレイヤーごとの未保存の変更関数
+        self._flushing: Set[str] = set()                             # 書き込み中のプレイヤー
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="save-write-behind", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def _has_unsaved(self, player_id: str) -> bool:
+        """メモリ上にまだバックエンドへ書き終えていない変更があるか（ロック内で呼ぶ）"""
+        return player_id in self._pending or player_id in self._flushing
+
+    def load(self, player_id: str = DEFAULT_PLAYER_ID) -> Profile:
+        # メモリ上のプロフィールがあればそれを返す（バックエンドとの突き合わせはフラッシュ時に行う）
+        with self._lock:
+            if player_id in self._views:
+                return copy.deepcopy(self._views[player_id])
+        # バックエンドから読むのはそのプレイヤーの初回だけ
+        data = self.backend.load(player_id)
+        with self._lock:
+            # 読んでいる間に別のスレッドが読み込み・変更していればそちらを使う
+            data = self._views.setdefault(player_id, data)
+            return copy.deepcopy(data)
+
+    def save(self, data: Profile, player_id: str = DEFAULT_PLAYER_ID):
+        snapshot = copy.deepcopy(data)
+
+        def replace(profile: Profile):
+            profile.clear()
+            profile.update(copy.deepcopy(snapshot))
+
+        self.update(replace, player_id)
+
+    def update(self, mutate: Callable[[Profile], T], player_id: str = DEFAULT_PLAYER_ID) -> Tuple[Profile, T]:
+        """
+        mutate はフラッシュ時にもう一度呼ばれるので、引数をすべて束縛済みの純粋な関数にすること
+        （functools.partial など。あとで値が変わる変数を参照するクロージャは別の変更になりうる）。
+        プロフィールを変えなかった変更（購入失敗など）は溜めない
+        """
+        with self._lock:
+            cached = player_id in self._views
+        if not cached:
+            self.load(player_id)
+        with self._lock:
+            view = self._views[player_id]
+            before = copy.deepcopy(view)
+            result = mutate(view)
+            if view != before:
+                self._pending.setdefault(player_id, []).append(mutate)
+            return copy.deepcopy(view), result
+
+    def flush(self):
+        """溜まった変更をバックエンドに書き込む"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._flushing = set(pending)
+            for player_id, ops in pending.items():
+                def apply(profile: Profile, ops=ops):
+                    for op in ops:
+                        op(profile)
+
+                try:
+                    data, _ = self.backend.update(apply, player_id)
+                except Exception as e:
+                    print(f"セーブデータ保存エラー（次回再試行）: {e}")
+                    with self._lock:
+                        self._pending[player_id] = ops + self._pending.get(player_id, [])
+                        self._flushing.discard(player_id)
+                    continue
+                with self._lock:
+                    # フラッシュ中に届いた変更を保存後の内容に重ねる
+                    for op in self._pending.get(player_id, []):
+                        op(data)
+                    self._views[player_id] = data
+                    self._flushing.discard(player_id)
+
+            # 変更のなかったプレイヤーも最新の内容に合わせる（別プロセスの変更を取り込む）
+            with self._lock:
+                idle = [player_id for player_id in self._views if not self._has_unsaved(player_id)]
+            for player_id in idle:
+                try:
+                    data = self.backend.load(player_id)
+                except Exception as e:
+                    print(f"セーブデータ読み込みエラー: {e}")
+                    continue
+                with self._lock:
+                    if not self._has_unsaved(player_id):
+                        self._views[player_id] = data
+
+    def close(self):
+        """バックグラウンドスレッドを止めて残りを書き込む"""
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        self.backend.close()
@@ -0,0 +1,360 @@
+"""
+バランス調整用モンテカルロシミュレーター
+ボットに1ランを最後まで自動プレイさせ、勝率・到達階層・カードごとの貢献度を集計する
+
+使い方:
+    python simulator.py --runs 1000 --bot greedy
+    python simulator.py --runs 1000 --bot random --upgrade max_hp_bonus=2
+"""
+
+import argparse
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import floor_tree
+import game_data
+import run_engine
+from battle_engine import (
+    CARD_DEFEND, CARD_DRAW, LOG_BURN_APPLIED, LOG_BURN_DAMAGE, LOG_POISON, LOG_POISON_DAMAGE,
+)
+from run_engine import RunState
+
+# 1戦あたりのターン上限（無限ループ防止。超えたら敗北扱い）
+MAX_BATTLE_TURNS = 200
+
+# マップ難易度別の勝率を集計する帯の幅
+MAP_DIFFICULTY_BAND = 5
+
+# 継続ダメージ: 付与のログ → 毎ターンのダメージのログ（ダメージは付与したカードの貢献にする）
+DOT_LOG_KINDS = {
+    LOG_POISON: LOG_POISON_DAMAGE,
+    LOG_BURN_APPLIED: LOG_BURN_DAMAGE,
+}
+
+# ===== ボット =====
+
+class Bot:
+    """
+    ボットの基底クラス（ランダムに行動する）
+    サブクラスで各判断メソッドを上書きして戦略を差し替える
+    """
+    name = "random"
+
+    def __init__(self):
+        self.rng = random.Random()
+
+    def start_run(self, seed: int):
+        """ランの開始時に呼ばれる（ボットの乱数もランのシードで固定する）"""
+        self.rng.seed(f"{seed}:bot")
+
+    def choose_card(self, run: RunState) -> Optional[int]:
+        """使う手札のインデックス（Noneでターン終了）"""
+        playable = [i for i, card in enumerate(run.battle.hand) if card.get("cost", 0) <= run.battle.energy]
+        return self.rng.choice(playable) if playable else None
+
+    def choose_path(self, run: RunState, choices: List) -> int:
+        """次に進むノードID"""
+        return self.rng.choice(choices).node_id
+
+    def choose_rest(self, run: RunState) -> str:
+        """休憩所の行動: "sleep" | "meditate" | "alchemy\""""
+        return self.rng.choice(["sleep", "meditate", "alchemy"])
+
+    def shop(self, run: RunState):
+        """ショップでの買い物（run_engine.shop_* を直接呼ぶ）"""
+        if run.shop_cards and self.rng.random() < 0.5:
+            run_engine.shop_buy_card(run, self.rng.randrange(len(run.shop_cards)))
+
+    def choose_reward(self, run: RunState) -> Optional[int]:
+        """報酬カードのインデックス（Noneでカードを取らずポイントを選ぶ）"""
+        return self.rng.randrange(len(run_engine.roll_reward_cards(run)))
+
+
+def card_score(card: dict) -> float:
+    """カードのコスト効率の目安"""
+    value = card.get("damage", 0) + card.get("shield", 0) * 0.8 + card.get("draw_count", 0) * 6
+    value += card.get("buff_value", 0) * 40 + card.get("debuff_value", 0) * 20
+    return value / max(1, card.get("cost", 0))
+
+
+class GreedyBot(Bot):
+    """目先の効率を優先する貪欲ボット"""
+    name = "greedy"
+
+    def choose_card(self, run: RunState) -> Optional[int]:
+        battle = run.battle
+        playable = [i for i, card in enumerate(battle.hand) if card.get("cost", 0) <= battle.energy]
+        if not playable:
+            return None
+        # ドローを先に使い、次に敵の次の攻撃に合わせて防御、残りは攻撃
+        for i in playable:
+            if battle.hand[i].get("type") == CARD_DRAW:
+                return i
+        incoming = battle.enemy["attack"] if battle.enemy["next_action"] != "defend" else 0
+        if battle.shield < incoming:
+            for i in playable:
+                if battle.hand[i].get("type") == CARD_DEFEND:
+                    return i
+        return max(playable, key=lambda i: (battle.hand[i].get("damage", 0), card_score(battle.hand[i])))
+
+    def choose_path(self, run: RunState, choices: List) -> int:
+        battle = run.battle
+        hp_ratio = battle.player_hp / battle.player_max_hp
+        if hp_ratio < 0.5:
+            for node in choices:
+                if node.node_type == "rest":
+                    return node.node_id
+        return min(choices, key=lambda n: (n.node_type != "battle", n.difficulty)).node_id
+
+    def choose_rest(self, run: RunState) -> str:
+        battle = run.battle
+        if battle.player_hp < battle.player_max_hp * 0.6:
+            return "sleep"
+        return "alchemy"
+
+    def shop(self, run: RunState):
+        battle = run.battle
+        while battle.player_hp < battle.player_max_hp - run_engine.SHOP_POTION_HEAL:
+            if not run_engine.shop_buy_potion(run):
+                break
+        affordable = [i for i, price in enumerate(run.shop_prices) if price <= run.gold]
+        if affordable:
+            run_engine.shop_buy_card(run, max(affordable, key=lambda i: card_score(run.shop_cards[i])))
+
+    def choose_reward(self, run: RunState) -> Optional[int]:
+        cards = run_engine.roll_reward_cards(run)
+        return max(range(len(cards)), key=lambda i: card_score(cards[i]))
+
+
+BOTS = {cls.name: cls for cls in (Bot, GreedyBot)}
+
+# ===== 1ランの実行 =====
+
+@dataclass
+class RunResult:
+    """1ランの結果"""
+    seed: int
+    won: bool
+    floor_reached: int
+    deck: List[str]
+    map_difficulty: float = 0.0   # マップの経路の平均難易度（floor_tree.score_map）
+    card_plays: Counter = field(default_factory=Counter)
+    card_damage: Counter = field(default_factory=Counter)
+
+
+def play_battle(run: RunState, bot: Bot, result: RunResult):
+    """
+    1戦をボットで最後まで進める
+
+    カードの貢献は使ったときに減った敵HPと、そのカードが付与した毒・燃焼の
+    その後のダメージ（ターン終了時に減った敵HPを超えない範囲）の合計
+    """
+    battle = run.battle
+    dot_sources: Dict[str, str] = {}  # 継続ダメージのログの種類 → 最後に付与したカード
+    for _ in range(MAX_BATTLE_TURNS):
+        while run.phase == run_engine.PHASE_BATTLE:
+            index = bot.choose_card(run)
+            if index is None:
+                break
+            card = battle.hand[index]
+            enemy_hp_before = battle.enemy["hp"]
+            log_before = battle.battle_log.position
+            run_engine.play_card(run, index)
+            result.card_plays[card["name"]] += 1
+            result.card_damage[card["name"]] += enemy_hp_before - battle.enemy["hp"]
+            for event in battle.battle_log.since(log_before):
+                if event.kind in DOT_LOG_KINDS:
+                    dot_sources[DOT_LOG_KINDS[event.kind]] = card["name"]
+        if run.phase != run_engine.PHASE_BATTLE:
+            return
+        enemy_hp = battle.enemy["hp"]
+        log_before = battle.battle_log.position
+        run_engine.end_turn(run)
+        for event in battle.battle_log.since(log_before):
+            if event.kind in dot_sources:
+                damage = min(event.amount, enemy_hp)
+                enemy_hp -= damage
+                result.card_damage[dot_sources[event.kind]] += damage
+        if run.phase != run_engine.PHASE_BATTLE:
+            return
+    # ターン上限に達した場合は敗北扱い
+    run.phase = run_engine.PHASE_DEFEAT
+
+
+def play_run(seed: int, bot: Bot, save_data: Optional[Dict] = None,
+             extra_cards: Optional[List[str]] = None,
+             map_spec: Optional[floor_tree.MapSpec] = None) -> RunResult:
+    """
+    1ランを最後までボットでプレイする
+
+    Args:
+        seed: ランのシード（マップ生成とその後の乱数を決める）
+        bot: 行動を決めるボット
+        save_data: 永続データ（アップグレードレベル）
+        extra_cards: 初期デッキに追加するカード名
+        map_spec: マップ仕様（None なら従来の10階層）
+    """
+    run = run_engine.new_run(save_data, seed=seed, extra_cards=extra_cards, map_spec=map_spec)
+    bot.start_run(seed)
+    result = RunResult(seed=seed, won=False, floor_reached=0, deck=[],
+                       map_difficulty=floor_tree.score_map(run.nodes).mean_difficulty)
+
+    while True:
+        phase = run.phase
+        if phase == run_engine.PHASE_BATTLE:
+            play_battle(run, bot, result)
+        elif phase == run_engine.PHASE_VICTORY:
+            index = bot.choose_reward(run)
+            if index is None:
+                run_engine.reward_points(run)
+            else:
+                run_engine.reward_take_card(run, index)
+        elif phase == run_engine.PHASE_TREE_SELECTION:
+            choices = run_engine.get_choices(run)
+            node_id = bot.choose_path(run, choices)
+            run_engine.choose_node(run, [node.node_id for node in choices].index(node_id))
+        elif phase == run_engine.PHASE_REST:
+            action = bot.choose_rest(run)
+            if action == "sleep":
+                run_engine.rest_sleep(run)
+            elif action == "meditate":
+                run_engine.rest_meditate(run)
+            else:
+                run_engine.rest_alchemy(run)
+        elif phase == run_engine.PHASE_SHOP:
+            bot.shop(run)
+            run_engine.shop_leave(run)
+        else:
+            break
+
+    result.won = run.phase == run_engine.PHASE_CLEAR
+    result.floor_reached = run.current_node.floor_level if result.won else run.current_floor
+    result.deck = [card["name"] for card in run.all_cards]
+    return result
+
+# ===== 集計 =====
+
+@dataclass
+class SimulationStats:
+    """複数ランの集計結果"""
+    runs: int = 0
+    wins: int = 0
+    floor_counts: Counter = field(default_factory=Counter)
+    card_plays: Counter = field(default_factory=Counter)
+    card_damage: Counter = field(default_factory=Counter)
+    deck_runs: Counter = field(default_factory=Counter)   # そのカードを最終デッキに持っていたラン数
+    deck_wins: Counter = field(default_factory=Counter)   # そのうち勝利したラン数
+    map_runs: Counter = field(default_factory=Counter)    # マップ難易度の帯ごとのラン数
+    map_wins: Counter = field(default_factory=Counter)    # そのうち勝利したラン数
+
+    def add(self, result: RunResult):
+        """1ランの結果を加算"""
+        self.runs += 1
+        self.wins += result.won
+        self.floor_counts[result.floor_reached] += 1
+        self.card_plays.update(result.card_plays)
+        self.card_damage.update(result.card_damage)
+        for name in set(result.deck):
+            self.deck_runs[name] += 1
+            self.deck_wins[name] += result.won
+        band = int(result.map_difficulty // MAP_DIFFICULTY_BAND) * MAP_DIFFICULTY_BAND
+        self.map_runs[band] += 1
+        self.map_wins[band] += result.won
+
+    def merge(self, other: "SimulationStats"):
+        """別の集計結果を加算（整数の合計なので順序によらず同じ結果になる）"""
+        self.runs += other.runs
+        self.wins += other.wins
+        self.floor_counts.update(other.floor_counts)
+        self.card_plays.update(other.card_plays)
+        self.card_damage.update(other.card_damage)
+        self.deck_runs.update(other.deck_runs)
+        self.deck_wins.update(other.deck_wins)
+        self.map_runs.update(other.map_runs)
+        self.map_wins.update(other.map_wins)
+
+    def format_report(self) -> str:
+        """レポート文字列を作成"""
+        lines = []
+        win_rate = self.wins / self.runs if self.runs else 0
+        lines.append(f"ラン数: {self.runs}  勝利: {self.wins}  勝率: {win_rate:.1%}")
+        lines.append("")
+        lines.append("【到達階層の分布】")
+        for floor in sorted(self.floor_counts):
+            count = self.floor_counts[floor]
+            bar = "#" * int(40 * count / self.runs)
+            lines.append(f"  第{floor:>2}階層: {count:>7} ({count / self.runs:6.1%}) {bar}")
+        lines.append("")
+        lines.append("【マップ難易度別の勝率】（経路上の戦闘難易度の合計の平均）")
+        for band in sorted(self.map_runs):
+            runs = self.map_runs[band]
+            lines.append(f"  {band:>4}〜{band + MAP_DIFFICULTY_BAND - 1:<4}: {runs:>7} ラン  勝率 {self.map_wins[band] / runs:6.1%}")
+        lines.append("")
+        lines.append("【カード別の貢献】（ダメージは直接のダメージ＋付与した毒・燃焼のダメージ）")
+        lines.append(f"  {'カード':<10} {'使用回数':>9} {'総ダメージ':>10} {'平均ダメージ':>8} {'所持ラン勝率':>8}")
+        names = sorted(set(self.card_plays) | set(self.deck_runs), key=lambda n: (-self.card_damage[n], n))
+        for name in names:
+            plays = self.card_plays[name]
+            avg = self.card_damage[name] / plays if plays else 0
+            deck_rate = self.deck_wins[name] / self.deck_runs[name] if self.deck_runs[name] else 0
+            lines.append(f"  {name:<10} {plays:>9} {self.card_damage[name]:>10} {avg:>10.1f} {deck_rate:>12.1%}")
+        return "\n".join(lines)
+
+
+def simulate(seeds, bot_name: str = "greedy", save_data: Optional[Dict] = None,
+             extra_cards: Optional[List[str]] = None,
+             map_spec: Optional[floor_tree.MapSpec] = None) -> SimulationStats:
+    """シード列の各ランをプレイして集計"""
+    bot = BOTS[bot_name]()
+    stats = SimulationStats()
+    for seed in seeds:
+        stats.add(play_run(seed, bot, save_data, extra_cards, map_spec))
+    return stats
+
+# ===== コマンドライン =====
+
+def parse_upgrades(specs: List[str]) -> Dict[str, int]:
+    """"key=level" 形式のアップグレード指定を永続データ形式に変換"""
+    save_data = game_data.DEFAULT_UPGRADES.copy()
+    for spec in specs:
+        key, _, level = spec.partition("=")
+        if key not in game_data.UPGRADE_COSTS:
+            raise SystemExit(f"不明なアップグレード: {key}（{', '.join(game_data.UPGRADE_COSTS)}）")
+        save_data[key] = min(int(level or 0), game_data.UPGRADE_COSTS[key]["max_level"])
+    return save_data
+
+
+def parse_map_spec(depth: Optional[int], dag: bool) -> Optional[floor_tree.MapSpec]:
+    """コマンドラインの --depth / --dag からマップ仕様を作る（どちらもなければ None）"""
+    if depth is None and not dag:
+        return None
+    return floor_tree.MapSpec(depth=depth or floor_tree.DEFAULT_MAP_SPEC.depth, dag=dag)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="デッキ構築RPGのバランスシミュレーター")
+    parser.add_argument("--runs", type=int, default=1000, help="プレイするラン数")
+    parser.add_argument("--seed", type=int, default=0, help="最初のシード（seed, seed+1, ... を使う）")
+    parser.add_argument("--bot", choices=sorted(BOTS), default="greedy", help="使用するボット")
+    parser.add_argument("--upgrade", action="append", default=[], metavar="KEY=LEVEL",
+                        help="永続アップグレードのレベル（複数指定可）")
+    parser.add_argument("--depth", type=int, default=None, help="マップの階層数（既定: 10）")
+    parser.add_argument("--dag", action="store_true", help="隣り合うパスが合流するマップ（深いマップ向け）")
+    args = parser.parse_args(argv)
+
+    save_data = parse_upgrades(args.upgrade)
+    map_spec = parse_map_spec(args.depth, args.dag)
+    started = time.perf_counter()
+    stats = simulate(range(args.seed, args.seed + args.runs), args.bot, save_data, map_spec=map_spec)
+    elapsed = time.perf_counter() - started
+
+    print(stats.format_report())
+    print("")
+    print(f"所要時間: {elapsed:.2f}秒 ({args.runs / max(elapsed, 1e-9):.0f} ラン/秒)")
+
+
+if __name__ == "__main__":
+    main()
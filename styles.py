@@ -1,6 +1,15 @@
 """
 ビジュアル重視のゲームUI CSS
+
+静的なCSSは register_stylesheet で登録し、inject_stylesheets でブラウザセッションに1回だけ入れる。
+再描画ごとに送るのは emit_dynamic_css の状態に応じた小さな規則だけ
 """
+import hashlib
+import json
+from typing import Dict
+
+import streamlit as st
+import streamlit.components.v1 as components
 
 COMPACT_CSS = """
 <style>
@@ -254,4 +263,78 @@ p, span, li { color: rgba(255,255,255,0.9) !important; }
     50% { box-shadow: 0 0 15px rgba(255,200,80,0.6); }
 }
 </style>
-"""
\ No newline at end of file
+"""
+
+# ===== スタイルシートの管理 =====
+# st.markdown の <style> は再描画のたびに送り直さないと消えるので、
+# 静的なCSSは小さなスクリプトでページの <head> に <style data-sheet=名前> として入れる
+# （st.html がスクリプトを実行できない古い Streamlit では高さ0の components.html から親ページへ）。
+# <head> の要素は再描画をまたいで残るため、送るのはセッションで最初の1回（と内容が変わった時）だけ
+
+_STYLESHEETS: Dict[str, str] = {}  # 名前 → CSS（<style> タグなし。登録順に <head> へ追加）
+_INJECTED_KEY = "_injected_stylesheets"  # session_state: 名前 → 入れたCSSのハッシュ
+
+_LOADER_SCRIPT = """
+<script>
+(function () {
+    const doc = (window.frameElement ? window.parent : window).document;
+    const sheets = %s;
+    for (const [name, css] of Object.entries(sheets)) {
+        let el = doc.head.querySelector('style[data-sheet="' + name + '"]');
+        if (!el) {
+            el = doc.createElement("style");
+            el.dataset.sheet = name;
+            doc.head.appendChild(el);
+        }
+        if (el.textContent !== css) {
+            el.textContent = css;
+        }
+    }
+})();
+</script>
+"""
+
+
+def _strip_style_tag(css: str) -> str:
+    """<style>...</style> で囲まれていれば中身だけにする"""
+    css = css.strip()
+    if css.startswith("<style>") and css.endswith("</style>"):
+        css = css[len("<style>"):-len("</style>")]
+    return css.strip()
+
+
+def _digest(css: str) -> str:
+    return hashlib.sha1(css.encode("utf-8")).hexdigest()
+
+
+def register_stylesheet(name: str, css: str):
+    """静的なCSSを登録する（同じ名前なら置き換え）"""
+    _STYLESHEETS[name] = _strip_style_tag(css)
+
+
+def inject_stylesheets():
+    """
+    登録済みのCSSのうち、このセッションでまだ入れていないものをページの <head> に入れる
+
+    毎回の描画の先頭で呼ぶ。2回目以降の再描画では何も送らない
+    """
+    injected = st.session_state.setdefault(_INJECTED_KEY, {})
+    pending = {name: css for name, css in _STYLESHEETS.items()
+               if injected.get(name) != _digest(css)}
+    if not pending:
+        return
+    # </script> で閉じられないよう "</" をエスケープして埋め込む
+    payload = json.dumps(pending, ensure_ascii=False).replace("</", "<\\/")
+    script = _LOADER_SCRIPT % payload
+    try:
+        st.html(script, unsafe_allow_javascript=True)
+    except TypeError:
+        components.html(script, height=0)
+    for name, css in pending.items():
+        injected[name] = _digest(css)
+
+
+def emit_dynamic_css(css: str):
+    """状態に応じて変わるCSS（その回の描画だけに効く）を出す。空なら何もしない"""
+    if css:
+        st.markdown(css, unsafe_allow_html=True)
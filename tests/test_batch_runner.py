@@ -0,0 +1,21 @@
+"""batch_runner の集計結果がワーカー数やチャンク分割によらないことの確認"""
+
+import pytest
+
+import batch_runner
+import floor_tree
+import simulator
+
+SEEDS = range(100, 140)
+
+
+@pytest.mark.parametrize("map_spec", [None, floor_tree.MapSpec(depth=15, dag=True)])
+def test_stats_independent_of_workers(map_spec):
+    serial = batch_runner.run_batch(SEEDS, workers=1, chunk_size=10, map_spec=map_spec)
+    parallel = batch_runner.run_batch(SEEDS, workers=3, chunk_size=10, map_spec=map_spec)
+    assert serial.runs == len(SEEDS)
+    assert parallel == serial
+
+
+def test_stats_match_single_simulation():
+    assert batch_runner.run_batch(SEEDS, workers=2, chunk_size=7) == simulator.simulate(SEEDS)
@@ -0,0 +1,49 @@
+"""
+battle_kernel と battle_engine のルールが一致しているかの確認
+
+同じ方針（使えるカードのうちドロー順で最初のものを使う）で同じ条件の戦闘を
+両方で大量に行い、勝率がほぼ同じになることを確かめる
+"""
+
+import pytest
+
+import battle_engine
+import battle_kernel
+
+BATTLES = 2000
+PLAYER_HP = 40       # 初期デッキでも勝率が0%と100%の間に来るよう低めにする
+TOLERANCE = 0.05     # 2000戦ずつなら標準誤差の3倍程度
+
+
+def engine_win_rate(difficulty: int, battles: int, seed: int) -> float:
+    """battle_engine で kernel と同じ方針の戦闘を battles 回行った勝率"""
+    wins = 0
+    for i in range(battles):
+        state = battle_engine.BattleState(player_hp=PLAYER_HP, player_max_hp=PLAYER_HP, max_energy=5)
+        state.deck_rng.seed(f"{seed}:{i}:deck")
+        state.enemy_rng.seed(f"{seed}:{i}:enemy")
+        battle_engine.setup_battle(state, battle_engine.create_enemy_data("", difficulty),
+                                   battle_engine.create_starter_deck(), 1)
+        for _ in range(200):
+            while not state.enemy_defeated:
+                usable = [j for j, card in enumerate(state.hand) if card.get("cost", 0) <= state.energy]
+                if not usable:
+                    break
+                battle_engine.play_card(state, usable[0])
+            if state.enemy_defeated:
+                break
+            battle_engine.end_turn(state)
+            # run_engine.check_battle_end と同じく敵の撃破を先に判定
+            if state.enemy_defeated or state.player_defeated:
+                break
+        wins += state.enemy_defeated
+    return wins / battles
+
+
+@pytest.mark.parametrize("difficulty", [10, 12, 14])
+def test_win_rate_matches_engine(difficulty):
+    curve = battle_kernel.difficulty_curve([difficulty], BATTLES, seed=0,
+                                           player_hp=PLAYER_HP, player_max_hp=PLAYER_HP)
+    kernel_rate = curve[difficulty]["win_rate"]
+    engine_rate = engine_win_rate(difficulty, BATTLES, seed=0)
+    assert kernel_rate == pytest.approx(engine_rate, abs=TOLERANCE)
@@ -0,0 +1,75 @@
+"""
+floor_tree の生成結果の確認
+
+同じ seed からは、以前の再帰版ジェネレーター（下の reference_tree に写したもの）と
+同じツリーが生成されること（既存のセーブや記録したリプレイのマップが変わらないこと）を確かめる
+"""
+
+import random
+
+import pytest
+
+import floor_tree
+
+
+def reference_tree(seed: int) -> list:
+    """
+    以前の再帰版 generate_floor_tree と同じ手順で生成したツリー
+    [(階層, タイプ, 難易度, 敵名, 親, 左の子, 右の子), ...]（生成順 = ノード番号順）
+    """
+    rng = random.Random(seed)
+    nodes = []
+
+    def create_node(floor_level, parent):
+        if floor_level in (1, 10):
+            node_type = "battle"
+        else:
+            rand = rng.random()
+            node_type = "battle" if rand < 0.6 else "rest" if rand < 0.8 else "shop"
+        if floor_level == 1:
+            difficulty = 1
+        else:
+            difficulty = max(1, min(floor_level + rng.randint(-1, 2), 10))
+        enemy_name = floor_tree.get_enemy_for_difficulty(difficulty) if node_type == "battle" else None
+        nodes.append([floor_level, node_type, difficulty, enemy_name, parent, None, None])
+        return len(nodes) - 1
+
+    def generate_path(index):
+        floor_level = nodes[index][0]
+        if floor_level >= 10:
+            return
+        next_floor = floor_level + 1
+        branch_chance = 0.8 if next_floor <= 3 else 0.6 if next_floor <= 6 else 0.4
+        if rng.random() < branch_chance:
+            left = create_node(next_floor, index)
+            right = create_node(next_floor, index)
+            nodes[index][5:7] = [left, right]
+            generate_path(left)
+            generate_path(right)
+        else:
+            only = create_node(next_floor, index)
+            nodes[index][5:7] = [only, only]
+            generate_path(only)
+
+    generate_path(create_node(1, None))
+    return [tuple(node) for node in nodes]
+
+
+def as_tuples(tree: floor_tree.FloorTree) -> list:
+    return [
+        (node.floor_level, node.node_type, node.difficulty, node.enemy_name,
+         node.parent_id, node.left_child_id, node.right_child_id)
+        for node in (tree[node_id] for node_id in sorted(tree))
+    ]
+
+
+@pytest.mark.parametrize("seed", range(0, 300, 7))
+def test_same_tree_as_reference_generator(seed):
+    tree, root_id = floor_tree.generate_floor_tree(seed)
+    assert root_id == 0
+    assert as_tuples(tree) == reference_tree(seed)
+
+
+def test_bytes_round_trip():
+    tree, _ = floor_tree.generate_floor_tree(42)
+    assert as_tuples(floor_tree.deserialize_tree(floor_tree.serialize_tree(tree))) == as_tuples(tree)
@@ -0,0 +1,42 @@
+"""ランの乱数ストリームが互いに、またグローバルな random から独立していることの確認"""
+
+import random
+
+import floor_tree
+import run_engine
+import simulator
+
+
+def test_map_generation_does_not_touch_global_random():
+    random.seed(123)
+    expected = random.random()
+    random.seed(123)
+    floor_tree.generate_floor_tree(5)
+    assert random.random() == expected
+
+
+def test_run_does_not_depend_on_global_random():
+    results = []
+    for global_seed in (1, 2):
+        random.seed(global_seed)
+        results.append(simulator.play_run(7, simulator.GreedyBot()))
+    assert results[0] == results[1]
+
+
+def test_streams_are_separate_per_subsystem():
+    rngs = run_engine.split_rng(7)
+    assert set(rngs) == set(run_engine.RNG_STREAMS)
+    draws = {name: rng.random() for name, rng in rngs.items()}
+    assert len(set(draws.values())) == len(draws)
+    # 同じシードからは同じストリーム
+    assert {name: rng.random() for name, rng in run_engine.split_rng(7).items()} == draws
+
+
+def test_enemy_stream_does_not_shift_deck_shuffles():
+    run = run_engine.new_run(seed=11)
+    order = [card["name"] for card in run.battle.deck]
+    other = run_engine.new_run(seed=11)
+    for _ in range(5):
+        other.battle.enemy_rng.random()  # 敵AIの乱数だけ余分に進めても
+    assert [card["name"] for card in other.battle.deck] == order
+    assert other.battle.deck_rng.random() == run.battle.deck_rng.random()
@@ -0,0 +1,77 @@
+"""replay_log の記録と再生の確認（ボットのランを記録し、ログから同じ状態を再現できること）"""
+
+import json
+
+import pytest
+
+import floor_tree
+import game_data
+import replay_log
+import run_engine
+import simulator
+
+
+def record_bot_run(tmp_path, monkeypatch, seed, save_data=None, map_spec=None):
+    """simulator.play_run のランを start_recording で記録して (ラン, ログのパス) を返す"""
+    recorded = {}
+    new_run = run_engine.new_run
+
+    def recording_new_run(*args, **kwargs):
+        run = new_run(*args, **kwargs)
+        recorded["run"] = run
+        recorded["path"] = replay_log.start_recording(run, save_data, directory=str(tmp_path))
+        return run
+
+    monkeypatch.setattr(run_engine, "new_run", recording_new_run)
+    simulator.play_run(seed, simulator.GreedyBot(), save_data, map_spec=map_spec)
+    monkeypatch.undo()
+    return recorded["run"], recorded["path"]
+
+
+def snapshot(run):
+    battle = run.battle
+    return {
+        "phase": run.phase,
+        "node": run.current_node_id,
+        "gold": run.gold,
+        "hp": (battle.player_hp, battle.player_max_hp),
+        "deck": [(card["name"], dict(card)) for card in run.all_cards],
+        "actions": list(run.actions),
+    }
+
+
+@pytest.mark.parametrize("seed, map_spec", [
+    (3, None),
+    (8, None),
+    (21, floor_tree.MapSpec(depth=14, dag=True)),
+])
+def test_replay_reproduces_bot_run(tmp_path, monkeypatch, seed, map_spec):
+    save_data = dict(game_data.DEFAULT_UPGRADES, max_hp_bonus=1, card_draw_bonus=1)
+    run, path = record_bot_run(tmp_path, monkeypatch, seed, save_data, map_spec)
+    assert run.phase in (run_engine.PHASE_CLEAR, run_engine.PHASE_DEFEAT)
+    assert len(run.actions) > 20
+
+    replayed = replay_log.replay_file(path)
+    assert snapshot(replayed) == snapshot(run)
+
+
+def test_replay_can_stop_partway(tmp_path, monkeypatch):
+    run, path = record_bot_run(tmp_path, monkeypatch, 5)
+    header, actions = replay_log.load_log(path)
+    assert actions == run.actions
+    partial = replay_log.replay(header, actions, stop=10)
+    assert partial.actions == actions[:10]
+
+
+def test_unknown_token_is_rejected():
+    run = run_engine.new_run(seed=1)
+    with pytest.raises(ValueError):
+        replay_log.apply_action(run, "?1")
+
+
+def test_load_log_rejects_other_versions(tmp_path):
+    path = tmp_path / "old.rlog"
+    header = {"version": replay_log.REPLAY_FORMAT_VERSION + 1, "seed": 1, "upgrades": {}}
+    path.write_text(json.dumps(header) + "\ne \n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        replay_log.load_log(str(path))
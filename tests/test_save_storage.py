@@ -0,0 +1,256 @@
+"""save_storage の各バックエンドと書き込みの遅延（write-behind）の確認"""
+
+import functools
+import json
+import os
+import threading
+
+import pytest
+
+import game_data
+from save_storage import DEFAULT_PLAYER_ID, JsonFileStorage, SaveStorage, SqliteStorage, WriteBehindStorage
+
+DEFAULTS = game_data.DEFAULT_UPGRADES
+
+
+def add_points(profile, points):
+    profile["upgrade_points"] += points
+
+
+def increment_many(storage: SaveStorage, count: int):
+    for _ in range(count):
+        storage.update(functools.partial(add_points, points=1))
+
+
+class RecordingStorage(SaveStorage):
+    """呼び出しを数えるメモリ上のバックエンド（fail_updates 回だけ update を失敗させる）"""
+
+    def __init__(self, defaults):
+        super().__init__(defaults)
+        self.profiles = {}
+        self.loads = 0
+        self.updates = 0
+        self.fail_updates = 0
+        self.closed = False
+
+    def load(self, player_id=DEFAULT_PLAYER_ID):
+        self.loads += 1
+        return self._fill_defaults(json.loads(json.dumps(self.profiles.get(player_id, {}))))
+
+    def update(self, mutate, player_id=DEFAULT_PLAYER_ID):
+        self.updates += 1
+        if self.fail_updates:
+            self.fail_updates -= 1
+            raise OSError("disk full")
+        data = self.load(player_id)
+        result = mutate(data)
+        self.profiles[player_id] = json.loads(json.dumps(data))  # 保存した内容は呼び出し側と共有しない
+        return data, result
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def recording():
+    return RecordingStorage(DEFAULTS)
+
+
+@pytest.fixture
+def write_behind(recording):
+    # バックグラウンドのフラッシュが走らないよう間隔を長くし、テストから flush() を呼ぶ
+    storage = WriteBehindStorage(recording, interval=3600)
+    yield storage
+    storage.close()
+
+# ===== JSONファイル =====
+
+def test_json_round_trip_and_defaults(tmp_path):
+    path = tmp_path / "save.json"
+    path.write_text(json.dumps({"upgrade_points": 7}), encoding="utf-8")
+    storage = JsonFileStorage(DEFAULTS, str(path))
+    data = storage.load()
+    assert data["upgrade_points"] == 7
+    assert data["max_hp_bonus"] == 0
+
+    data["max_hp_bonus"] = 2
+    storage.save(data)
+    assert json.loads(path.read_text(encoding="utf-8"))["max_hp_bonus"] == 2
+
+
+def test_json_failed_write_keeps_previous_file(tmp_path):
+    path = tmp_path / "save.json"
+    storage = JsonFileStorage(DEFAULTS, str(path))
+    storage.save(dict(DEFAULTS, upgrade_points=5))
+
+    with pytest.raises(TypeError):
+        storage.save(dict(DEFAULTS, upgrade_points=object()))  # JSONにできない値
+
+    assert storage.load()["upgrade_points"] == 5
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+
+def test_json_players_get_separate_files(tmp_path):
+    storage = JsonFileStorage(DEFAULTS, str(tmp_path / "save.json"))
+    assert storage.path_for(DEFAULT_PLAYER_ID) == str(tmp_path / "save.json")
+    assert storage.path_for("../evil") == str(tmp_path / "save.___evil.json")
+
+    storage.update(functools.partial(add_points, points=3), "alice")
+    assert storage.load("alice")["upgrade_points"] == 3
+    assert storage.load()["upgrade_points"] == 0
+
+
+def test_json_concurrent_updates_from_separate_instances(tmp_path):
+    # インスタンスごとにプロセス内ロックが別なので、排他はファイルロック（flock）頼り
+    path = str(tmp_path / "save.json")
+    storages = [JsonFileStorage(DEFAULTS, path) for _ in range(2)]
+    threads = [threading.Thread(target=increment_many, args=(storages[i % 2], 25)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert storages[0].load()["upgrade_points"] == 150
+
+# ===== SQLite =====
+
+def test_sqlite_round_trip_and_defaults(tmp_path):
+    storage = SqliteStorage(DEFAULTS, str(tmp_path / "save.db"))
+    try:
+        assert storage.load() == DEFAULTS
+        storage.save({"upgrade_points": 4}, "bob")
+        data = storage.load("bob")
+        assert data["upgrade_points"] == 4
+        assert data["total_games"] == 0
+        data, result = storage.update(lambda profile: profile.setdefault("upgrade_points"), "bob")
+        assert result == 4
+    finally:
+        storage.close()
+
+
+def test_sqlite_failed_mutation_rolls_back(tmp_path):
+    storage = SqliteStorage(DEFAULTS, str(tmp_path / "save.db"))
+    try:
+        storage.save(dict(DEFAULTS, upgrade_points=2))
+
+        def broken(profile):
+            profile["upgrade_points"] = 100
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            storage.update(broken)
+        assert storage.load()["upgrade_points"] == 2
+    finally:
+        storage.close()
+
+
+def test_sqlite_concurrent_updates_from_separate_instances(tmp_path):
+    # BEGIN IMMEDIATE で読み込み〜保存が1トランザクションになっていれば取りこぼさない
+    path = str(tmp_path / "save.db")
+    storages = [SqliteStorage(DEFAULTS, path) for _ in range(2)]
+    threads = [threading.Thread(target=increment_many, args=(storages[i % 2], 25)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert storages[0].load()["upgrade_points"] == 150
+    for storage in storages:
+        storage.close()
+
+# ===== 書き込みの遅延 =====
+
+def test_write_behind_coalesces_updates_into_one_write(write_behind, recording):
+    for _ in range(5):
+        write_behind.update(functools.partial(add_points, points=2))
+    assert recording.updates == 0
+    assert write_behind.load()["upgrade_points"] == 10
+
+    write_behind.flush()
+    assert recording.updates == 1
+    assert recording.profiles[DEFAULT_PLAYER_ID]["upgrade_points"] == 10
+
+
+def test_write_behind_reads_backend_only_once_per_player(write_behind, recording):
+    write_behind.load()
+    write_behind.update(functools.partial(add_points, points=1))
+    write_behind.load()
+    assert recording.loads == 1
+
+
+def test_write_behind_flush_picks_up_other_writers(write_behind, recording):
+    write_behind.load()
+    recording.profiles[DEFAULT_PLAYER_ID] = dict(DEFAULTS, upgrade_points=9)  # 別プロセスの書き込み
+    write_behind.flush()
+    assert write_behind.load()["upgrade_points"] == 9
+
+
+def test_write_behind_retries_after_failed_flush(write_behind, recording):
+    write_behind.update(functools.partial(add_points, points=3))
+    recording.fail_updates = 1
+    write_behind.flush()
+    assert DEFAULT_PLAYER_ID not in recording.profiles
+    assert write_behind.load()["upgrade_points"] == 3
+
+    write_behind.update(functools.partial(add_points, points=1))
+    write_behind.flush()
+    assert recording.profiles[DEFAULT_PLAYER_ID]["upgrade_points"] == 4
+
+
+def test_write_behind_close_flushes_pending(recording):
+    storage = WriteBehindStorage(recording, interval=3600)
+    storage.update(functools.partial(add_points, points=6))
+    storage.close()
+    assert recording.profiles[DEFAULT_PLAYER_ID]["upgrade_points"] == 6
+    assert recording.closed
+
+
+def test_failed_purchase_is_not_replayed(write_behind, recording):
+    # 購入画面と同じく、ループ変数を束縛した変更関数で1つ目の購入に失敗し、ループが先に進む
+    write_behind.update(functools.partial(add_points, points=3))
+    results = {}
+    for key in ("max_hp_bonus", "card_draw_bonus"):
+        if key == "max_hp_bonus":
+            _, (success, _, _) = write_behind.update(
+                functools.partial(game_data.purchase_upgrade, upgrade_key=key))
+            results[key] = success
+    assert results == {"max_hp_bonus": False}
+
+    # フラッシュ前に別プロセスがポイントを足しても、失敗した購入も別の購入も書き込まれない
+    recording.profiles[DEFAULT_PLAYER_ID] = dict(DEFAULTS, upgrade_points=20)
+    write_behind.flush()
+    saved = recording.profiles[DEFAULT_PLAYER_ID]
+    assert saved["max_hp_bonus"] == 0
+    assert saved["card_draw_bonus"] == 0
+    assert saved["upgrade_points"] == 23
+
+
+def test_updates_during_flush_are_layered_on_saved_result(recording):
+    started = threading.Event()
+    release = threading.Event()
+    backend_update = recording.update
+
+    def slow_update(mutate, player_id=DEFAULT_PLAYER_ID):
+        started.set()
+        release.wait(5)
+        return backend_update(mutate, player_id)
+
+    recording.update = slow_update
+    storage = WriteBehindStorage(recording, interval=3600)
+    try:
+        storage.update(functools.partial(add_points, points=1))
+        flusher = threading.Thread(target=storage.flush)
+        flusher.start()
+        assert started.wait(5)
+
+        # 書き込み中に届いた変更（バックエンドは読まずにメモリ上に適用される）
+        storage.update(functools.partial(add_points, points=10))
+        recording.profiles[DEFAULT_PLAYER_ID] = dict(DEFAULTS, upgrade_points=100)  # 別プロセスの書き込み
+        release.set()
+        flusher.join(5)
+
+        assert recording.profiles[DEFAULT_PLAYER_ID]["upgrade_points"] == 101
+        assert storage.load()["upgrade_points"] == 111
+        storage.flush()
+        assert recording.profiles[DEFAULT_PLAYER_ID]["upgrade_points"] == 111
+    finally:
+        release.set()
+        storage.close()